@@ -108,31 +108,82 @@
   }
 
   // ==== 1. EEG/Serial/Fan Command Handler ====
+  // Two encodings share the port (see common/actuators.py):
+  //   text    "FAN:140\n", "ServoAngle:DOOR:90\n"
+  //   framed  A5 | type | value | seq | type^value^seq   (type bit 7 = send ack 5A | seq | seq^FF)
+  #define FRAME_START 0xA5
+  #define ACK_START 0x5A
+  #define ACK_FLAG 0x80
+  #define CMD_FAN 0x01
+  #define CMD_DOOR 0x02
+  #define CMD_WINDOW 0x03
+  #define MAX_LINE 64 // Longer than any text command
+
+  void applyCommand(byte type, int value) {
+    if (type == CMD_DOOR) {
+      openDoorByAngle(value);
+    } else if (type == CMD_WINDOW) {
+      openWindowByAngle(value);
+    } else if (type == CMD_FAN) {
+      lastPwm = constrain(value, 0, 255);
+      showOnLCD("Fan PWM:", String(lastPwm).c_str());
+      lastLCDUpdate = millis();
+    }
+  }
+
+  bool handleFrame(const byte* frame) {
+    if ((frame[1] ^ frame[2] ^ frame[3]) != frame[4]) return false; // Corrupt: drop, the host retries
+    byte type = frame[1] & ~ACK_FLAG;
+    if (type != CMD_FAN && type != CMD_DOOR && type != CMD_WINDOW) return false; // As decode_frame
+    if (frame[1] & ACK_FLAG) {
+      // Ack before acting: servo moves block for a couple of seconds
+      byte ack[3] = {ACK_START, frame[3], (byte)(frame[3] ^ 0xFF)};
+      Serial.write(ack, 3);
+    }
+    applyCommand(type, frame[2]);
+    return true;
+  }
+
   void handleEEG() {
     static String eegBuffer = "";
+    static byte frame[5];
+    static int framePos = -1; // -1 = not inside a frame
     while (Serial.available()) {
-      char c = Serial.read();
-      if (c == '\n' || c == '\r') {
+      byte c = Serial.read();
+      if (framePos >= 0) {
+        frame[framePos++] = c;
+        if (framePos == 5) {
+          framePos = -1;
+          if (!handleFrame(frame)) {
+            // Misaligned after a short frame: resync on an 0xA5 inside it
+            for (int i = 1; i < 5; i++) {
+              if (frame[i] == FRAME_START) {
+                memmove(frame, frame + i, 5 - i);
+                framePos = 5 - i;
+                break;
+              }
+            }
+          }
+        }
+      } else if (c == FRAME_START) {
+        // 0xA5 never occurs in a text command: drop stray bytes left by a short frame
+        eegBuffer = "";
+        frame[0] = c;
+        framePos = 1;
+      } else if (c == '\n' || c == '\r') {
         eegBuffer.trim();
         if (eegBuffer.startsWith("ServoAngle:DOOR:")) {
-          int angle = eegBuffer.substring(16).toInt();
-          openDoorByAngle(angle);
+          applyCommand(CMD_DOOR, eegBuffer.substring(16).toInt());
         } else if (eegBuffer.startsWith("ServoAngle:WINDOW:")) {
-          int angle = eegBuffer.substring(18).toInt();
-          openWindowByAngle(angle);
+          applyCommand(CMD_WINDOW, eegBuffer.substring(18).toInt());
         } else if (eegBuffer.startsWith("FAN:")) {
-          int idx = eegBuffer.indexOf(':');
-          if (idx >= 0) {
-            int pwmValue = eegBuffer.substring(idx + 1).toInt();
-            pwmValue = constrain(pwmValue, 0, 255);
-            lastPwm = pwmValue;
-            showOnLCD("Fan PWM:", String(lastPwm).c_str());
-            lastLCDUpdate = millis();
-          }
+          applyCommand(CMD_FAN, eegBuffer.substring(4).toInt());
         }
         eegBuffer = "";
+      } else if (eegBuffer.length() >= MAX_LINE) {
+        eegBuffer = ""; // Garbage, not a command
       } else {
-        eegBuffer += c;
+        eegBuffer += (char)c;
       }
     }
   }
@@ -1,7 +1,12 @@
 # +
+import os
+import sys
 import numpy as np
-import skfuzzy as fuzz
-from skfuzzy import control as ctrl
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from fuzzy_tables import LookupTable, grid_axis, evaluate_grid, source_key, load_tables, save_tables
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
 
 class BlinkConfidenceSystem:
     """
@@ -9,12 +14,26 @@ class BlinkConfidenceSystem:
     - conf = 0.7 at strength 70,
     - conf = 1.0 at strength 170+,
     - linearly between.
+
+    With compiled=True the simulation is sampled once every `resolution` strength units
+    into a cached lookup table. The default 1/12 puts a node on every mean of 1-3 integer
+    strengths, so smoothed strengths reproduce skfuzzy (and its fallback) to float precision;
+    the table is rejected in favour of skfuzzy if cell midpoints miss `error_bound` too often.
     """
 
-    def __init__(self):
-        self.sim = self._build_system()
+    def __init__(self, compiled=False, resolution=1 / 12, error_bound=0.01, cache_dir=CACHE_DIR):
+        self.resolution = resolution
+        self.error_bound = error_bound
+        self.cache_path = os.path.join(cache_dir, 'fuzzy_blink_table.npz')
+        self.sim = None
+        self.table = self._load_compiled() if compiled else None
+        if self.table is None:
+            self.sim = self._build_system()
 
     def _build_system(self):
+        import skfuzzy as fuzz
+        from skfuzzy import control as ctrl
+
         strength = ctrl.Antecedent(np.arange(0, 256, 1), 'blink_strength')
         confidence = ctrl.Consequent(np.arange(0, 1.01, 0.01), 'confidence')
 
@@ -34,21 +53,55 @@ class BlinkConfidenceSystem:
         ]
         return ctrl.ControlSystemSimulation(ctrl.ControlSystem(rules))
 
-    def calculate_confidence(self, blink_strength):
-        """
-        Fuzzy confidence: 0.7 at strength 70, linearly to 1.0 at 170, clipped to [0,1].
-        Returns nearest 2 decimal.
-        """
+    def _simulate(self, blink_strength):
         try:
             self.sim.reset()
             self.sim.input['blink_strength'] = blink_strength
             self.sim.compute()
-            return round(float(self.sim.output['confidence']), 2)
+            return float(self.sim.output['confidence'])
         except Exception:
             # Fallback: linear, 0.7 at 70 to 1.0 at 170+
             val = 0.7 + 0.3 * ((blink_strength - 70) / 100)
-            return round(min(1.0, max(0.0, val)), 2)
+            return min(1.0, max(0.0, val))
 
-# -
+    def _load_compiled(self):
+        key = source_key(__file__, resolution=self.resolution)
+        tables = load_tables(self.cache_path, key)
+        if tables is None:
+            tables = self._compile()
+            save_tables(self.cache_path, key, **tables)
+        if tables['p99_error'] > self.error_bound:
+            print(f"[Fuzzy] Compiled table misses the error bound "
+                  f"(p99 {float(tables['p99_error']):.4f} > {self.error_bound}), using skfuzzy")
+            return None
+        return LookupTable([tables['strength_axis']], tables['confidence'])
+
+    def _compile(self):
+        self.sim = self._build_system()
+        axis = grid_axis(0, 255, self.resolution)
+        confidence = evaluate_grid(self._simulate, axis)
+        # Worst case for interpolation is halfway between nodes
+        mids = (axis[:-1] + axis[1:]) / 2
+        errors = np.abs(np.interp(mids, axis, confidence) - evaluate_grid(self._simulate, mids))
+        return {
+            'strength_axis': axis, 'confidence': confidence,
+            'max_error': errors.max(), 'p99_error': np.percentile(errors, 99),
+        }
+
+    def calculate_confidence(self, blink_strength):
+        """
+        Fuzzy confidence: 0.7 at strength 70, linearly to 1.0 at 170, clipped to [0,1].
+        Returns nearest 2 decimal.
+        """
+        if self.table is not None:
+            return round(float(self.table(blink_strength)), 2)
+        return round(self._simulate(blink_strength), 2)
 
+    def calculate_confidence_batch(self, strengths):
+        """Vectorized calculate_confidence over an array of blink strengths"""
+        strengths = np.asarray(strengths, dtype=float)
+        if self.table is None:
+            return np.array([self.calculate_confidence(s) for s in strengths.ravel()]).reshape(strengths.shape)
+        return np.round(self.table(strengths), 2)
 
+# -
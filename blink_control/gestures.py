@@ -0,0 +1,102 @@
+import time
+
+from actuators import ACTUATORS
+
+# +
+# Blink-count gestures, then the one that stands on its own
+COUNT_GESTURES = ('single', 'double', 'triple')
+GESTURES = COUNT_GESTURES + ('long',)
+DEFAULT_ACTIONS = {'single': ('DOOR', 90), 'double': ('WINDOW', 90)}
+
+
+def parse_action(spec):
+    """'triple=WINDOW:0' -> ('triple', ('WINDOW', 0)); 'single=none' unmaps a gesture."""
+    gesture, _, action = spec.partition('=')
+    if gesture not in GESTURES:
+        raise ValueError(f"Unknown gesture '{gesture}', expected one of {GESTURES}")
+    if action.lower() == 'none':
+        return gesture, None
+    actuator, _, value = action.partition(':')
+    if actuator not in ACTUATORS or not value.isdigit():
+        raise ValueError(f"Gesture action must look like {gesture}=DOOR:90 (actuators: {', '.join(ACTUATORS)})")
+    return gesture, (actuator, int(value))
+
+
+def gesture_actions(specs):
+    """DEFAULT_ACTIONS with the --gesture specs applied."""
+    actions = dict(DEFAULT_ACTIONS)
+    actions.update(parse_action(spec) for spec in specs)
+    return actions
+
+
+class GestureEngine:
+    """
+    Turns blinks into gestures on deadlines instead of on packet arrival.
+
+    Blinks less than `interval` seconds apart form one sequence. The sequence resolves as
+    single / double / triple once `interval` has passed since its last blink, or straight
+    away when no longer gesture has an action (so with the default actions a double fires
+    on its second blink). A blink at least `long_strength` strong is a 'long' gesture:
+    ThinkGear reports one strength per blink and no duration, and a held, squeezed blink
+    is what drives it to the top of the 0-255 scale. It ends any pending sequence and
+    fires at once.
+
+    The caller blocks for at most timeout() seconds and calls poll() afterwards, so a
+    decision fires at its deadline whether or not packets arrive. How late poll() ran is
+    recorded as stage 'gesture_lag' on `instr`. Blink records need 'raw_strength'.
+    fire(gesture, blinks, action) is called with the blink records of the gesture and its
+    (actuator, value), or None if unmapped.
+    """
+
+    def __init__(self, fire, actions=None, interval=1.0, long_strength=None, clock=time.monotonic, instr=None):
+        self.fire = fire
+        self.actions = dict(DEFAULT_ACTIONS if actions is None else actions)
+        self.interval = interval
+        self.long_strength = long_strength
+        self.clock = clock
+        self.instr = instr
+        self.pending = []
+        self.deadline = None
+        # Beyond the longest mapped count gesture there is nothing left to wait for
+        mapped = [i + 1 for i, g in enumerate(COUNT_GESTURES) if self.actions.get(g)]
+        self.max_count = max(mapped, default=1)
+
+    def blink(self, record, now=None):
+        # `now`: when the blink happened, if it is decided later than that
+        now = self.clock() if now is None else now
+        self.poll(now)
+        if self.long_strength is not None and record['raw_strength'] >= self.long_strength:
+            if self.pending:
+                self._resolve()
+            self._fire('long', [record])
+            return
+        self.pending.append(record)
+        self.deadline = now + self.interval
+        if len(self.pending) >= self.max_count:
+            self._resolve()
+
+    def timeout(self):
+        """Seconds until the next deadline (None = nothing pending)."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - self.clock())
+
+    def poll(self, now=None):
+        if self.deadline is None:
+            return
+        now = self.clock() if now is None else now
+        if now >= self.deadline:
+            if self.instr is not None:
+                end = time.perf_counter_ns()
+                self.instr.observe('gesture_lag', end - int((now - self.deadline) * 1e9), end)
+            self._resolve()
+
+    def _resolve(self):
+        blinks, self.pending, self.deadline = self.pending, [], None
+        self._fire(COUNT_GESTURES[min(len(blinks), len(COUNT_GESTURES)) - 1], blinks)
+
+    def _fire(self, gesture, blinks):
+        if self.instr is not None:
+            self.instr.count(f'gesture_{gesture}')
+        self.fire(gesture, blinks, self.actions.get(gesture))
+# -
@@ -1,127 +1,274 @@
 # +
+import os
+import sys
 import time
 import json
+import argparse
 import joblib
 import serial
 import numpy as np
-import tensorflow as tf
-from telnetlib import Telnet
 from collections import deque
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
 from fuzzy_logic import BlinkConfidenceSystem
+from window_store import BlinkWindowStore
+from inference import BACKENDS, KerasBackend, check_parity, random_inputs, warm_up
+from model_variants import VARIANTS, load_variant
+from instrumentation import Instrumentation, StartupTimer
+from spectral import RawBandPower
+from actuators import ActuatorLink, PROTOCOLS, ACTUATORS
+from thinkgear import ThinkGearStream, DECODERS, CONTROL_FIELDS
+from session_store import SessionRecorder, new_session_path
+from inference_gate import InferenceGate
+from gestures import GestureEngine, GESTURES, gesture_actions
+from shm_inference import ShmRing, InferenceProcess
+from event_log import EventLog, EventSink, GESTURE, ACTUATION
 
 class BlinkDetector:
-    def __init__(self):
-        self.model = tf.keras.models.load_model(
-            'best_eeg_cnn_bilstm_focal.h5',
-            custom_objects={'loss': self._custom_focal_loss([0.3, 1.0, 0.7], 2)}
-        )
-        self.window_scaler = joblib.load('scaler_seq.pkl')
-        self.feats_scaler = joblib.load('scaler_feats.pkl')
+    def __init__(self, inference_backend='numpy', parity_check=False,
+                 host='localhost', port=13854, serial_port='COM4', metrics_interval=0.0, metrics_path=None,
+                 connect=True, serial_protocol='text', serial_ack=False, json_decoder='auto',
+                 raw_mode=False, raw_rate_hz=8.0, record_dir=None, model_variant='float32',
+                 gate_threshold=0.0, gate_cache=64, gate_quantum=0.0, gesture_actions=None,
+                 long_blink_strength=None, inference_process=False, event_log=None, event_log_bytes=16 << 20,
+                 console=True):
+        # Stage latencies and packet counters, summarized every metrics_interval seconds (0 = off)
+        self.instr = Instrumentation('blink', metrics_interval, metrics_path)
+        self.startup = StartupTimer('blink')
+        # Inference only: the model loads with compile=False, so the focal loss is never rebuilt
+        # (with inference_process it is loaded by the worker instead)
+        self.model = None
+        if not inference_process:
+            with self.startup.stage('model'):
+                self.model = load_variant('best_eeg_cnn_bilstm_focal.h5', inference_backend, model_variant)
+            with self.startup.stage('warm_up'):
+                warm_up(self.model, 'best_eeg_cnn_bilstm_focal.h5')
+        if parity_check and self.model is not None and inference_backend != 'keras' and model_variant == 'float32':
+            with self.startup.stage('parity'):
+                diff = check_parity(self.model, KerasBackend('best_eeg_cnn_bilstm_focal.h5'),
+                                    random_inputs('best_eeg_cnn_bilstm_focal.h5', batch=8))
+            print(f"[Model] {inference_backend} backend matches keras (max |Δ| {diff:.1e})")
+        # Windows that barely changed since the last prediction reuse it instead of running the model
+        self.gate = InferenceGate(gate_threshold, gate_cache, gate_quantum, instr=self.instr)
+        with self.startup.stage('scalers'):
+            self.window_scaler = joblib.load('scaler_seq.pkl')
+            self.feats_scaler = joblib.load('scaler_feats.pkl')
         with open('windowed_feature_cols.json') as f:
             self.feature_cols = json.load(f)
         with open('preprocessing_meta.json') as f:
             meta = json.load(f)
         self.window_size = meta['window_size']
 
-        self.esp32 = serial.Serial('COM4', 115200, timeout=1)
-        self.tn = Telnet('localhost', 13854)
-        self.tn.write(b'{"enableRawOutput": false,"format":"Json","enableBlinkDetection": true,"enableESense": true,"enableSpectra": true}\n')
-        time.sleep(1)
+        # Optionally the model runs in its own process, reading scaled window rows from shared memory
+        self.remote = None
+        if inference_process:
+            with self.startup.stage('worker'):
+                self.remote = InferenceProcess('best_eeg_cnn_bilstm_focal.h5',
+                                               ShmRing(len(self.feature_cols), self.window_size),
+                                               inference_backend, model_variant, instr=self.instr).start()
+
+        # Raw mode: window rows come from host bands at raw_rate_hz, with the latest eSense values
+        self.band_power = RawBandPower(rate_hz=raw_rate_hz) if raw_mode else None
+        self._last_esense = {}
+
+        # Optional recording of every packet and window row (written by a background thread)
+        self.recorder = None
+        if record_dir:
+            self.recorder = SessionRecorder(new_session_path(record_dir, 'blink'), self.feature_cols,
+                                            source='blink', instr=self.instr)
+
+        # Gestures and servo commands go to the console, a binary event log
+        # (rendered by tools/view_events.py) or both; with neither nothing is formatted
+        meta = {'source': 'blink', 'gestures': list(GESTURES)}
+        self.events = EventSink(EventLog(event_log, meta, max_bytes=event_log_bytes, instr=self.instr) if event_log else None,
+                                console, meta)
+
+        # Hardware setup (connect=False leaves it out, e.g. for offline benchmarks)
+        self.esp32 = None
+        self.actuators = None
+        self.stream = None
+        if connect:
+            with self.startup.stage('connect'):
+                self.connect(host, port, serial_port, serial_protocol, serial_ack, json_decoder, raw_mode)
 
         self.blink_threshold = 60
         self.double_blink_interval = 1.0
         self.min_blink_strength = 60
         
-        self.buf = np.zeros((self.window_size, len(self.feature_cols)), dtype=float)
-        self.last_blink_time = 0
-        self.pending_blink = None
+        self.window = BlinkWindowStore(self.feature_cols, self.window_size,
+                                       self.window_scaler, self.feats_scaler, self.blink_threshold)
+        # Single / double / triple / long blinks, each decided at its own deadline
+        self.gestures = GestureEngine(self._trigger_gesture, gesture_actions, self.double_blink_interval,
+                                      long_blink_strength, clock=time.monotonic, instr=self.instr)
         self.prediction_history = deque(maxlen=5)
         self.blink_strength_history = deque(maxlen=5)
-        self.fuzzy = BlinkConfidenceSystem()
-
-    def _custom_focal_loss(self, alpha, gamma):
-        alpha = tf.constant(alpha, dtype=tf.float32)
-        def loss(y_true, y_pred):
-            y_true = tf.cast(y_true, tf.float32)
-            y_pred = tf.clip_by_value(y_pred, 1e-7, 1 - 1e-7)
-            ce = -y_true * tf.math.log(y_pred)
-            weight = alpha * tf.pow(1 - y_pred, gamma)
-            loss = weight * ce
-            return tf.reduce_sum(loss, axis=-1)
-        return loss
+        self.strength_smoothing = 3  # newest strengths averaged before the threshold test
+        with self.startup.stage('fuzzy'):
+            self.fuzzy = BlinkConfidenceSystem(compiled=True)
+        if connect:
+            self.startup.report()
+
+    @property
+    def blink_threshold(self):
+        return self._blink_threshold
+
+    @blink_threshold.setter
+    def blink_threshold(self, value):
+        # The window store keeps threshold counts incrementally, so it has to follow changes
+        self._blink_threshold = value
+        if hasattr(self, 'window'):
+            self.window.set_blink_threshold(value)
+
+    @property
+    def buf(self):
+        # Chronological (window_size, n_features) view of the raw rows
+        return self.window.raw
+
+    def connect(self, host='localhost', port=13854, serial_port='COM4', serial_protocol='text', serial_ack=False,
+                json_decoder='auto', raw=False):
+        # serial_port may also be a pyserial URL such as socket://localhost:5331
+        self.esp32 = serial.serial_for_url(serial_port, 115200, timeout=1)
+        # Servo commands are written by a background thread, never from the read loop
+        self.actuators = ActuatorLink(self.esp32, serial_protocol, serial_ack, instr=self.instr)
+        self.stream = ThinkGearStream(host, port, {"enableRawOutput": raw, "format": "Json", "enableBlinkDetection": True,
+                                                   "enableESense": True, "enableSpectra": True},
+                                      json_decoder, CONTROL_FIELDS, instr=self.instr, raw=raw)
+        time.sleep(1)
 
     def run(self):
         print("=== Advanced Blink Detector (With Fuzzy Confidence) Running ===")
         try:
             while True:
-                # Handle pending single blink timeout at the **start of each loop**
-                if self.pending_blink:
-                    elapsed = time.time() - self.pending_blink['time']
-                    if elapsed > self.double_blink_interval:
-                        self._trigger_single_blink(self.pending_blink)
-                        self.pending_blink = None
-
-                # Read data and ALWAYS update buffer to avoid zeros!
-                line = self.tn.read_until(b'\r').decode('utf-8', errors='ignore').strip()
-                if not line:
-                    continue
-                try:
-                    data_dict = json.loads(line)
-                except Exception:
-                    continue
-
-                feats = self._extract_features(data_dict)
-                self._roll_buffer(feats)  # Always keep buffer live
-
-                raw_blink_strength = data_dict.get("blinkStrength", 0)
-                now = time.time()
-                if raw_blink_strength < self.min_blink_strength:
-                    continue
-
-                self.blink_strength_history.append(raw_blink_strength)
-                smoothed_strength = np.mean(list(self.blink_strength_history)[-3:]) if self.blink_strength_history else raw_blink_strength
-
-                if smoothed_strength > self.blink_threshold:
-                    # Model inference
-                    window_scaled = self.window_scaler.transform(self.buf).reshape(
-                        1, self.window_size, len(self.feature_cols))
-                    engineered_feats = self._compute_engineered_features(self.buf)
-                    feats_scaled = self.feats_scaler.transform([engineered_feats])
-
-                    cnn_proba = self.model.predict([window_scaled, feats_scaled], verbose=0)[0]
-                    cnn_pred = int(np.argmax(cnn_proba))
-
-                    # Ensure only class 1 or 2 ("no blink" is class 0)
-                    if cnn_pred == 0:
-                        nonzero_preds = [p for p in self.prediction_history if p in [1,2]]
-                        cnn_pred = nonzero_preds[-1] if nonzero_preds else 1
-
-                    self.prediction_history.append(cnn_pred)
-                    smoothed_pred = self._get_smoothed_prediction()
-                    fuzzy_conf = self.fuzzy.calculate_confidence(smoothed_strength)
-                    
-                    blink_record = {
-                        'time': now,
-                        'strength': smoothed_strength,
-                        'raw_pred': cnn_pred,
-                        'smoothed_pred': smoothed_pred,
-                        'fuzzy_conf': fuzzy_conf
-                    }
-
-                    if self.pending_blink and (now - self.pending_blink['time']) <= self.double_blink_interval:
-                        self._trigger_double_blink(self.pending_blink, blink_record)
-                        self.pending_blink = None
-                    else:
-                        # If there is already a pending blink but the window expired, print it as single
-                        if self.pending_blink:
-                            self._trigger_single_blink(self.pending_blink)
-                        self.pending_blink = blink_record
-
+                # Parse time and packet counts are recorded by the stream. The read returns by the
+                # next gesture deadline, so a pending decision never waits for a packet
+                packets = self._read(self.gestures.timeout())
+                if self.remote is not None:
+                    self._take_remote_predictions()
+                # A blink still at the worker may extend the sequence, so deadlines wait for it
+                if self.remote is None or not self.remote.pending():
+                    self.gestures.poll()
+                self.instr.tick()
+                for data_dict in packets:
+                    if self.band_power is not None:
+                        data_dict = self._raw_mode_packet(data_dict)
+                        if data_dict is None:
+                            continue
+                    self._handle_packet(data_dict, self.stream.received_ns)
+                if self.band_power is not None:
+                    samples = self.stream.pop_raw()
+                    self._handle_band_rows(self.band_power.push(samples), self.stream.received_ns)
+                    self.instr.count('raw_samples', len(samples))
         except KeyboardInterrupt:
             print("\nExiting...")
+        except EOFError:
+            print("\nHeadset stream closed, exiting...")
+            self._finish()
         finally:
-            self.tn.close()
-            self.esp32.close()
+            self.stream.close()
+            self.actuators.close()
+            if self.recorder is not None:
+                self.recorder.close()
+            if self.remote is not None:
+                self.remote.close()
+            self.events.close()
+            self.instr.final_report()
+
+    def _read(self, timeout):
+        # With an inference process, its answers wake the loop as well as packets
+        if self.remote is None:
+            return self.stream.read(timeout=timeout)
+        if self.remote.pending():
+            timeout = None  # the gestures wait for the answers (wait() still checks on the worker)
+        return self.stream.read() if self.remote.wait(self.stream, timeout) else []
+
+    def _take_remote_predictions(self, results=None):
+        for _, outputs, context in self.remote.results() if results is None else results:
+            self._decide_blink(outputs[0] if outputs is not None else None, *context)
+
+    def _finish(self):
+        # The stream ended: decide the blinks still at the worker, then the gesture they end
+        if self.remote is not None:
+            self._take_remote_predictions(self.remote.drain())
+        self.gestures.poll(self.gestures.clock() + self.gestures.interval)
+
+    def _raw_mode_packet(self, data_dict):
+        # Headset bands only calibrate the host ones; blink packets carry the latest host bands
+        if 'eegPower' in data_dict:
+            self.band_power.calibrate(data_dict['eegPower'])
+        if 'eSense' in data_dict:
+            self._last_esense = data_dict['eSense']
+        if 'blinkStrength' not in data_dict:
+            return None
+        latest = self.band_power.latest
+        packet = self.band_power.as_packet(latest, self._last_esense) if latest is not None else {'eSense': self._last_esense}
+        packet['blinkStrength'] = data_dict['blinkStrength']
+        return packet
+
+    def _handle_band_rows(self, rows, t0):
+        # Raw mode: every host band row is a window row, with the latest eSense values
+        for row in rows:
+            self._handle_packet(self.band_power.as_packet(row, self._last_esense), t0)
+
+    def _handle_packet(self, data_dict, t0):
+        # ALWAYS update buffer to avoid zeros!
+        t1 = time.perf_counter_ns()
+        feats = self._extract_features(data_dict)
+        self._roll_buffer(feats)  # Always keep buffer live
+        self.instr.observe('features', t1)
+        if self.recorder is not None:
+            self.recorder.append(data_dict, feats, t=feats[-1])
+        self._handle_blink_strength(data_dict.get("blinkStrength", 0), t0)
+
+    def _handle_blink_strength(self, raw_blink_strength, t0):
+        # The decision logic, once the window holds the packet (tools/sweep_params.py replays it)
+        now = time.time()
+        if raw_blink_strength < self.min_blink_strength:
+            return
+
+        self.blink_strength_history.append(raw_blink_strength)
+        smoothed_strength = np.mean(list(self.blink_strength_history)[-self.strength_smoothing:]) if self.blink_strength_history else raw_blink_strength
+
+        if smoothed_strength > self.blink_threshold:
+            if self.remote is not None:
+                # Decided by _take_remote_predictions once the worker answers
+                self.remote.submit(self.window.engineered_scaled(),
+                                   (raw_blink_strength, smoothed_strength, now, t0, time.monotonic()))
+                return
+            self._decide_blink(self._predict_blink(), raw_blink_strength, smoothed_strength, now, t0)
+
+    def _decide_blink(self, cnn_proba, raw_blink_strength, smoothed_strength, now, t0, blink_clock=None):
+        # No prediction (the window was overwritten before the worker read it) counts as class 0
+        cnn_pred = int(np.argmax(cnn_proba)) if cnn_proba is not None else 0
+
+        # Ensure only class 1 or 2 ("no blink" is class 0)
+        if cnn_pred == 0:
+            nonzero_preds = [p for p in self.prediction_history if p in [1,2]]
+            cnn_pred = nonzero_preds[-1] if nonzero_preds else 1
+
+        self.prediction_history.append(cnn_pred)
+        smoothed_pred = self._get_smoothed_prediction()
+        with self.instr.span('fuzzy'):
+            fuzzy_conf = self.fuzzy.calculate_confidence(smoothed_strength)
+
+        blink_record = {
+            'time': now,
+            'received_ns': t0,
+            'strength': smoothed_strength,
+            'raw_strength': raw_blink_strength,
+            'raw_pred': cnn_pred,
+            'smoothed_pred': smoothed_pred,
+            'fuzzy_conf': fuzzy_conf
+        }
+        self.gestures.blink(blink_record, blink_clock)
+
+    def _predict_blink(self):
+        # Model inference (rows were scaled as they entered the window)
+        t2 = time.perf_counter_ns()
+        window_scaled = self.window.scaled.reshape(1, self.window_size, len(self.feature_cols))
+        feats_scaled = self.window.engineered_scaled()
+        self.instr.observe('scale', t2)
+        with self.instr.span('predict'):
+            return self.gate.predict(self.model, [window_scaled, feats_scaled])[0]
 
     def _get_smoothed_prediction(self):
         if not self.prediction_history:
@@ -130,20 +277,23 @@ class BlinkDetector:
         counts = np.bincount(preds+[0])
         return np.argmax(counts) if np.argmax(counts) != 0 else 1
 
-    def _trigger_single_blink(self, blink):
-        log_pred = 1 if blink['smoothed_pred'] in [1,2] else 1
-        self._send_servo('DOOR', 90)  # Door servo on pin 18
-        print(f"[Single Blink] | strength={int(blink['strength'])} | model={log_pred} | fuzzy={blink['fuzzy_conf']:.2f} | Servo=DOOR:90°")
-
-    def _trigger_double_blink(self, first, second):
-        log_pred1 = 1 if first['smoothed_pred'] in [1,2] else 1
-        log_pred2 = 2 if second['smoothed_pred'] in [1,2] else 2
-        print(f"[Double Blink] | strengths=({int(first['strength'])},{int(second['strength'])}) | models=({log_pred1},{log_pred2}) | fuzzy=({first['fuzzy_conf']:.2f},{second['fuzzy_conf']:.2f}) | Servo=WINDOW:90°")
-        self._send_servo('WINDOW', 90)  # Window servo on pin 4
+    def _trigger_gesture(self, gesture, blinks, action):
+        if self.events.log is not None or self.events.console:
+            # Up to 3 strengths, then their fuzzy confidences
+            x = [0.0] * 6
+            for i, b in enumerate(blinks[:3]):
+                x[i], x[3 + i] = b['strength'], b['fuzzy_conf']
+            self.events.emit(GESTURE, GESTURES.index(gesture), len(blinks),
+                             ACTUATORS[action[0]].code if action else 0, action[1] if action else 0, tuple(x))
+        if action:
+            self._send_servo(*action)  # Door servo on pin 18, window servo on pin 4
+            # Includes the double_blink_interval spent waiting for a possible further blink
+            self.instr.observe('blink_to_servo', blinks[-1]['received_ns'])
 
     def _send_servo(self, target, angle):
-        # target is 'DOOR' or 'WINDOW'
-        self.esp32.write(f"ServoAngle:{target}:{angle}\n".encode())
+        # target is 'DOOR' or 'WINDOW' by default (see --gesture)
+        sent = self.actuators.send(target, angle)
+        self.events.emit(ACTUATION, int(sent), 0, ACTUATORS[target].code, angle)
 
     def _extract_features(self, d):
         es, bp = d.get('eSense', {}), d.get('eegPower', {})
@@ -163,10 +313,12 @@ class BlinkDetector:
         ]
 
     def _roll_buffer(self, feats):
-        self.buf = np.roll(self.buf, -1, axis=0)
-        self.buf[-1] = feats
+        self.window.push(feats)
+        if self.remote is not None:
+            self.remote.ring.push(self.window.scaled[-1])
 
     def _compute_engineered_features(self, window):
+        # Reference implementation for arbitrary windows; the live loop uses BlinkWindowStore.engineered
         blink_idx = self.feature_cols.index('blinkStrength')
         time_idx = self.feature_cols.index('time')
         blink_vals = window[:, blink_idx]
@@ -187,7 +339,48 @@ class BlinkDetector:
         return feats
 
 if __name__ == "__main__":
-    BlinkDetector().run()
+    parser = argparse.ArgumentParser(description="Blink-based door/window control")
+    parser.add_argument('--backend', default='numpy', choices=BACKENDS, help="Inference backend")
+    parser.add_argument('--model-variant', default='float32', choices=VARIANTS,
+                        help="Quantized / pruned model built by tools/optimize_models.py")
+    parser.add_argument('--parity-check', action='store_true', help="Compare the backend against keras at startup")
+    parser.add_argument('--host', default='localhost', help="ThinkGear Connector host")
+    parser.add_argument('--port', type=int, default=13854, help="ThinkGear Connector port")
+    parser.add_argument('--serial-port', default='COM4', help="ESP32 serial port or pyserial URL (e.g. socket://localhost:5331)")
+    parser.add_argument('--serial-protocol', default='text', choices=PROTOCOLS, help="ESP32 command encoding (framed = 5-byte checksummed frames)")
+    parser.add_argument('--serial-ack', action='store_true', help="Framed protocol: wait for the board's acknowledgement and retry")
+    parser.add_argument('--json-decoder', default='auto', choices=DECODERS, help="ThinkGear JSON decoder (auto prefers orjson, then ujson)")
+    parser.add_argument('--raw', action='store_true', help="Compute the 8 bands on the host from 512 Hz rawEeg")
+    parser.add_argument('--raw-rate-hz', type=float, default=8.0, help="Raw mode: band/feature updates per second")
+    parser.add_argument('--record', default=None, metavar='DIR', help="Record packets and window rows to a new session under DIR")
+    parser.add_argument('--gate-threshold', type=float, default=0.0,
+                        help="Reuse the last prediction while no feature moved more than this fraction (0 = identical windows only)")
+    parser.add_argument('--gate-cache', type=int, default=64, help="Predictions kept for windows seen before (0 = no cache)")
+    parser.add_argument('--gate-quantum', type=float, default=0.0,
+                        help="Log-scale step at which cached windows count as the same (0 = exact match)")
+    parser.add_argument('--gesture', action='append', default=[], metavar='GESTURE=ACTUATOR:VALUE',
+                        help=f"Map a gesture ({', '.join(GESTURES)}) to a command, e.g. triple=WINDOW:0, or to none")
+    parser.add_argument('--long-blink-strength', type=int, default=None,
+                        help="Blink strength (0-255) at which a blink counts as a long blink (default: off)")
+    parser.add_argument('--inference-process', action='store_true',
+                        help="Run the model in a worker process that reads windows from shared memory")
+    parser.add_argument('--event-log', default=None, metavar='FILE',
+                        help="Binary log of gestures and servo commands (view with tools/view_events.py)")
+    parser.add_argument('--event-log-mb', type=float, default=16, help="Event log size at which it is rotated")
+    parser.add_argument('--quiet', action='store_true', help="No gesture output on the console")
+    parser.add_argument('--metrics-interval', type=float, default=0.0, help="Seconds between latency/throughput summaries (0 = no periodic summary)")
+    parser.add_argument('--metrics-file', default=None, help="Snapshot file rewritten with every summary (.json, or .prom for Prometheus text)")
+    args = parser.parse_args()
+    BlinkDetector(inference_backend=args.backend, parity_check=args.parity_check,
+                  host=args.host, port=args.port, serial_port=args.serial_port,
+                  serial_protocol=args.serial_protocol, serial_ack=args.serial_ack, json_decoder=args.json_decoder,
+                  raw_mode=args.raw, raw_rate_hz=args.raw_rate_hz, record_dir=args.record,
+                  model_variant=args.model_variant, gate_threshold=args.gate_threshold,
+                  gate_cache=args.gate_cache, gate_quantum=args.gate_quantum,
+                  gesture_actions=gesture_actions(args.gesture), long_blink_strength=args.long_blink_strength,
+                  inference_process=args.inference_process, event_log=args.event_log,
+                  event_log_bytes=int(args.event_log_mb * (1 << 20)), console=not args.quiet,
+                  metrics_interval=args.metrics_interval, metrics_path=args.metrics_file).run()
 
 # -
 
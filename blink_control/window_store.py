@@ -0,0 +1,177 @@
+import numpy as np
+
+# +
+BANDS = ['delta', 'theta', 'lowAlpha', 'highAlpha', 'lowBeta', 'highBeta', 'lowGamma', 'highGamma']
+
+
+def scaler_affine(scaler, n_features):
+    """(mean, scale) of a fitted StandardScaler, so rows can be scaled one at a time."""
+    mean = scaler.mean_ if getattr(scaler, 'with_mean', True) and scaler.mean_ is not None else np.zeros(n_features)
+    scale = scaler.scale_ if getattr(scaler, 'with_std', True) and scaler.scale_ is not None else np.ones(n_features)
+    return np.asarray(mean, dtype=float), np.asarray(scale, dtype=float)
+
+
+class BlinkWindowStore:
+    """
+    Fixed window of the last `window_size` feature rows for BlinkDetector, with no allocation per packet.
+
+    Rows are kept twice in mirrored rings (each row written at i and i + window_size), so the
+    chronological window is always a contiguous view:
+    - `raw` / `scaled`: (window_size, n_features) rows, the latter already passed through scaler_seq,
+    - a transposed ring of the columns the engineered features reduce over, so every statistic is a
+      single vectorized reduction along contiguous memory, rounding exactly like the per-column
+      numpy calls in BlinkDetector._compute_engineered_features.
+    Threshold counts and the last blink interval are maintained incrementally as rows enter and leave.
+    """
+
+    def __init__(self, feature_cols, window_size, window_scaler, feats_scaler, blink_threshold=60):
+        self.window_size = window_size
+        self.n_features = len(feature_cols)
+        self.blink_idx = feature_cols.index('blinkStrength')
+        self.time_idx = feature_cols.index('time')
+        self.band_idx = [feature_cols.index(band) for band in BANDS]
+        self.seq_mean, self.seq_scale = scaler_affine(window_scaler, self.n_features)
+        self.feats_mean, self.feats_scale = scaler_affine(feats_scaler, feats_scaler.n_features_in_)
+        self.blink_threshold = blink_threshold
+
+        w = window_size
+        self._raw = np.zeros((2 * w, self.n_features))
+        self._scaled = np.zeros((2 * w, self.n_features))
+        # Column ring rows: 0 = time, 1 = blinkStrength, 2..9 = bands, 10 = blinkStrength diff
+        self._cols = np.zeros((11, 2 * w))
+        self._col_idx = [self.time_idx, self.blink_idx] + self.band_idx
+        self._feats = np.zeros(13 + 2 * len(BANDS) + 1)
+        self._feats_scaled = np.zeros((1, len(self._feats)))
+        self.reset()
+
+    def reset(self):
+        """Back to an all-zero window, like a fresh np.zeros buffer."""
+        w = self.window_size
+        self._raw.fill(0)
+        self._cols.fill(0)
+        self._scaled[:] = (0 - self.seq_mean) / self.seq_scale
+        self._pos = w - 1
+        self._seq = -1
+        self._above = 0
+        self._zeros = w
+        # (sequence number, time) of the last two rows with blinkStrength >= threshold
+        self._last_blinks = []
+
+    @property
+    def raw(self):
+        return self._raw[self._pos + 1:self._pos + 1 + self.window_size]
+
+    @property
+    def scaled(self):
+        return self._scaled[self._pos + 1:self._pos + 1 + self.window_size]
+
+    def set_blink_threshold(self, threshold):
+        self.blink_threshold = threshold
+        window = self.raw
+        self._above = int(np.count_nonzero(window[:, self.blink_idx] > threshold))
+        first_seq = self._seq - self.window_size + 1
+        hits = np.flatnonzero(window[:, self.blink_idx] >= threshold)[-2:]
+        self._last_blinks = [(first_seq + i, window[i, self.time_idx]) for i in hits]
+
+    def push(self, feats):
+        """Append one raw feature row, evicting the oldest."""
+        w = self.window_size
+        old = self._pos + 1  # oldest row (its mirror copy sits at old + w)
+        old_blink = self._raw[old, self.blink_idx]
+        prev_blink = self._raw[self._pos + w, self.blink_idx]
+
+        self._pos = (self._pos + 1) % w
+        i, j = self._pos, self._pos + w
+        row = self._raw[i]
+        row[:] = feats
+        self._raw[j] = row
+        scaled = self._scaled[i]
+        np.subtract(row, self.seq_mean, out=scaled)
+        scaled /= self.seq_scale
+        self._scaled[j] = scaled
+        cols = self._cols[:, i]
+        cols[:10] = row[self._col_idx]
+        cols[10] = row[self.blink_idx] - prev_blink
+        self._cols[:, j] = cols
+
+        # Incremental counts: the evicted row leaves, the new one enters
+        blink = row[self.blink_idx]
+        self._seq += 1
+        self._above += int(blink > self.blink_threshold) - int(old_blink > self.blink_threshold)
+        self._zeros += int(blink == 0) - int(old_blink == 0)
+        if blink >= self.blink_threshold:
+            self._last_blinks = self._last_blinks[-1:] + [(self._seq, row[self.time_idx])]
+        first_seq = self._seq - w + 1
+        if self._last_blinks and self._last_blinks[0][0] < first_seq:
+            self._last_blinks = self._last_blinks[1:]
+
+    def engineered(self):
+        """The 30 window features of BlinkDetector._compute_engineered_features, unscaled."""
+        w = self.window_size
+        s, e = self._pos + 1, self._pos + 1 + w
+        cols = self._cols
+        f = self._feats
+        lo = np.min(cols[:2, s:e], axis=1)
+        hi = np.max(cols[:2, s:e], axis=1)
+        means = np.mean(cols[1:10, s:e], axis=1)
+        stds = np.std(cols[1:10, s:e], axis=1)
+        diffs = cols[10, s + 1:e]
+        f[0], f[1], f[2], f[3] = means[0], stds[0], lo[1], hi[1]
+        f[4] = cols[1, e - 1]
+        f[5] = hi[1] - lo[1]
+        f[6], f[7] = np.mean(diffs), np.std(diffs)
+        f[8], f[9] = self._above, self._zeros
+        f[10], f[11], f[12] = lo[0], hi[0], hi[0] - lo[0]
+        f[13:29:2] = means[1:]
+        f[14:29:2] = stds[1:]
+        if len(self._last_blinks) > 1:
+            f[29] = self._last_blinks[1][1] - self._last_blinks[0][1]
+        else:
+            f[29] = 0.0
+        return f
+
+    def engineered_scaled(self):
+        """engineered() passed through scaler_feats, shaped (1, n) for the model."""
+        out = self._feats_scaled
+        np.subtract(self.engineered(), self.feats_mean, out=out[0])
+        out /= self.feats_scale
+        return out
+
+
+def batch_engineered(windows, feature_cols, blink_threshold=60):
+    """
+    BlinkDetector._compute_engineered_features for a stack of (k, window_size, n_features)
+    windows at once, as a (k, 30) array. Each column is reduced over a contiguous copy, so
+    the values round exactly like the per-window reference.
+    """
+    k = len(windows)
+    blink = np.ascontiguousarray(windows[:, :, feature_cols.index('blinkStrength')])
+    times = np.ascontiguousarray(windows[:, :, feature_cols.index('time')])
+    diffs = np.diff(blink, axis=1)
+    feats = np.empty((k, 13 + 2 * len(BANDS) + 1))
+    feats[:, 0] = np.mean(blink, axis=1)
+    feats[:, 1] = np.std(blink, axis=1)
+    feats[:, 2] = np.min(blink, axis=1)
+    feats[:, 3] = np.max(blink, axis=1)
+    feats[:, 4] = blink[:, -1]
+    feats[:, 5] = feats[:, 3] - feats[:, 2]
+    feats[:, 6] = np.mean(diffs, axis=1)
+    feats[:, 7] = np.std(diffs, axis=1)
+    feats[:, 8] = np.sum(blink > blink_threshold, axis=1)
+    feats[:, 9] = np.sum(blink == 0, axis=1)
+    feats[:, 10] = np.min(times, axis=1)
+    feats[:, 11] = np.max(times, axis=1)
+    feats[:, 12] = feats[:, 11] - feats[:, 10]
+    for j, band in enumerate(BANDS):
+        col = np.ascontiguousarray(windows[:, :, feature_cols.index(band)])
+        feats[:, 13 + 2 * j] = np.mean(col, axis=1)
+        feats[:, 14 + 2 * j] = np.std(col, axis=1)
+    # Interval between the last two rows at or above the threshold (0 if fewer than two)
+    pos = np.where(blink >= blink_threshold, np.arange(blink.shape[1]), -1)
+    last = pos.max(axis=1)
+    pos[np.arange(k), np.maximum(last, 0)] = -1
+    prev = pos.max(axis=1)
+    rows = np.arange(k)
+    feats[:, 29] = np.where(prev >= 0, times[rows, np.maximum(last, 0)] - times[rows, np.maximum(prev, 0)], 0.0)
+    return feats
+# -
@@ -0,0 +1,234 @@
+# +
+import os
+import sys
+import time
+import argparse
+import serial
+import numpy as np
+from contextlib import contextmanager
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+MIND_DIR = os.path.join(ROOT, 'mind_state_control')
+BLINK_DIR = os.path.join(ROOT, 'blink_control')
+for _path in (os.path.join(ROOT, 'common'), MIND_DIR, BLINK_DIR):
+    if _path not in sys.path:
+        sys.path.append(_path)
+
+from inference import BACKENDS
+from model_variants import VARIANTS
+from instrumentation import Instrumentation, StartupTimer
+from actuators import ActuatorLink, PROTOCOLS
+from thinkgear import ThinkGearStream, DECODERS, CONTROL_FIELDS
+from spectral import RawBandPower
+from packet_bus import PacketBus, InferenceExecutor, ExecutorModel
+from gestures import GESTURES, gesture_actions
+
+
+@contextmanager
+def in_dir(path):
+    # The controllers load their model/scaler files relative to their own directory
+    prev = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(prev)
+
+
+def metrics_path_for(path, name):
+    # metrics.json -> metrics.mind.json, so the three instruments do not overwrite each other
+    if not path:
+        return None
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{name}{ext}"
+
+
+class MindStatePlugin:
+    """MindStateController's read loop as a bus plugin; predictions go to the shared executor."""
+    name = 'mind'
+    # The blink detection the runtime enables adds blinkStrength-only packets the model never saw
+    fields = ('eSense', 'eegPower')
+
+    def __init__(self, controller, executor):
+        self.ctrl = controller
+        self.executor = executor
+
+    def on_packet(self, packet, received_ns):
+        ctrl = self.ctrl
+        ctrl._update_features(packet)
+        now = time.time()
+        if now - ctrl.last_control_update >= ctrl.control_update_interval:
+            ctrl._process_mind_state(packet)
+            if len(ctrl.seq_buffer) < ctrl.window_size:
+                if ctrl.events.console:
+                    print("Waiting for full EEG sequence window...")
+            else:
+                # Only the newest window is worth predicting if the executor is busy
+                window = np.array(ctrl.seq_buffer)[-ctrl.window_size:]
+                self.executor.submit(ctrl._predict_eeg_labels, window, key=self.name)
+            ctrl.last_control_update = now
+            ctrl.instr.observe('packet_to_control', received_ns)
+
+    def on_rows(self, rows, received_ns):
+        self.ctrl._add_band_rows(rows)
+
+
+class BlinkPlugin:
+    """BlinkDetector's read loop as a bus plugin; its model calls jump the executor's queue."""
+    name = 'blink'
+    fields = None
+
+    def __init__(self, detector):
+        self.det = detector
+
+    def on_packet(self, packet, received_ns):
+        if self.det.band_power is not None:
+            packet = self.det._raw_mode_packet(packet)
+            if packet is None:
+                return
+        self.det._handle_packet(packet, received_ns)
+
+    def on_rows(self, rows, received_ns):
+        self.det._handle_band_rows(rows, received_ns)
+
+    def timeout(self):
+        return self.det.gestures.timeout()
+
+    def poll(self):
+        self.det.gestures.poll()
+
+
+class CombinedRuntime:
+    """
+    Blink door/window control and mind-state fan control on one headset connection.
+
+    The ThinkGear stream is read and parsed once and every packet is published on a
+    PacketBus to both controllers; in raw mode host band power is computed once as well.
+    Both models are loaded in this process and run on one InferenceExecutor thread, and
+    one ActuatorLink owns the ESP32 port for the fan and both servos.
+    """
+
+    def __init__(self, mind, blink, host='localhost', port=13854, serial_port='COM4', serial_protocol='text',
+                 serial_ack=False, json_decoder='auto', raw_mode=False, raw_rate_hz=8.0,
+                 metrics_interval=0.0, metrics_path=None, connect=True):
+        self.mind = mind
+        self.blink = blink
+        self.instr = Instrumentation('combined', metrics_interval, metrics_path)
+        self.executor = InferenceExecutor(instr=self.instr)
+        self.blink.model = ExecutorModel(self.blink.model, self.executor)
+
+        # One band power estimate (and one calibration per headset packet) for both controllers
+        self.band_power = RawBandPower(rate_hz=raw_rate_hz) if raw_mode else None
+        self.mind.band_power = self.blink.band_power = self.band_power
+
+        self.bus = PacketBus(instr=self.instr)
+        self.bus.subscribe(MindStatePlugin(mind, self.executor))
+        self.bus.subscribe(BlinkPlugin(blink))
+
+        self.esp32 = None
+        self.actuators = None
+        self.stream = None
+        if connect:
+            self.connect(host, port, serial_port, serial_protocol, serial_ack, json_decoder, raw_mode)
+
+    def connect(self, host='localhost', port=13854, serial_port='COM4', serial_protocol='text', serial_ack=False,
+                json_decoder='auto', raw=False):
+        self.esp32 = serial.serial_for_url(serial_port, 115200, timeout=1)
+        self.actuators = ActuatorLink(self.esp32, serial_protocol, serial_ack, instr=self.instr)
+        self.stream = ThinkGearStream(host, port, {"enableRawOutput": raw, "format": "Json", "enableBlinkDetection": True,
+                                                   "enableESense": True, "enableSpectra": True},
+                                      json_decoder, CONTROL_FIELDS, instr=self.instr, raw=raw)
+        for ctrl in (self.mind, self.blink):
+            ctrl.esp32, ctrl.actuators, ctrl.stream = self.esp32, self.actuators, self.stream
+        time.sleep(1)
+
+    def run(self):
+        print("=== Blink + Mind Controlled System Active ===")
+        try:
+            while True:
+                # Returns by the next blink gesture deadline at the latest
+                packets = self.stream.read(timeout=self.bus.timeout())
+                self.bus.poll()
+                self.bus.publish(packets, self.stream.received_ns)
+                if self.band_power is not None:
+                    samples = self.stream.pop_raw()
+                    self.bus.publish_rows(self.band_power.push(samples), self.stream.received_ns)
+                    self.instr.count('raw_samples', len(samples))
+                for instr in (self.instr, self.mind.instr, self.blink.instr):
+                    instr.tick()
+        except KeyboardInterrupt:
+            print("\nShutting down...")
+        except EOFError:
+            print("\nHeadset stream closed, shutting down...")
+        finally:
+            self.executor.close()
+            self.mind._send_fan_pwm(0)
+            self.stream.close()
+            self.actuators.close()
+            for ctrl in (self.mind, self.blink):
+                if ctrl.recorder is not None:
+                    ctrl.recorder.close()
+                ctrl.events.close()
+                ctrl.instr.final_report()
+            self.instr.final_report()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Blink door/window control and mind-state fan control on one headset")
+    parser.add_argument('--backend', default='numpy', choices=BACKENDS, help="Inference backend for both models")
+    parser.add_argument('--model-variant', default='float32', choices=VARIANTS,
+                        help="Quantized / pruned models built by tools/optimize_models.py")
+    parser.add_argument('--host', default='localhost', help="ThinkGear Connector host")
+    parser.add_argument('--port', type=int, default=13854, help="ThinkGear Connector port")
+    parser.add_argument('--serial-port', default='COM4', help="ESP32 serial port or pyserial URL (e.g. socket://localhost:5331)")
+    parser.add_argument('--serial-protocol', default='text', choices=PROTOCOLS, help="ESP32 command encoding (framed = 5-byte checksummed frames)")
+    parser.add_argument('--serial-ack', action='store_true', help="Framed protocol: wait for the board's acknowledgement and retry")
+    parser.add_argument('--json-decoder', default='auto', choices=DECODERS, help="ThinkGear JSON decoder (auto prefers orjson, then ujson)")
+    parser.add_argument('--raw', action='store_true', help="Compute the 8 bands on the host from 512 Hz rawEeg")
+    parser.add_argument('--raw-rate-hz', type=float, default=8.0, help="Raw mode: band/feature updates per second")
+    parser.add_argument('--record', default=None, metavar='DIR', help="Record both controllers' packets and feature rows under DIR")
+    parser.add_argument('--gate-threshold', type=float, default=0.0,
+                        help="Reuse the last prediction while no feature moved more than this fraction (0 = identical windows only)")
+    parser.add_argument('--gate-cache', type=int, default=64, help="Predictions kept for windows seen before (0 = no cache)")
+    parser.add_argument('--gate-quantum', type=float, default=0.0,
+                        help="Log-scale step at which cached windows count as the same (0 = exact match)")
+    parser.add_argument('--gesture', action='append', default=[], metavar='GESTURE=ACTUATOR:VALUE',
+                        help=f"Map a blink gesture ({', '.join(GESTURES)}) to a command, e.g. triple=FAN:0, or to none")
+    parser.add_argument('--long-blink-strength', type=int, default=None,
+                        help="Blink strength (0-255) at which a blink counts as a long blink (default: off)")
+    parser.add_argument('--event-log', default=None, metavar='FILE',
+                        help="Binary event logs <name>.mind / <name>.blink (view with tools/view_events.py)")
+    parser.add_argument('--event-log-mb', type=float, default=16, help="Event log size at which it is rotated")
+    parser.add_argument('--quiet', action='store_true', help="No state / prediction / gesture / fan output on the console")
+    parser.add_argument('--metrics-interval', type=float, default=0.0, help="Seconds between latency/throughput summaries (0 = no periodic summary)")
+    parser.add_argument('--metrics-file', default=None,
+                        help="Snapshot file rewritten with every summary; the controllers' go to <name>.mind / <name>.blink")
+    args = parser.parse_args()
+    # The controllers are built inside their own directories
+    event_log = os.path.abspath(args.event_log) if args.event_log else None
+    record_dir = os.path.abspath(args.record) if args.record else None
+
+    startup = StartupTimer('combined')
+    common = dict(inference_backend=args.backend, model_variant=args.model_variant, connect=False,
+                  raw_mode=args.raw, raw_rate_hz=args.raw_rate_hz, record_dir=record_dir,
+                  gate_threshold=args.gate_threshold, gate_cache=args.gate_cache, gate_quantum=args.gate_quantum,
+                  event_log_bytes=int(args.event_log_mb * (1 << 20)), console=not args.quiet,
+                  metrics_interval=args.metrics_interval)
+    with startup.stage('mind'), in_dir(MIND_DIR):
+        from main_att import MindStateController
+        mind = MindStateController(metrics_path=metrics_path_for(args.metrics_file, 'mind'),
+                                   event_log=metrics_path_for(event_log, 'mind'), **common)
+    with startup.stage('blink'), in_dir(BLINK_DIR):
+        from main import BlinkDetector
+        blink = BlinkDetector(metrics_path=metrics_path_for(args.metrics_file, 'blink'),
+                              event_log=metrics_path_for(event_log, 'blink'),
+                              gesture_actions=gesture_actions(args.gesture),
+                              long_blink_strength=args.long_blink_strength, **common)
+    with startup.stage('connect'):
+        runtime = CombinedRuntime(mind, blink, host=args.host, port=args.port, serial_port=args.serial_port,
+                                  serial_protocol=args.serial_protocol, serial_ack=args.serial_ack,
+                                  json_decoder=args.json_decoder, raw_mode=args.raw, raw_rate_hz=args.raw_rate_hz,
+                                  metrics_interval=args.metrics_interval, metrics_path=args.metrics_file)
+    startup.report()
+    runtime.run()
+
+# -
@@ -0,0 +1,224 @@
+import time
+import threading
+
+# +
+PROTOCOLS = ('text', 'framed')
+
+# Framed protocol (see arduino/final_esp32.ino):
+#   command  A5 | type | value | seq | checksum     type bit 7 set = acknowledgement requested
+#   ack      5A | seq | seq ^ FF
+# checksum is the XOR of type, value and seq. Values are one byte (PWM 0-255, angles 0-180).
+FRAME_START = 0xA5
+ACK_START = 0x5A
+ACK_FLAG = 0x80
+
+
+class Actuator:
+    """
+    One output on the ESP32. State-like outputs (the fan) are deduplicated: a value equal to
+    the last one sent is dropped. Event-like outputs (servo pulses) always go out. Either way
+    a newer command replaces one still waiting in the queue, and commands to the same
+    actuator are at least `min_interval` seconds apart.
+    """
+
+    def __init__(self, code, text, min_interval=0.0, dedup=False):
+        self.code = code
+        self.text = text
+        self.min_interval = min_interval
+        self.dedup = dedup
+
+
+ACTUATORS = {
+    'FAN': Actuator(0x01, 'FAN:{}', min_interval=0.2, dedup=True),
+    'DOOR': Actuator(0x02, 'ServoAngle:DOOR:{}'),
+    'WINDOW': Actuator(0x03, 'ServoAngle:WINDOW:{}'),
+}
+_BY_CODE = {a.code: (name, a) for name, a in ACTUATORS.items()}
+
+
+def checksum(type_byte, value, seq):
+    return type_byte ^ value ^ seq
+
+
+def encode_frame(actuator, value, seq, ack=False):
+    type_byte = ACTUATORS[actuator].code | (ACK_FLAG if ack else 0)
+    value = int(value) & 0xFF
+    return bytes((FRAME_START, type_byte, value, seq, checksum(type_byte, value, seq)))
+
+
+def decode_frame(frame):
+    """(actuator, value, seq, ack requested) from a 5-byte frame, or None if it is corrupt."""
+    if len(frame) != 5 or frame[0] != FRAME_START or checksum(*frame[1:4]) != frame[4]:
+        return None
+    entry = _BY_CODE.get(frame[1] & ~ACK_FLAG)
+    if entry is None:
+        return None
+    return entry[0], frame[2], frame[3], bool(frame[1] & ACK_FLAG)
+
+
+def encode_ack(seq):
+    return bytes((ACK_START, seq, seq ^ 0xFF))
+
+
+def format_command(actuator, value):
+    """The text protocol line for a command (also how framed commands are logged)."""
+    return ACTUATORS[actuator].text.format(int(value))
+
+
+class ActuatorLink:
+    """
+    Write-behind command queue in front of the ESP32 serial port.
+
+    send() never touches the port: it records the newest command per actuator and returns,
+    so a slow UART cannot stall EEG ingestion. A writer thread sends pending commands
+    oldest first, honouring each actuator's rate limit. With `protocol='framed'` commands go
+    out as 5-byte checksummed frames, and with `ack=True` each frame is resent up to
+    `retries` times until the board acknowledges it within `ack_timeout` seconds (a newer
+    command for the same actuator cancels the retries). close() flushes what is pending,
+    ignoring rate limits, then closes the port.
+    """
+
+    def __init__(self, port, protocol='text', ack=False, retries=2, ack_timeout=0.1, instr=None):
+        if protocol not in PROTOCOLS:
+            raise ValueError(f"Unknown serial protocol '{protocol}', expected one of {PROTOCOLS}")
+        if ack and protocol != 'framed':
+            raise ValueError("Acknowledgements need the framed serial protocol")
+        self.port = port
+        self.protocol = protocol
+        self.ack = ack
+        self.retries = retries
+        self.ack_timeout = ack_timeout
+        self.instr = instr
+        if ack:
+            self.port.timeout = ack_timeout
+
+        self._cond = threading.Condition()
+        self._pending = {}      # actuator -> (value, queued at)
+        self._last_sent = {}    # actuator -> value the board was last sent (None = unknown)
+        self._next_allowed = {}
+        self._seq = 0
+        self._closing = False
+        self.stats = {'queued': 0, 'sent': 0, 'deduped': 0, 'superseded': 0,
+                      'retries': 0, 'failed': 0, 'errors': 0}
+        self._thread = threading.Thread(target=self._writer, name='actuator-writer', daemon=True)
+        self._thread.start()
+
+    def send(self, actuator, value):
+        """Queue a command; returns False if it was dropped because the board already has that value."""
+        spec = ACTUATORS[actuator]
+        value = int(value)
+        with self._cond:
+            if self._closing:
+                return False
+            if spec.dedup and self._last_sent.get(actuator) == value:
+                # The board already has it; a different value still waiting is now stale
+                if self._pending.pop(actuator, None) is not None:
+                    self._count('superseded')
+                self._count('deduped')
+                return False
+            if actuator in self._pending:
+                if spec.dedup and self._pending[actuator][0] == value:
+                    self._count('deduped')
+                    return False
+                self._count('superseded')
+                queued_at = self._pending[actuator][1]
+            else:
+                queued_at = time.monotonic()
+            self._pending[actuator] = (value, queued_at)
+            self._count('queued')
+            self._cond.notify()
+        return True
+
+    def close(self, timeout=2.0):
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        self.port.close()
+
+    def pending(self):
+        with self._cond:
+            return len(self._pending)
+
+    def _count(self, key, n=1):
+        self.stats[key] += n
+        if self.instr is not None:
+            self.instr.count(f'serial_{key}', n)
+
+    def _next_due(self):
+        """(actuator, value) ready to send now, or the seconds until one is (caller holds the lock)."""
+        now = time.monotonic()
+        best, wait = None, None
+        for actuator, (value, queued_at) in self._pending.items():
+            delay = 0.0 if self._closing else self._next_allowed.get(actuator, 0.0) - now
+            if delay <= 0:
+                if best is None or queued_at < self._pending[best][1]:
+                    best = actuator
+            elif wait is None or delay < wait:
+                wait = delay
+        if best is not None:
+            value, _ = self._pending.pop(best)
+            self._last_sent[best] = value
+            return (best, value), None
+        return None, wait
+
+    def _writer(self):
+        while True:
+            with self._cond:
+                while True:
+                    command, wait = self._next_due()
+                    if command is not None:
+                        break
+                    if self._closing:
+                        return
+                    self._cond.wait(wait)
+            actuator, value = command
+            ok = self._write(actuator, value)
+            with self._cond:
+                self._next_allowed[actuator] = time.monotonic() + ACTUATORS[actuator].min_interval
+                if not ok and self._last_sent.get(actuator) == value:
+                    self._last_sent[actuator] = None
+
+    def _write(self, actuator, value):
+        if self.protocol == 'text':
+            data = (format_command(actuator, value) + '\n').encode()
+        else:
+            self._seq = (self._seq + 1) & 0xFF
+            data = encode_frame(actuator, value, self._seq, self.ack)
+        for attempt in range(1 + (self.retries if self.ack else 0)):
+            if attempt:
+                with self._cond:
+                    if actuator in self._pending:
+                        return True  # superseded while waiting for the ack
+                self._count('retries')
+            try:
+                start = time.perf_counter_ns()
+                self.port.write(data)
+                if self.instr is not None:
+                    self.instr.observe('serial_write', start)
+            except Exception as e:
+                print(f"Error writing {format_command(actuator, value)} to ESP32: {e}")
+                self._count('errors')
+                return False
+            if not self.ack or self._await_ack(self._seq):
+                self._count('sent')
+                return True
+        self._count('failed')
+        return False
+
+    def _await_ack(self, seq):
+        deadline = time.monotonic() + self.ack_timeout
+        buf = b''
+        while time.monotonic() < deadline:
+            buf += self.port.read(max(1, 3 - len(buf)))
+            start = buf.find(bytes((ACK_START,)))
+            if start < 0:
+                buf = b''
+                continue
+            buf = buf[start:]
+            if len(buf) >= 3:
+                if buf[1] == seq and buf[2] == seq ^ 0xFF:
+                    return True
+                buf = buf[1:]
+        return False
+# -
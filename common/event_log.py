@@ -0,0 +1,282 @@
+import os
+import re
+import json
+import time
+import threading
+from collections import deque
+import numpy as np
+
+from actuators import ACTUATORS
+
+# +
+# Event kinds. Every event is one fixed-size record; what its fields hold depends on the kind:
+#   STATE       code = fan decision, count / actuator = attention / meditation level, value = PWM,
+#               x = smoothed attention, its change, smoothed meditation, its change, net effect
+#   PREDICTION  code / count = attention / relaxation class, x = the two heads' probabilities
+#   GESTURE     code = gesture, count = blinks, actuator / value = command (0 = none),
+#               x = up to 3 blink strengths, then their fuzzy confidences
+#   ACTUATION   code = 1 if sent (0 = dropped as unchanged), actuator / value = command
+STATE, PREDICTION, GESTURE, ACTUATION = 1, 2, 3, 4
+KINDS = {'state': STATE, 'prediction': PREDICTION, 'gesture': GESTURE, 'actuation': ACTUATION}
+FAN_HOLD, FAN_FASTER, FAN_SLOWER = 0, 1, 2
+LEVELS = ('LOW', 'MEDIUM', 'HIGH')
+NO_X = (0.0,) * 6
+
+EVENT_DTYPE = np.dtype([('time', '<f8'), ('kind', 'u1'), ('code', 'u1'), ('count', 'u1'), ('actuator', 'u1'),
+                        ('value', '<i2'), ('x', '<f8', (6,))])
+MAGIC = b'EEGEVENTS1\n'
+ACTUATOR_NAMES = {spec.code: name for name, spec in ACTUATORS.items()}
+
+GREEN, RED, YELLOW, BLUE, RESET = "\033[92m", "\033[91m", "\033[93m", "\033[94m", "\033[0m"
+_ANSI = re.compile(r'\033\[[0-9;]*m')
+
+
+class EventLog:
+    """
+    Binary log of a controller's events, written by a background thread.
+
+    append() copies one record into an in-memory chunk of EVENT_DTYPE records, with no
+    formatting; full chunks (or ones older than `flush_interval` seconds, which the writer
+    thread picks up itself when no new record arrives) go to the writer thread. If more than
+    `max_pending` chunks are queued, the newest is dropped and counted instead, so the loop
+    never waits on the disk. append() may be called from several threads (e.g. control and
+    inference in --pipeline mode). A file starts with MAGIC and one JSON line of `meta`,
+    followed by the raw records. Past `max_bytes` it is rotated like a logging
+    RotatingFileHandler (path.1 ... path.<backups>); an existing log is rotated at startup.
+    """
+
+    def __init__(self, path, meta=None, chunk_records=256, flush_interval=0.5, max_pending=64,
+                 max_bytes=16 << 20, backups=5, instr=None):
+        self.path = path
+        self.meta = dict(meta or {}, version=1, record_size=EVENT_DTYPE.itemsize, created=time.time())
+        self.chunk_records = chunk_records
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.instr = instr
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = None
+        self._open()
+
+        self._chunk = np.empty(chunk_records, EVENT_DTYPE)
+        self._n = 0
+        self._chunk_started = 0.0
+        self._free = deque()            # spare chunk buffers returned by the writer
+        self._queue = deque()           # (buffer, records) waiting for the writer
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._closing = False
+        self.records = 0                # records handed to the writer
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._writer, name='event-log', daemon=True)
+        self._thread.start()
+
+    def append(self, record):
+        """Log one (time, kind, code, count, actuator, value, x) record; never blocks."""
+        if self._closing:
+            return
+        with self._lock:
+            if self._n == 0:
+                self._chunk_started = time.monotonic()
+            self._chunk[self._n] = record
+            self._n += 1
+            if self._n == self.chunk_records or time.monotonic() - self._chunk_started >= self.flush_interval:
+                self._hand_off()
+
+    def flush(self):
+        """Hand the current partial chunk to the writer."""
+        with self._lock:
+            if self._n:
+                self._hand_off()
+
+    def close(self, timeout=5.0):
+        self.flush()
+        self._closing = True
+        self._wake.set()
+        self._thread.join(timeout)
+
+    def _hand_off(self):
+        n = self._n
+        self._n = 0
+        if len(self._queue) >= self.max_pending:
+            self.dropped += n
+            if self.instr is not None:
+                self.instr.count('events_dropped', n)
+            return
+        self._queue.append((self._chunk, n))
+        self._chunk = self._free.popleft() if self._free else np.empty(self.chunk_records, EVENT_DTYPE)
+        self.records += n
+        self._wake.set()
+
+    def _writer(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            # A quiet controller may not append again for a long time
+            with self._lock:
+                if self._n and time.monotonic() - self._chunk_started >= self.flush_interval:
+                    self._hand_off()
+            while self._queue:
+                chunk, n = self._queue[0]
+                data = chunk[:n].tobytes()
+                if self._size + len(data) > self.max_bytes:
+                    self._open()
+                self._file.write(data)
+                self._file.flush()
+                self._size += len(data)
+                self._queue.popleft()
+                self._free.append(chunk)
+            if self._closing and not self._queue:
+                break
+        self._file.close()
+
+    def _open(self):
+        # Rotate whatever is at `path`, then start a new file with its header
+        if self._file is not None:
+            self._file.close()
+        if os.path.exists(self.path):
+            for i in range(self.backups - 1, 0, -1):
+                if os.path.exists(f'{self.path}.{i}'):
+                    os.replace(f'{self.path}.{i}', f'{self.path}.{i + 1}')
+            if self.backups:
+                os.replace(self.path, f'{self.path}.1')
+        self._file = open(self.path, 'wb')
+        self._file.write(MAGIC + json.dumps(self.meta).encode() + b'\n')
+        self._file.flush()
+        self._size = self._file.tell()
+
+
+class EventSink:
+    """
+    Where a controller's events go: an EventLog, the console (rendered as the controllers
+    always printed them) or both. With neither, emit() returns before building a record.
+    """
+
+    def __init__(self, log=None, console=True, meta=None):
+        self.log = log
+        self.console = console
+        self.meta = meta or {}
+
+    def emit(self, kind, code=0, count=0, actuator=0, value=0, x=NO_X):
+        if self.log is None and not self.console:
+            return
+        record = (time.time(), kind, code, count, actuator, value, x)
+        if self.log is not None:
+            self.log.append(record)
+        if self.console:
+            for line in render(record, self.meta):
+                print(line)
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+            print(f"[Events] {self.log.records} events in {self.log.path}"
+                  + (f" ({self.log.dropped} dropped)" if self.log.dropped else ""))
+
+
+def log_path_for(path, name):
+    # events.bin -> events.<name>.bin, one log per controller or headset
+    if not path:
+        return None
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{name}{ext}"
+
+
+def read_header(f):
+    """meta of an open event log positioned at its start; leaves it at the first record."""
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f"{getattr(f, 'name', 'file')} is not an event log")
+    meta = json.loads(f.readline())
+    if meta.get('record_size') != EVENT_DTYPE.itemsize:
+        raise ValueError(f"{getattr(f, 'name', 'file')} was written with a different record layout")
+    return meta
+
+
+def read_events(path):
+    """(meta, records) of one event log file; a record cut short by a crash is left out."""
+    with open(path, 'rb') as f:
+        meta = read_header(f)
+        data = f.read()
+    n = len(data) // EVENT_DTYPE.itemsize
+    return meta, np.frombuffer(data[:n * EVENT_DTYPE.itemsize], EVENT_DTYPE)
+
+
+def log_files(path):
+    """An event log and its rotated backups, oldest first."""
+    backups = []
+    i = 1
+    while os.path.exists(f'{path}.{i}'):
+        backups.append(f'{path}.{i}')
+        i += 1
+    return backups[::-1] + ([path] if os.path.exists(path) else [])
+
+
+def render(record, meta, color=True):
+    """The console lines of one record, exactly as the controllers print them."""
+    t, kind, code, count, actuator, value, x = record
+    tag = meta.get('tag', '')
+    if kind == STATE:
+        att, d_att, med, d_med, net = (float(v) for v in x[:5])
+        att_color = GREEN if d_att >= 0 else RED
+        med_color = GREEN if d_med < 0 else RED  # Inverse for meditation
+        net_color = GREEN if net >= 0 else RED
+        lines = [f"{tag}[Mind State] {att_color}Att:{att:.0f}(Δ{d_att:+.1f})[{LEVELS[count]}]{RESET} | "
+                 f"{med_color}Med:{med:.0f}(Δ{d_med:+.1f})[{LEVELS[actuator]}]{RESET} | "
+                 f"{net_color}Net:{net:+.2f}{RESET}"]
+        if code == FAN_FASTER:
+            lines.append(f"{tag}{GREEN}[Focus ↑, Relax ↓ or Both ↑] Fan: FASTER{RESET}")
+        elif code == FAN_SLOWER:
+            lines.append(f"{tag}{RED}[Focus ↓, Relax ↑ or Both ↓] Fan: SLOWER{RESET}")
+        else:
+            lines.append(f"{tag}{YELLOW}[Mixed State] Fan: MODERATE{RESET}")
+    elif kind == PREDICTION:
+        labels = meta.get('labels', {})
+        att_label = labels.get('attention', [])[code] if code < len(labels.get('attention', [])) else code
+        rel_label = labels.get('relaxation', [])[count] if count < len(labels.get('relaxation', [])) else count
+        lines = [f"{tag}{BLUE}[EEG Model] Attention Prediction: {att_label}, Relaxation Prediction: {rel_label}{RESET}"]
+    elif kind == GESTURE:
+        gestures = meta.get('gestures', [])
+        name = gestures[code] if code < len(gestures) else str(code)
+        target = ACTUATOR_NAMES.get(actuator)
+        servo = f"{target}:{value}{'' if target == 'FAN' else '°'}" if target else "none"
+        n = min(count, 3)
+        if count == 1:
+            lines = [f"[{name.capitalize()} Blink] | strength={int(x[0])} | model=1 | fuzzy={x[3]:.2f} | Servo={servo}"]
+        else:
+            strengths = ','.join(str(int(s)) for s in x[:n])
+            models = ','.join(str(i + 1) for i in range(count))
+            fuzzy = ','.join(f"{c:.2f}" for c in x[3:3 + n])
+            lines = [f"[{name.capitalize()} Blink] | strengths=({strengths}) | models=({models}) | fuzzy=({fuzzy}) | Servo={servo}"]
+    elif kind == ACTUATION and code and ACTUATOR_NAMES.get(actuator) == 'FAN':
+        lines = [f"{tag}[DEBUG] Sent PWM: {value}"]
+    else:
+        lines = []  # servo commands were never printed
+    return lines if color else [_ANSI.sub('', line) for line in lines]
+
+
+def event_dict(record, meta):
+    """One record as a dict with named fields (e.g. for NDJSON)."""
+    t, kind, code, count, actuator, value, x = record
+    x = [round(float(v), 4) for v in x]
+    kind_name = {v: k for k, v in KINDS.items()}.get(kind, str(kind))
+    event = {'time': float(t), 'kind': kind_name}
+    if kind == STATE:
+        event.update(attention=x[0], attention_delta=x[1], meditation=x[2], meditation_delta=x[3], net_effect=x[4],
+                     attention_level=LEVELS[count], meditation_level=LEVELS[actuator],
+                     fan=('hold', 'faster', 'slower')[code], pwm=int(value))
+    elif kind == PREDICTION:
+        labels = meta.get('labels', {})
+        att, rel = labels.get('attention', []), labels.get('relaxation', [])
+        event.update(attention=att[code] if code < len(att) else int(code),
+                     relaxation=rel[count] if count < len(rel) else int(count),
+                     attention_p=x[:3], relaxation_p=x[3:])
+    elif kind == GESTURE:
+        gestures = meta.get('gestures', [])
+        n = min(count, 3)
+        event.update(gesture=gestures[code] if code < len(gestures) else int(code), blinks=int(count),
+                     strengths=x[:n], fuzzy=x[3:3 + n], actuator=ACTUATOR_NAMES.get(actuator), value=int(value))
+    elif kind == ACTUATION:
+        event.update(actuator=ACTUATOR_NAMES.get(actuator), value=int(value), sent=bool(code))
+    return event
+# -
@@ -0,0 +1,78 @@
+import os
+import hashlib
+import numpy as np
+
+# +
+
+def grid_axis(lo, hi, step):
+    """Regular axis covering [lo, hi] whose nodes are exact integer multiples of `step`."""
+    k0 = int(np.floor(lo / step + 1e-9))
+    k1 = int(np.ceil(hi / step - 1e-9))
+    return np.arange(k0, k1 + 1) * step
+
+
+class LookupTable:
+    """Dense 1-D or 2-D table on regular axes with (bi)linear interpolation, clipped to the axis bounds."""
+
+    def __init__(self, axes, values):
+        self.axes = [np.asarray(a, dtype=float) for a in axes]
+        self.values = np.asarray(values, dtype=float)
+
+    def _locate(self, axis, x):
+        step = axis[1] - axis[0]
+        pos = (np.clip(x, axis[0], axis[-1]) - axis[0]) / step
+        i = np.minimum(pos.astype(int), len(axis) - 2)
+        return i, pos - i
+
+    def __call__(self, *coords):
+        coords = [np.asarray(c, dtype=float) for c in coords]
+        if len(self.axes) == 1:
+            return np.interp(coords[0], self.axes[0], self.values)
+        i, t = self._locate(self.axes[0], coords[0])
+        j, u = self._locate(self.axes[1], coords[1])
+        v = self.values
+        top = v[i, j] * (1 - u) + v[i, j + 1] * u
+        bottom = v[i + 1, j] * (1 - u) + v[i + 1, j + 1] * u
+        return top * (1 - t) + bottom * t
+
+
+def evaluate_grid(fn, *axes, fill=0.0):
+    """Evaluate a scalar function on every grid node; nodes where it raises get `fill`."""
+    shape = tuple(len(a) for a in axes)
+    values = np.empty(shape)
+    for idx in np.ndindex(*shape):
+        try:
+            values[idx] = fn(*(a[k] for a, k in zip(axes, idx)))
+        except Exception:
+            values[idx] = fill
+    return values
+
+
+def source_key(source_file, **params):
+    """Cache key from the fuzzy module's source and the table parameters."""
+    h = hashlib.sha256()
+    with open(source_file, 'rb') as f:
+        h.update(f.read())
+    h.update(repr(sorted(params.items())).encode())
+    return h.hexdigest()
+
+
+def load_tables(path, key):
+    """Return the cached arrays at `path` if they were built for `key`, else None."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as data:
+            if str(data['key']) != key:
+                return None
+            return {name: data[name] for name in data.files}
+    except Exception:
+        return None
+
+
+def save_tables(path, key, **arrays):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp.npz'
+    np.savez(tmp, key=key, **arrays)
+    os.replace(tmp, path)
+# -
@@ -0,0 +1,492 @@
+import os
+import json
+import time
+import hashlib
+import numpy as np
+
+# +
+BACKENDS = ('keras', 'tf_function', 'tflite', 'numpy')
+
+
+def _as_list(inputs):
+    if isinstance(inputs, (list, tuple)):
+        return [np.asarray(x, dtype=np.float32) for x in inputs]
+    return [np.asarray(inputs, dtype=np.float32)]
+
+
+def _unwrap(outputs):
+    # Same convention as keras predict: a bare array for single-output models
+    return outputs[0] if len(outputs) == 1 else outputs
+
+
+def load_keras_model(path, custom_objects=None):
+    """Load a .h5 model for inference only (no optimizer, loss or metrics)."""
+    import tensorflow as tf
+    return tf.keras.models.load_model(path, custom_objects=custom_objects, compile=False)
+
+
+def inference_clone(model):
+    """
+    Rebuild a model with its LSTMs unrolled and dropout removed, sharing the trained weights.
+    Outputs are unchanged at inference, but the graph has static loops, which TFLite needs.
+    """
+    config = model.get_config()
+
+    def strip(node):
+        if isinstance(node, dict):
+            if node.get('class_name') == 'LSTM':
+                node['config'].update(dropout=0.0, recurrent_dropout=0.0, unroll=True)
+            for v in node.values():
+                strip(v)
+        elif isinstance(node, list):
+            for v in node:
+                strip(v)
+
+    strip(config)
+    clone = model.__class__.from_config(config)
+    clone.set_weights(model.get_weights())
+    return clone
+
+
+class KerasBackend:
+    """Reference backend: plain keras model.predict."""
+
+    name = 'keras'
+
+    def __init__(self, path, custom_objects=None):
+        self.model = load_keras_model(path, custom_objects)
+
+    def predict(self, inputs):
+        return self.model.predict(inputs, verbose=0)
+
+
+class TFFunctionBackend:
+    """Model call traced once into a tf.function with a fixed (batch-free) input signature."""
+
+    name = 'tf_function'
+
+    def __init__(self, path, custom_objects=None):
+        import tensorflow as tf
+        self.model = load_keras_model(path, custom_objects)
+        specs = [tf.TensorSpec((None,) + tuple(x.shape[1:]), tf.float32) for x in self.model.inputs]
+        n_inputs = len(specs)
+
+        def forward(*xs):
+            return self.model(list(xs) if n_inputs > 1 else xs[0], training=False)
+
+        self._fn = tf.function(forward, input_signature=specs)
+
+    def predict(self, inputs):
+        outputs = self._fn(*_as_list(inputs))
+        if isinstance(outputs, (list, tuple)):
+            return _unwrap([o.numpy() for o in outputs])
+        return outputs.numpy()
+
+
+def convert_to_tflite(path, custom_objects=None, optimizations=None, representative_data=None,
+                      supported_types=None, int8=False):
+    """Convert a .h5 model to a TFLite flatbuffer and return the bytes."""
+    import tensorflow as tf
+    converter = tf.lite.TFLiteConverter.from_keras_model(inference_clone(load_keras_model(path, custom_objects)))
+    if optimizations:
+        converter.optimizations = optimizations
+    if representative_data is not None:
+        converter.representative_dataset = representative_data
+    if supported_types:
+        converter.target_spec.supported_types = supported_types
+    if int8:
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    return converter.convert()
+
+
+class TFLiteBackend:
+    """TFLite interpreter over a converted .h5 model (or an existing .tflite file)."""
+
+    name = 'tflite'
+
+    def __init__(self, path, custom_objects=None, model_content=None, num_threads=1):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+        if model_content is None:
+            if path.endswith('.tflite'):
+                with open(path, 'rb') as f:
+                    model_content = f.read()
+            else:
+                model_content = convert_to_tflite(path, custom_objects)
+        self.model_content = model_content
+        self.interpreter = Interpreter(model_content=model_content, num_threads=num_threads)
+        self.runner = self.interpreter.get_signature_runner()
+        self._inputs = self.runner.get_input_details()
+        self._outputs = sorted(self.runner.get_output_details())
+
+    def _feed(self, xs):
+        # Signature inputs are keyed by layer name; the models' inputs differ in shape
+        feed = {}
+        for x in xs:
+            for name, detail in self._inputs.items():
+                if name not in feed and tuple(detail['shape'][1:]) == x.shape[1:]:
+                    scale, zero_point = detail['quantization']
+                    if scale:
+                        x = np.round(x / scale + zero_point)
+                    feed[name] = x.astype(detail['dtype'])
+                    break
+        return feed
+
+    def predict(self, inputs):
+        results = self.runner(**self._feed(_as_list(inputs)))
+        outputs = []
+        for name in self._outputs:
+            y = results[name]
+            scale, zero_point = self.runner.get_output_details()[name]['quantization']
+            if scale:
+                y = (y.astype(np.float32) - zero_point) * scale
+            outputs.append(y)
+        return _unwrap(outputs)
+
+
+# ===== Pure NumPy forward pass =====
+
+def _sigmoid(x):
+    # exp(-|x|) cannot overflow, so large gate pre-activations give no RuntimeWarning
+    e = np.exp(-np.abs(x))
+    return np.where(x >= 0, 1.0 / (1.0 + e), e / (1.0 + e))
+
+
+def _softmax(x):
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+_ACTIVATIONS = {
+    'linear': lambda x: x,
+    None: lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'tanh': np.tanh,
+    'sigmoid': _sigmoid,
+    'softmax': _softmax,
+}
+
+
+def _inbound(layer_cfg):
+    """Names of the layers feeding a layer, for both Keras 3 and legacy .h5 configs."""
+    names = []
+
+    def walk(node):
+        if isinstance(node, dict):
+            if 'keras_history' in node.get('config', {}):
+                names.append(node['config']['keras_history'][0])
+                return
+            for v in node.values():
+                if isinstance(v, (list, dict)):
+                    walk(v)
+        elif isinstance(node, list):
+            if len(node) >= 3 and isinstance(node[0], str) and isinstance(node[1], int):
+                names.append(node[0])
+            else:
+                for v in node:
+                    walk(v)
+
+    walk(layer_cfg['inbound_nodes'])
+    return names
+
+
+class NumpyBackend:
+    """
+    Forward pass of the CNN-BiLSTM models in float32 NumPy, built from the .h5 config
+    and weights with h5py only (no TensorFlow import). Supports the layers the two
+    models use: Conv1D, BatchNormalization, MaxPooling1D, Dropout, Bidirectional(LSTM),
+    LSTM, Dense and Concatenate.
+    """
+
+    name = 'numpy'
+
+    def __init__(self, path, custom_objects=None, weights=None, config=None):
+        if config is None or weights is None:
+            config, weights = self.read_h5(path, weights)
+        self.config = config
+        self.weights = weights
+        self.input_names = [x[0] for x in config['input_layers']]
+        outputs = config['output_layers']
+        self.output_names = [x[0] for x in (outputs if isinstance(outputs[0], list) else [outputs])]
+        self.layers = []
+        for layer in config['layers']:
+            name = layer['config']['name']
+            if layer['class_name'] == 'InputLayer':
+                continue
+            op = self._make_op(layer['class_name'], layer['config'], weights.get(name, []))
+            self.layers.append((name, op, _inbound(layer)))
+
+    @staticmethod
+    def read_h5(path, weights=None):
+        """Model config and per-layer float32 weights from a .h5 file."""
+        import h5py
+        with h5py.File(path, 'r') as f:
+            config = json.loads(f.attrs['model_config'])['config']
+            if weights is None:
+                weights = {}
+                group = f['model_weights'] if 'model_weights' in f else f
+                for layer in config['layers']:
+                    name = layer['config']['name']
+                    if name in group:
+                        names = [n.decode() if isinstance(n, bytes) else n
+                                 for n in group[name].attrs.get('weight_names', [])]
+                        weights[name] = [np.asarray(group[name][n], dtype=np.float32) for n in names]
+        return config, weights
+
+    def _make_op(self, kind, cfg, w):
+        if kind == 'Dense':
+            kernel, bias = w[0], (w[1] if cfg.get('use_bias', True) else 0)
+            act = _ACTIVATIONS[cfg.get('activation')]
+            return lambda x: act(x @ kernel + bias)
+        if kind == 'Conv1D':
+            return self._conv1d(cfg, w)
+        if kind == 'BatchNormalization':
+            w = list(w)
+            gamma = w.pop(0) if cfg.get('scale', True) else 1.0
+            beta = w.pop(0) if cfg.get('center', True) else 0.0
+            mean, var = w
+            scale = (gamma / np.sqrt(var + np.float32(cfg['epsilon']))).astype(np.float32)
+            shift = (beta - mean * scale).astype(np.float32)
+            return lambda x: x * scale + shift
+        if kind == 'MaxPooling1D':
+            pool = cfg['pool_size'][0] if isinstance(cfg['pool_size'], list) else cfg['pool_size']
+            strides = cfg.get('strides') or pool
+            strides = strides[0] if isinstance(strides, list) else strides
+            if strides != pool or cfg.get('padding', 'valid') != 'valid':
+                raise ValueError("NumPy backend only supports non-overlapping 'valid' MaxPooling1D")
+            return lambda x: x[:, :x.shape[1] // pool * pool].reshape(
+                x.shape[0], x.shape[1] // pool, pool, x.shape[2]).max(axis=2)
+        if kind in ('Dropout', 'SpatialDropout1D', 'GaussianNoise'):
+            return lambda x: x
+        if kind == 'Activation':
+            return _ACTIVATIONS[cfg['activation']]
+        if kind == 'Concatenate':
+            axis = cfg.get('axis', -1)
+            return lambda *xs: np.concatenate(xs, axis=axis)
+        if kind == 'LSTM':
+            return self._lstm(cfg, w[0], w[1], w[2] if cfg.get('use_bias', True) else None)
+        if kind == 'Bidirectional':
+            if cfg.get('merge_mode', 'concat') != 'concat':
+                raise ValueError("NumPy backend only supports merge_mode='concat'")
+            fwd_cfg = cfg['layer']['config']
+            bwd_cfg = cfg.get('backward_layer', cfg['layer'])['config']
+            n = 3 if fwd_cfg.get('use_bias', True) else 2
+            fwd = self._lstm(fwd_cfg, *w[:n])
+            bwd = self._lstm(dict(bwd_cfg, go_backwards=True), *w[n:2 * n])
+            return lambda x: np.concatenate([fwd(x), bwd(x)], axis=-1)
+        raise ValueError(f"NumPy backend does not support layer type {kind}")
+
+    def _conv1d(self, cfg, w):
+        kernel = w[0]
+        bias = w[1] if cfg.get('use_bias', True) else 0
+        k = kernel.shape[0]
+        strides = cfg.get('strides', [1])
+        dilation = cfg.get('dilation_rate', [1])
+        if (strides[0] if isinstance(strides, list) else strides) != 1 or \
+                (dilation[0] if isinstance(dilation, list) else dilation) != 1:
+            raise ValueError("NumPy backend only supports Conv1D with stride 1 and no dilation")
+        act = _ACTIVATIONS[cfg.get('activation')]
+        pad = (k - 1) // 2, k - 1 - (k - 1) // 2
+        flat_kernel = kernel.reshape(-1, kernel.shape[-1])
+        same = cfg.get('padding', 'valid') == 'same'
+
+        def conv(x):
+            if same:
+                x = np.pad(x, ((0, 0), pad, (0, 0)))
+            # (batch, steps, k, channels) windows flattened against the (k*channels, filters) kernel
+            windows = np.lib.stride_tricks.sliding_window_view(x, k, axis=1).transpose(0, 1, 3, 2)
+            return act(windows.reshape(x.shape[0], windows.shape[1], -1) @ flat_kernel + bias)
+
+        return conv
+
+    def _lstm(self, cfg, kernel, recurrent_kernel, bias=None):
+        act = _ACTIVATIONS[cfg.get('activation', 'tanh')]
+        rec_act = _ACTIVATIONS[cfg.get('recurrent_activation', 'sigmoid')]
+        units = recurrent_kernel.shape[0]
+        backwards = cfg.get('go_backwards', False)
+        return_sequences = cfg.get('return_sequences', False)
+        bias = np.zeros(4 * units, np.float32) if bias is None else bias
+
+        def lstm(x):
+            if backwards:
+                x = x[:, ::-1]
+            batch, steps, _ = x.shape
+            # Input projection for all timesteps at once; only the recurrence is sequential
+            xw = x @ kernel + bias
+            h = np.zeros((batch, units), np.float32)
+            c = np.zeros((batch, units), np.float32)
+            seq = np.empty((batch, steps, units), np.float32) if return_sequences else None
+            for t in range(steps):
+                z = xw[:, t] + h @ recurrent_kernel
+                i = rec_act(z[:, :units])
+                f = rec_act(z[:, units:2 * units])
+                c = f * c + i * act(z[:, 2 * units:3 * units])
+                h = rec_act(z[:, 3 * units:]) * act(c)
+                if return_sequences:
+                    seq[:, t] = h
+            if not return_sequences:
+                return h
+            return seq[:, ::-1] if backwards else seq
+
+        return lstm
+
+    def predict(self, inputs):
+        values = dict(zip(self.input_names, _as_list(inputs)))
+        for name, op, inbound in self.layers:
+            values[name] = op(*(values[n] for n in inbound))
+        return _unwrap([values[n] for n in self.output_names])
+
+
+_BACKEND_CLASSES = {
+    'keras': KerasBackend,
+    'tf_function': TFFunctionBackend,
+    'tflite': TFLiteBackend,
+    'numpy': NumpyBackend,
+}
+
+
+def load_backend(path, kind='numpy', custom_objects=None):
+    """Load a model file behind the requested inference backend."""
+    if kind not in _BACKEND_CLASSES:
+        raise ValueError(f"Unknown inference backend '{kind}', expected one of {BACKENDS}")
+    return _BACKEND_CLASSES[kind](path, custom_objects=custom_objects)
+
+
+# ===== Startup: cached inference artifacts and warm-up =====
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _cache_path(path, kind, digest, ext, cache_dir):
+    cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(path)), '.cache')
+    os.makedirs(cache_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, f"{stem}.{kind}.{digest[:16]}{ext}")
+
+
+def _write_atomic(path, data):
+    tmp = f'{path}.{os.getpid()}.tmp'  # workers may fill the same cache at once
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _load_numpy_cached(path, cache_file):
+    if os.path.exists(cache_file):
+        try:
+            with np.load(cache_file) as data:
+                config = json.loads(str(data['config']))
+                weights = {}
+                for key in data.files:
+                    if key != 'config':
+                        layer, i = key.rsplit('/', 1)
+                        weights.setdefault(layer, []).append((int(i), data[key]))
+            weights = {k: [w for _, w in sorted(v, key=lambda p: p[0])] for k, v in weights.items()}
+            return NumpyBackend(path, config=config, weights=weights)
+        except Exception:
+            pass
+    config, weights = NumpyBackend.read_h5(path)
+    arrays = {f"{layer}/{i}": w for layer, ws in weights.items() for i, w in enumerate(ws)}
+    tmp = f'{cache_file}.{os.getpid()}.tmp.npz'  # as _write_atomic: workers may fill it at once
+    np.savez(tmp, config=json.dumps(config), **arrays)
+    os.replace(tmp, cache_file)
+    return NumpyBackend(path, config=config, weights=weights)
+
+
+def load_cached_backend(path, kind='numpy', cache_dir=None):
+    """
+    load_backend for startup. The inference-ready artifact (NumPy weights for 'numpy', the
+    TFLite flatbuffer for 'tflite') is cached next to the model under .cache/, keyed by the
+    model file's hash, so a restart neither parses the .h5 weights nor imports TensorFlow to
+    convert it. Models are always loaded with compile=False, so loss objects (e.g. the blink
+    model's focal loss) are never needed. 'keras' and 'tf_function' need TensorFlow anyway
+    and load uncached.
+    """
+    if kind not in _BACKEND_CLASSES:
+        raise ValueError(f"Unknown inference backend '{kind}', expected one of {BACKENDS}")
+    if kind == 'numpy':
+        return _load_numpy_cached(path, _cache_path(path, kind, file_hash(path), '.npz', cache_dir))
+    if kind == 'tflite' and not path.endswith('.tflite'):
+        cache_file = _cache_path(path, kind, file_hash(path), '.tflite', cache_dir)
+        if os.path.exists(cache_file):
+            with open(cache_file, 'rb') as f:
+                return TFLiteBackend(path, model_content=f.read())
+        backend = TFLiteBackend(path)
+        _write_atomic(cache_file, backend.model_content)
+        return backend
+    return load_backend(path, kind)
+
+
+def warm_up(backend, path, batch=1, runs=2):
+    """Run a few throwaway predicts so tracing and allocation happen before the first real input."""
+    x = random_inputs(path, batch=batch)
+    for _ in range(runs):
+        backend.predict(x)
+
+
+def random_inputs(path, batch=1, seed=0):
+    """Standard-normal inputs shaped like the model's inputs (scaled features look like this)."""
+    import h5py
+    with h5py.File(path, 'r') as f:
+        config = json.loads(f.attrs['model_config'])['config']
+    rng = np.random.default_rng(seed)
+    shapes = {}
+    for layer in config['layers']:
+        if layer['class_name'] == 'InputLayer':
+            cfg = layer['config']
+            shape = cfg.get('batch_shape') or cfg.get('batch_input_shape')
+            shapes[cfg['name']] = tuple(shape[1:])
+    xs = [rng.standard_normal((batch,) + shapes[x[0]]).astype(np.float32) for x in config['input_layers']]
+    return xs[0] if len(xs) == 1 else xs
+
+
+def check_parity(backend, reference, inputs, atol=1e-4):
+    """Max absolute difference between two backends' outputs; raises if it exceeds `atol`."""
+    out = _as_list(backend.predict(inputs))
+    ref = _as_list(reference.predict(inputs))
+    diff = max(float(np.max(np.abs(a - b))) for a, b in zip(out, ref))
+    if diff > atol:
+        raise AssertionError(f"{backend.name} backend differs from {reference.name} by {diff:.2e} (atol {atol:.0e})")
+    return diff
+
+
+def time_predict(backend, inputs, repeats=200):
+    """Median single-call latency in milliseconds."""
+    backend.predict(inputs)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        backend.predict(inputs)
+        times.append(time.perf_counter() - start)
+    return 1000 * float(np.median(times))
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Compare inference backends against keras predict")
+    parser.add_argument('model', help=".h5 model file")
+    parser.add_argument('--backends', nargs='+', default=['tf_function', 'tflite', 'numpy'], choices=BACKENDS)
+    parser.add_argument('--atol', type=float, default=1e-4)
+    parser.add_argument('--batch', type=int, default=1)
+    args = parser.parse_args()
+
+    x = random_inputs(args.model, batch=args.batch)
+    reference = KerasBackend(args.model)
+    print(f"keras        {time_predict(reference, x, 50):8.3f} ms")
+    for kind in args.backends:
+        backend = load_backend(args.model, kind)
+        try:
+            diff = check_parity(backend, reference, x, args.atol)
+            status = f"max|Δ|={diff:.1e}"
+        except AssertionError as e:
+            status = f"PARITY FAIL: {e}"
+        print(f"{kind:12s} {time_predict(backend, x):8.3f} ms  {status}")
+# -
@@ -0,0 +1,297 @@
+import os
+import json
+import time
+import threading
+import numpy as np
+
+# +
+# HDR-style log-linear buckets over integer microseconds: values below 2*SUB are exact,
+# above that every power of two is split into SUB linear buckets (~1.6% relative error).
+SUB_BITS = 6
+SUB = 1 << SUB_BITS
+N_BUCKETS = 2 * SUB + 40 * SUB
+
+
+def bucket_index(us):
+    if us < 2 * SUB:
+        return us
+    shift = us.bit_length() - SUB_BITS - 1
+    return min(2 * SUB + (shift - 1) * SUB + ((us >> shift) - SUB), N_BUCKETS - 1)
+
+
+def bucket_value(index):
+    """Upper edge (µs) of a bucket, so reported percentiles never understate the latency."""
+    if index < 2 * SUB:
+        return index
+    shift, sub = divmod(index - 2 * SUB, SUB)
+    shift += 1
+    return ((SUB + sub + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """Counts of microsecond latencies in log-linear buckets, plus exact count/sum/max."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # Plain list: a Python int increment is several times cheaper than a numpy scalar one
+        self.counts = [0] * N_BUCKETS
+        self.n = 0
+        self.total_us = 0
+        self.max_us = 0
+
+    def record_us(self, us):
+        self.counts[bucket_index(us)] += 1
+        self.n += 1
+        self.total_us += us
+        if us > self.max_us:
+            self.max_us = us
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.n += other.n
+        self.total_us += other.total_us
+        self.max_us = max(self.max_us, other.max_us)
+
+    def percentile(self, q):
+        if not self.n:
+            return 0
+        rank = max(1, int(np.ceil(q / 100.0 * self.n)))
+        idx = int(np.searchsorted(np.cumsum(self.counts), rank))
+        return min(bucket_value(idx), self.max_us)
+
+    def summary(self):
+        """Latency stats in milliseconds."""
+        return {
+            'count': self.n,
+            'mean_ms': self.total_us / self.n / 1e3 if self.n else 0.0,
+            'p50_ms': self.percentile(50) / 1e3,
+            'p99_ms': self.percentile(99) / 1e3,
+            'max_ms': self.max_us / 1e3,
+        }
+
+
+class RollingHistogram:
+    """
+    LatencyHistogram over the last `window` seconds, kept as `slices` rotating sub-histograms.
+    Times are perf_counter_ns() readings, the clock the spans already use.
+    """
+
+    def __init__(self, window=60.0, slices=6):
+        self.slice_len = int(window / slices * 1e9)
+        self.slices = [LatencyHistogram() for _ in range(slices)]
+        self.current = 0
+        self.slice_start = time.perf_counter_ns()
+        self.lifetime_n = 0
+
+    def _rotate(self, now):
+        while now - self.slice_start >= self.slice_len:
+            self.current = (self.current + 1) % len(self.slices)
+            self.slices[self.current].reset()
+            self.slice_start += self.slice_len
+            if now - self.slice_start > self.slice_len * len(self.slices):
+                # Idle for longer than the whole window: everything is stale
+                for h in self.slices:
+                    h.reset()
+                self.slice_start = now
+
+    def record_us(self, us, now_ns=None):
+        now_ns = time.perf_counter_ns() if now_ns is None else now_ns
+        if now_ns - self.slice_start >= self.slice_len:
+            self._rotate(now_ns)
+        self.slices[self.current].record_us(us)
+        self.lifetime_n += 1
+
+    def merged(self):
+        self._rotate(time.perf_counter_ns())
+        h = LatencyHistogram()
+        for s in self.slices:
+            h.merge(s)
+        return h
+
+
+class _Span:
+    __slots__ = ('instr', 'stage', 'start')
+
+    def __init__(self, instr, stage):
+        self.instr = instr
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.instr.observe(self.stage, self.start)
+        return False
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class StartupTimer:
+    """Wall-clock breakdown of a controller's startup, printed once when it is ready."""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def stage(self, name):
+        return _StartupStage(self, name)
+
+    def report(self):
+        total = time.perf_counter() - self.started
+        parts = [f"{name} {sec * 1e3:.0f}ms" for name, sec in self.stages.items()]
+        print(f"[Startup:{self.name}] " + " | ".join(parts + [f"ready in {total * 1e3:.0f}ms"]))
+        return total
+
+
+class _StartupStage:
+    __slots__ = ('timer', 'name', 'start')
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        stages = self.timer.stages
+        stages[self.name] = stages.get(self.name, 0.0) + time.perf_counter() - self.start
+        return False
+
+
+class Instrumentation:
+    """
+    Stage latencies, counters and gauges for one controller.
+
+    Spans use the monotonic perf_counter_ns clock and land in rolling histograms (p50/p99/max
+    over the last `window` seconds). tick() is meant to be called from the main loop: every
+    `report_interval` seconds it prints a one-line summary and, if `snapshot_path` is set,
+    rewrites a JSON snapshot (or Prometheus text format when the path ends in .prom or .txt).
+    Recording may happen on any thread (actuator writer, pipeline stages, executors); a lock
+    guards the entries, and snapshots copy them under it.
+    """
+
+    def __init__(self, name, report_interval=0.0, snapshot_path=None, window=60.0, enabled=True):
+        self.name = name
+        self.report_interval = report_interval
+        self.snapshot_path = snapshot_path
+        self.window = window
+        self.enabled = enabled
+        self.stages = {}
+        self.counters = {}
+        self.gauges = {}
+        self.started = time.monotonic()
+        self._last_tick = self.started
+        self._last_counts = {}
+        self.rates = {}
+        self._lock = threading.Lock()
+
+    # ---- Recording ----
+    def span(self, stage):
+        return _Span(self, stage) if self.enabled else _NO_SPAN
+
+    def observe(self, stage, start_ns, end_ns=None):
+        """Record the time since `start_ns` (a perf_counter_ns() reading) under `stage`."""
+        if not self.enabled:
+            return
+        end_ns = time.perf_counter_ns() if end_ns is None else end_ns
+        with self._lock:
+            hist = self.stages.get(stage)
+            if hist is None:
+                hist = self.stages[stage] = RollingHistogram(self.window)
+            hist.record_us(max(0, (end_ns - start_ns) // 1000), end_ns)
+
+    def count(self, counter, n=1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    # ---- Reporting ----
+    def tick(self, force=False):
+        now = time.monotonic()
+        elapsed = now - self._last_tick
+        if not force and (self.report_interval <= 0 or elapsed < self.report_interval):
+            return
+        with self._lock:
+            counters = dict(self.counters)
+        if elapsed > 0:
+            self.rates = {f"{k}_per_s": (v - self._last_counts.get(k, 0)) / elapsed for k, v in counters.items()}
+        self._last_counts = counters
+        self._last_tick = now
+        print(self.format_summary())
+        if self.snapshot_path:
+            self.write_snapshot()
+
+    def final_report(self):
+        """Summary (and snapshot) on shutdown, if reporting was requested at all."""
+        if self.report_interval > 0 or self.snapshot_path:
+            self.tick(force=True)
+
+    def snapshot(self):
+        with self._lock:
+            merged = {stage: h.merged() for stage, h in self.stages.items()}
+            counters, gauges = dict(self.counters), dict(self.gauges)
+        return {
+            'name': self.name,
+            'uptime_s': time.monotonic() - self.started,
+            'window_s': self.window,
+            'stages': {stage: h.summary() for stage, h in merged.items()},
+            'counters': counters,
+            'rates': dict(self.rates),
+            'gauges': gauges,
+        }
+
+    def format_summary(self):
+        snap = self.snapshot()
+        parts = [f"{k} {v:.1f}" for k, v in snap['rates'].items()]
+        parts += [f"{k} {v}" for k, v in snap['counters'].items() if not k.startswith('packets')]
+        for stage, s in snap['stages'].items():
+            if s['count']:
+                parts.append(f"{stage} p50 {s['p50_ms']:.2f} p99 {s['p99_ms']:.2f} max {s['max_ms']:.2f}ms")
+        return f"[Metrics:{self.name}] " + " | ".join(parts)
+
+    def to_prometheus(self):
+        snap = self.snapshot()
+        prefix = 'bci_'
+        label = f'controller="{self.name}"'
+        lines = [f"# TYPE {prefix}stage_latency_seconds summary"]
+        for stage, s in snap['stages'].items():
+            for q, key in (('0.5', 'p50_ms'), ('0.99', 'p99_ms'), ('1', 'max_ms')):
+                lines.append(f'{prefix}stage_latency_seconds{{{label},stage="{stage}",quantile="{q}"}} {s[key] / 1e3:.6f}')
+            lines.append(f'{prefix}stage_latency_seconds_count{{{label},stage="{stage}"}} {s["count"]}')
+        for counter, value in snap['counters'].items():
+            lines.append(f"# TYPE {prefix}{counter}_total counter")
+            lines.append(f"{prefix}{counter}_total{{{label}}} {value}")
+        for gauge, value in list(snap['rates'].items()) + list(snap['gauges'].items()):
+            lines.append(f"# TYPE {prefix}{gauge} gauge")
+            lines.append(f"{prefix}{gauge}{{{label}}} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_snapshot(self, path=None):
+        path = path or self.snapshot_path
+        if path.endswith(('.prom', '.txt')):
+            text = self.to_prometheus()
+        else:
+            text = json.dumps(self.snapshot(), indent=2)
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(text)
+        os.replace(tmp, path)
+# -
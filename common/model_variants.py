@@ -0,0 +1,145 @@
+import os
+import json
+import shutil
+import numpy as np
+
+from inference import NumpyBackend, TFLiteBackend, convert_to_tflite, load_backend, load_cached_backend
+
+# +
+# float32 is the shipped .h5. The others are built by tools/optimize_models.py into
+# variants/ next to the model: NumPy weight archives (.npz), TFLite flatbuffers (.tflite),
+# and for the pruned variants also a pruned copy of the .h5.
+VARIANTS = ('float32', 'float16', 'int8', 'pruned', 'pruned_int8')
+VARIANT_DIR = 'variants'
+
+
+def variant_path(path, variant, ext):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(os.path.dirname(os.path.abspath(path)), VARIANT_DIR, f"{stem}.{variant}{ext}")
+
+
+def _is_kernel(w):
+    # Conv/Dense/LSTM kernels; biases and BatchNormalization vectors stay float32
+    return w.ndim >= 2
+
+
+def prune_weights(weights, sparsity):
+    """Magnitude pruning: the smallest `sparsity` fraction of every kernel set to zero."""
+    pruned = {}
+    for layer, ws in weights.items():
+        pruned[layer] = []
+        for w in ws:
+            if _is_kernel(w) and sparsity > 0:
+                threshold = np.quantile(np.abs(w), sparsity)
+                w = np.where(np.abs(w) < threshold, 0, w).astype(np.float32)
+            pruned[layer].append(w)
+    return pruned
+
+
+def quantize_int8(w):
+    """Symmetric per-output-channel int8: w ≈ q * scale, scale over every axis but the last."""
+    axes = tuple(range(w.ndim - 1))
+    scale = (np.abs(w).max(axis=axes) / 127.0).astype(np.float32)
+    scale[scale == 0] = 1.0
+    q = np.clip(np.round(w / scale), -127, 127).astype(np.int8)
+    return q, scale
+
+
+def save_numpy_variant(out, config, weights, variant):
+    """Write a NumPy variant archive (compressed, so pruned zeros cost next to nothing)."""
+    arrays = {}
+    for layer, ws in weights.items():
+        for i, w in enumerate(ws):
+            key = f"{layer}/{i}"
+            if not _is_kernel(w) or variant in ('float32', 'pruned'):
+                arrays[key] = w
+            elif variant == 'float16':
+                arrays[key] = w.astype(np.float16)
+            else:
+                arrays[key], arrays[key + '.scale'] = quantize_int8(w)
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    tmp = out + '.tmp.npz'
+    np.savez_compressed(tmp, config=json.dumps(config), variant=variant, **arrays)
+    os.replace(tmp, out)
+
+
+def load_numpy_variant(path, variant_file):
+    """NumpyBackend over a variant archive; weights are expanded back to float32 for the forward pass."""
+    with np.load(variant_file) as data:
+        config = json.loads(str(data['config']))
+        weights = {}
+        for key in data.files:
+            if key in ('config', 'variant') or key.endswith('.scale'):
+                continue
+            w = data[key]
+            if w.dtype == np.int8:
+                w = w.astype(np.float32) * data[key + '.scale']
+            layer, i = key.rsplit('/', 1)
+            weights.setdefault(layer, []).append((int(i), w.astype(np.float32)))
+    weights = {k: [w for _, w in sorted(v, key=lambda p: p[0])] for k, v in weights.items()}
+    return NumpyBackend(path, config=config, weights=weights)
+
+
+def write_pruned_h5(path, out, weights):
+    """Copy of the .h5 with its weights replaced by `weights` (same layers and order as read_h5)."""
+    import h5py
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    shutil.copyfile(path, out)
+    with h5py.File(out, 'r+') as f:
+        group = f['model_weights'] if 'model_weights' in f else f
+        for layer, ws in weights.items():
+            names = [n.decode() if isinstance(n, bytes) else n for n in group[layer].attrs.get('weight_names', [])]
+            for name, w in zip(names, ws):
+                group[layer][name][...] = w
+
+
+def convert_tflite_variant(path, precision, calibration=None):
+    """
+    TFLite flatbuffer of the .h5 at `path` (the pruned .h5 for pruned variants) at `precision`
+    'float32', 'float16' (weights stored as half) or 'int8' (full-integer quantization
+    calibrated on `calibration`, a list of model inputs: arrays, or lists of arrays for
+    multi-input models).
+    """
+    import tensorflow as tf
+    if precision == 'float32':
+        return convert_to_tflite(path)
+    if precision == 'float16':
+        return convert_to_tflite(path, optimizations=[tf.lite.Optimize.DEFAULT],
+                                 supported_types=[tf.float16])
+    if not calibration:
+        raise ValueError("int8 quantization needs calibration windows")
+
+    def representative_data():
+        for x in calibration:
+            yield [np.asarray(a, dtype=np.float32) for a in (x if isinstance(x, list) else [x])]
+
+    return convert_to_tflite(path, optimizations=[tf.lite.Optimize.DEFAULT],
+                             representative_data=representative_data, int8=True)
+
+
+def load_variant(path, kind='numpy', variant='float32'):
+    """
+    The controllers' model loader: `variant` of the model at `path` behind backend `kind`.
+    float32 is the shipped model (through the startup cache); other variants must have been
+    built with tools/optimize_models.py. keras/tf_function can only load the pruned .h5.
+    """
+    if variant not in VARIANTS:
+        raise ValueError(f"Unknown model variant '{variant}', expected one of {VARIANTS}")
+    if variant == 'float32':
+        return load_cached_backend(path, kind)
+    if kind == 'numpy':
+        variant_file = variant_path(path, variant, '.npz')
+    elif kind == 'tflite':
+        variant_file = variant_path(path, variant, '.tflite')
+    elif variant == 'pruned':
+        variant_file = variant_path(path, variant, '.h5')
+    else:
+        raise ValueError(f"The {kind} backend cannot run the {variant} variant; use numpy or tflite")
+    if not os.path.exists(variant_file):
+        raise FileNotFoundError(f"{variant_file} not found; build it with tools/optimize_models.py")
+    if kind == 'numpy':
+        return load_numpy_variant(path, variant_file)
+    if kind == 'tflite':
+        return TFLiteBackend(variant_file)
+    return load_backend(variant_file, kind)
+# -
@@ -0,0 +1,150 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+# +
+class PacketBus:
+    """
+    Fans packets parsed once out to several consumers of one headset.
+
+    Plugins have a `name`, `fields` (the packet keys they want; None = every packet) and
+    on_packet(packet, received_ns). Plugins with on_rows(rows, received_ns) also get the host
+    band rows of raw mode, computed once for all of them. Plugins with deadlines of their own
+    provide timeout() (seconds, or None) and poll(); the reader blocks for at most
+    bus.timeout() and calls bus.poll() after every read. Each plugin sees the same packet
+    dict, so they must not modify it. Time spent in a plugin is recorded as stage
+    'plugin_<name>' on `instr`.
+    """
+
+    def __init__(self, instr=None):
+        self.instr = instr
+        self.plugins = []
+
+    def subscribe(self, plugin):
+        self.plugins.append(plugin)
+        return plugin
+
+    def publish(self, packets, received_ns):
+        for packet in packets:
+            for plugin in self.plugins:
+                if plugin.fields is None or any(f in packet for f in plugin.fields):
+                    t0 = time.perf_counter_ns()
+                    plugin.on_packet(packet, received_ns)
+                    self._observe(plugin, t0)
+
+    def publish_rows(self, rows, received_ns):
+        if not len(rows):
+            return
+        for plugin in self.plugins:
+            if hasattr(plugin, 'on_rows'):
+                t0 = time.perf_counter_ns()
+                plugin.on_rows(rows, received_ns)
+                self._observe(plugin, t0)
+
+    def timeout(self):
+        timeouts = [t for t in (p.timeout() for p in self.plugins if hasattr(p, 'timeout')) if t is not None]
+        return min(timeouts, default=None)
+
+    def poll(self):
+        for plugin in self.plugins:
+            if hasattr(plugin, 'poll'):
+                plugin.poll()
+
+    def _observe(self, plugin, t0):
+        if self.instr is not None:
+            self.instr.observe(f'plugin_{plugin.name}', t0)
+
+
+class InferenceExecutor:
+    """
+    One thread for every model call in the process, so models loaded side by side take
+    turns instead of competing for cores.
+
+    submit() queues a job and returns a Future. A job submitted with a `key` replaces that
+    key's job if it has not started yet, so a slow model only ever sees the newest window.
+    call() runs a job ahead of the queue and waits for it, for callers that cannot go on
+    without the result; called from the worker itself it simply runs inline.
+    """
+
+    def __init__(self, instr=None, name='inference'):
+        self.instr = instr
+        self._jobs = deque()     # (key, fn, args, future)
+        self._cond = threading.Condition()
+        self._closing = False
+        self.stats = {'jobs': 0, 'superseded': 0, 'errors': 0}
+        self._thread = threading.Thread(target=self._worker, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args, key=None, urgent=False):
+        future = Future()
+        with self._cond:
+            if self._closing:
+                raise RuntimeError("InferenceExecutor is closed")
+            if key is not None:
+                for i, job in enumerate(self._jobs):
+                    if job[0] == key:
+                        del self._jobs[i]
+                        job[3].cancel()
+                        self._count('superseded')
+                        break
+            job = (key, fn, args, future)
+            if urgent:
+                self._jobs.appendleft(job)
+            else:
+                self._jobs.append(job)
+            self._cond.notify()
+        return future
+
+    def call(self, fn, *args):
+        if threading.current_thread() is self._thread:
+            return fn(*args)
+        return self.submit(fn, *args, urgent=True).result()
+
+    def pending(self):
+        with self._cond:
+            return len(self._jobs)
+
+    def close(self, timeout=5.0):
+        """Finish the queued jobs, then stop the worker."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._jobs and not self._closing:
+                    self._cond.wait()
+                if not self._jobs:
+                    return
+                key, fn, args, future = self._jobs.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                self._count('errors')
+                future.set_exception(e)
+            self._count('jobs')
+
+    def _count(self, key):
+        self.stats[key] += 1
+        if self.instr is not None:
+            self.instr.count(f'executor_{key}')
+
+
+class ExecutorModel:
+    """A loaded model whose predict() runs on an InferenceExecutor (and waits for it)."""
+
+    def __init__(self, model, executor):
+        self.model = model
+        self.executor = executor
+
+    def predict(self, inputs):
+        return self.executor.call(self.model.predict, inputs)
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+# -
@@ -0,0 +1,256 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+import numpy as np
+
+# +
+BANDS = ['delta', 'theta', 'lowAlpha', 'highAlpha', 'lowBeta', 'highBeta', 'lowGamma', 'highGamma']
+
+# Packet columns, named like the data/ CSVs. Fields missing from a packet are stored as -1
+# (eSense, poorSignalLevel), NaN (bands) or 0 (blinkStrength, as in the CSVs).
+PACKET_COLUMNS = ([('time', '<f8'), ('attention', '<i2'), ('meditation', '<i2')]
+                  + [(band, '<f8') for band in BANDS]
+                  + [('blinkStrength', '<i2'), ('poorSignalLevel', '<i2')])
+
+# One record per committed chunk: its first row, row count and time bounds
+INDEX_DTYPE = np.dtype([('row', '<i8'), ('rows', '<i8'), ('t_first', '<f8'), ('t_last', '<f8')])
+META_FILE = 'meta.json'
+INDEX_FILE = 'index.bin'
+
+
+def new_session_path(root, name=''):
+    """root/YYYYmmdd-HHMMSS[-name], the directory a new recording goes to."""
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    return os.path.join(root, f"{stamp}-{name}" if name else stamp)
+
+
+def list_sessions(root):
+    """Recording directories under `root`, oldest first."""
+    if not os.path.isdir(root):
+        return []
+    return sorted(os.path.join(root, d) for d in os.listdir(root)
+                  if os.path.exists(os.path.join(root, d, META_FILE)))
+
+
+class SessionRecorder:
+    """
+    Append-only columnar recording of a controller's packets and feature rows.
+
+    A session is a directory with one flat little-endian file per column (`<name>.col`),
+    an index of committed chunks and meta.json with the column dtypes. append() writes
+    one record into an in-memory chunk; full chunks (or ones older than `flush_interval`
+    seconds) are handed to a writer thread, which appends every column and then the index
+    record. The live loop never touches the disk and never waits: if more than
+    `max_pending` chunks are queued, the newest one is dropped and counted instead.
+    Readers only trust rows covered by the index, so a recording stays readable while it
+    is written and after a crash.
+    """
+
+    def __init__(self, path, feature_cols=None, chunk_rows=256, flush_interval=1.0,
+                 max_pending=64, source='', instr=None):
+        columns = list(PACKET_COLUMNS)
+        if feature_cols:
+            columns.append(('features', '<f8', (len(feature_cols),)))
+        self.dtype = np.dtype(columns)
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.instr = instr
+        os.makedirs(path)
+        meta = {
+            'version': 1,
+            'created': time.time(),
+            'source': source,
+            'chunk_rows': chunk_rows,
+            'columns': [{'name': c[0], 'dtype': c[1], 'shape': list(c[2]) if len(c) > 2 else []}
+                        for c in columns],
+            'feature_cols': list(feature_cols or []),
+        }
+        with open(os.path.join(path, META_FILE), 'w') as f:
+            json.dump(meta, f, indent=1)
+        self._files = {name: open(os.path.join(path, f'{name}.col'), 'ab') for name in self.dtype.names}
+        self._index = open(os.path.join(path, INDEX_FILE), 'ab')
+
+        self._chunk = np.empty(chunk_rows, self.dtype)
+        self._n = 0
+        self._chunk_started = 0.0
+        self._free = deque()            # spare chunk buffers returned by the writer
+        self._queue = deque()           # (buffer, rows) waiting for the writer
+        self._wake = threading.Event()
+        self._closing = False
+        self.rows = 0                   # rows handed to the writer
+        self.committed = 0              # rows on disk and in the index
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._writer, name='session-recorder', daemon=True)
+        self._thread.start()
+
+    def append(self, packet, features=None, t=None):
+        """Record one packet (and its feature row); never blocks."""
+        if self._closing:
+            return
+        es = packet.get('eSense')
+        bp = packet.get('eegPower')
+        if self._n == 0:
+            self._chunk_started = time.monotonic()
+        row = [time.time() if t is None else t,
+               es.get('attention', -1) if es else -1,
+               es.get('meditation', -1) if es else -1]
+        row += [bp.get(band, np.nan) for band in BANDS] if bp else [np.nan] * len(BANDS)
+        row += [packet.get('blinkStrength', 0), packet.get('poorSignalLevel', -1)]
+        if 'features' in self.dtype.names:
+            row.append(np.nan if features is None else features)
+        self._chunk[self._n] = tuple(row)
+        self._n += 1
+        if self._n == self.chunk_rows or time.monotonic() - self._chunk_started >= self.flush_interval:
+            self._hand_off()
+
+    def flush(self):
+        """Hand the current partial chunk to the writer."""
+        if self._n:
+            self._hand_off()
+
+    def close(self, timeout=5.0):
+        self.flush()
+        self._closing = True
+        self._wake.set()
+        self._thread.join(timeout)
+        print(f"[Recorder] {self.committed} rows in {self.path}"
+              + (f" ({self.dropped} dropped)" if self.dropped else ""))
+
+    def _hand_off(self):
+        n = self._n
+        self._n = 0
+        if len(self._queue) >= self.max_pending:
+            self.dropped += n
+            if self.instr is not None:
+                self.instr.count('recorder_dropped_rows', n)
+            return
+        self._queue.append((self._chunk, n))
+        self._chunk = self._free.popleft() if self._free else np.empty(self.chunk_rows, self.dtype)
+        self.rows += n
+        self._wake.set()
+
+    def _writer(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            while self._queue:
+                chunk, n = self._queue[0]
+                self._write(chunk[:n])
+                self._queue.popleft()
+                self._free.append(chunk)
+            if self._closing and not self._queue:
+                break
+        for f in self._files.values():
+            f.close()
+        self._index.close()
+
+    def _write(self, records):
+        # Columns first, then the index record that makes them visible to readers
+        for name, f in self._files.items():
+            f.write(np.ascontiguousarray(records[name]).tobytes())
+            f.flush()
+        entry = np.array([(self.committed, len(records), records['time'][0], records['time'][-1])], INDEX_DTYPE)
+        self._index.write(entry.tobytes())
+        self._index.flush()
+        self.committed += len(records)
+        if self.instr is not None:
+            self.instr.count('recorded_rows', len(records))
+
+
+class SessionStore:
+    """
+    Read side of a recording: every column is a read-only np.memmap over its file, so
+    slices, time ranges and training windows are views into the page cache rather than
+    copies. Time lookups bisect the chunk index, then the time column inside one chunk,
+    and assume time does not run backwards. refresh() picks up chunks committed since
+    (a recording still being written can be followed).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        self.dtypes = {c['name']: (np.dtype(c['dtype']), tuple(c['shape'])) for c in self.meta['columns']}
+        self.columns = list(self.dtypes)
+        self.feature_cols = self.meta.get('feature_cols', [])
+        self.refresh()
+
+    def refresh(self):
+        self.index = np.fromfile(os.path.join(self.path, INDEX_FILE), INDEX_DTYPE)
+        # A torn last record (crash mid-write) is ignored by fromfile's whole-record read
+        self.rows = int(self.index['rows'].sum()) if len(self.index) else 0
+        self._maps = {}
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, name):
+        return self.column(name)
+
+    def column(self, name):
+        """Memory-mapped (rows, *shape) view of a column."""
+        if name not in self._maps:
+            dtype, shape = self.dtypes[name]
+            if self.rows == 0:
+                self._maps[name] = np.empty((0,) + shape, dtype)
+            else:
+                self._maps[name] = np.memmap(os.path.join(self.path, f'{name}.col'), dtype, mode='r',
+                                             shape=(self.rows,) + shape)
+        return self._maps[name]
+
+    def time_slice(self, t0=None, t1=None):
+        """slice of the rows with t0 <= time < t1."""
+        return slice(self._row_at(t0, 0), self._row_at(t1, self.rows))
+
+    def _row_at(self, t, default):
+        if t is None or not len(self.index):
+            return default
+        # First chunk that may hold t, then bisect the time column inside it
+        k = min(int(np.searchsorted(self.index['t_last'], t, 'left')), len(self.index) - 1)
+        start = int(self.index['row'][k])
+        stop = start + int(self.index['rows'][k])
+        return start + int(np.searchsorted(self.column('time')[start:stop], t, 'left'))
+
+    def range(self, t0=None, t1=None, columns=None):
+        """{column: view} for the rows recorded in [t0, t1)."""
+        rows = self.time_slice(t0, t1)
+        return {name: self.column(name)[rows] for name in (columns or self.columns)}
+
+    def windows(self, column='features', size=20, step=1, rows=slice(None)):
+        """
+        Zero-copy (k, size, *shape) view of every `size`-row window of a column (the model's
+        input layout for 'features'), e.g. windows(rows=store.time_slice(t0, t1)).
+        """
+        data = self.column(column)[rows]
+        if len(data) < size:
+            return np.empty((0, size) + data.shape[1:], data.dtype)
+        view = np.lib.stride_tricks.sliding_window_view(data, size, axis=0)[::step]
+        return np.moveaxis(view, -1, 1)
+
+    def packet(self, i):
+        """Row i as a ThinkGear-style packet (fields that were missing are left out)."""
+        return next(self.packets(slice(i, i + 1)))[1]
+
+    def packets(self, rows=slice(None), block=4096):
+        """(time, packet) for the given rows, read `block` rows at a time (e.g. for replay)."""
+        start, stop, _ = rows.indices(self.rows)
+        names = ['time', 'attention', 'meditation'] + BANDS + ['blinkStrength', 'poorSignalLevel']
+        for b in range(start, stop, block):
+            cols = [self.column(name)[b:min(b + block, stop)].tolist() for name in names]
+            for t, att, med, *rest in zip(*cols):
+                powers, (blink, signal) = rest[:len(BANDS)], rest[len(BANDS):]
+                packet = {}
+                if att >= 0 and med >= 0:
+                    packet['eSense'] = {'attention': att, 'meditation': med}
+                if powers[0] == powers[0]:  # not NaN
+                    packet['eegPower'] = {band: int(p) if p.is_integer() else p for band, p in zip(BANDS, powers)}
+                if blink > 0:
+                    packet['blinkStrength'] = blink
+                if signal >= 0:
+                    packet['poorSignalLevel'] = signal
+                yield t, packet
+# -
@@ -0,0 +1,253 @@
+import os
+import time
+import selectors
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# +
+class ShmRing:
+    """
+    Feature rows in shared memory for an inference process to read without copying.
+
+    Every row is written twice, at i and i + capacity, like BlinkWindowStore, so the
+    `window_size` rows ending at any row count are one contiguous (window_size, n_features)
+    view. A header holds the number of rows written, updated after the row itself. Rows
+    before the first write read as zeros. The ring is created by the controller (name=None)
+    and attached by name in the worker.
+    """
+
+    HEADER = 8
+
+    def __init__(self, n_features, window_size, capacity=256, name=None):
+        if capacity < window_size:
+            raise ValueError("ShmRing capacity must hold at least one window")
+        self.n_features = n_features
+        self.window_size = window_size
+        self.capacity = capacity
+        self.owner = name is None
+        size = self.HEADER + 2 * capacity * n_features * 8
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size)
+        self._count = np.ndarray((1,), np.int64, self.shm.buf, 0)
+        self.rows = np.ndarray((2 * capacity, n_features), np.float64, self.shm.buf, self.HEADER)
+        if self.owner:
+            self._count[0] = 0
+            self.rows[:] = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def count(self):
+        return int(self._count[0])
+
+    def push(self, row):
+        n = self.count
+        i = n % self.capacity
+        self.rows[i] = row
+        self.rows[i + self.capacity] = row
+        self._count[0] = n + 1
+
+    def window(self, end=None):
+        """View of the `window_size` rows before row count `end` (default: the newest)."""
+        end = self.count if end is None else end
+        start = (end - self.window_size) % self.capacity
+        return self.rows[start:start + self.window_size]
+
+    def intact(self, end):
+        """False once the rows of window(end) may have been overwritten by newer ones.
+
+        Strict: at exactly `capacity` rows behind, the next push is already writing the oldest row.
+        """
+        return self.count - (end - self.window_size) < self.capacity
+
+    def close(self):
+        self._count = self.rows = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _serve(model_path, backend, variant, ring_spec, coalesce, conn):
+    """Worker process: load the model, then answer (seq, end, extra) requests with (seq, outputs)."""
+    from inference import warm_up
+    from model_variants import load_variant
+    ring = ShmRing(*ring_spec)
+    window = None
+    model = load_variant(model_path, backend, variant)
+    warm_up(model, model_path)
+    conn.send(('ready', os.getpid()))
+    try:
+        while True:
+            request = conn.recv()
+            # Coalescing: only the newest waiting window is worth a prediction
+            while coalesce and request is not None and conn.poll():
+                request = conn.recv()
+            if request is None:
+                return
+            seq, end, extra = request
+            window = ring.window(end)[None]
+            outputs = model.predict(window if extra is None else [window, extra])
+            # None tells the controller the rows changed under the model
+            conn.send((seq, outputs if ring.intact(end) else None))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        window = None  # the view has to go before the shared memory can close
+        ring.close()
+
+
+class InferenceProcess:
+    """
+    A model served by a separate process, reading its windows from a ShmRing.
+
+    The controller pushes rows into `ring` as usual and submit()s the newest window with an
+    optional second input and a context. It gets (seq, outputs, context) back from results()
+    once the worker has answered, without ever waiting for the model, so ingestion latency
+    does not depend on inference time and the model's threads never hold the controller's
+    GIL. Sequence numbers increase with every submit; a result older than one already
+    delivered is stale and dropped. outputs is None if the ring overran the window before the
+    model was done with it. With `coalesce`, the worker skips to the newest request waiting.
+
+    A worker that dies is started again (at most every `restart_delay` seconds) and is sent
+    the requests still waiting for an answer. Counters 'inference_restarts', '_stale',
+    '_overrun' and stage 'remote_predict' (submit to result) are recorded on `instr`.
+    """
+
+    def __init__(self, model_path, ring, backend='numpy', variant='float32', coalesce=False,
+                 restart_delay=1.0, instr=None):
+        self.model_path = os.path.abspath(model_path)
+        self.ring = ring
+        self.backend = backend
+        self.variant = variant
+        self.coalesce = coalesce
+        self.restart_delay = restart_delay
+        self.instr = instr
+        self._ctx = multiprocessing.get_context('spawn')  # no fork of a process with model threads
+        self._pending = {}       # seq -> (end, extra, context, submitted_ns)
+        self._seq = 0
+        self._delivered = 0
+        self._next_restart = 0.0
+        self.stats = {'restarts': 0, 'stale': 0, 'overrun': 0}
+        self.proc = self.conn = None
+        self._selector = selectors.DefaultSelector()
+
+    def start(self, wait=True):
+        """Start the worker; with `wait`, block until its model is loaded."""
+        self.conn, child = self._ctx.Pipe()
+        spec = (self.ring.n_features, self.ring.window_size, self.ring.capacity, self.ring.name)
+        self.proc = self._ctx.Process(target=_serve, name='inference-worker', daemon=True,
+                                      args=(self.model_path, self.backend, self.variant, spec, self.coalesce, child))
+        self.proc.start()
+        child.close()
+        if wait:
+            try:
+                self.conn.recv()
+            except EOFError:
+                raise RuntimeError(f"Inference worker exited while loading {self.model_path}")
+        waiting = sorted(self._pending.items())
+        for seq, (end, extra, _, _) in waiting[-1:] if self.coalesce else waiting:
+            self.conn.send((seq, end, extra))
+        return self
+
+    def submit(self, extra=None, context=None):
+        """Queue the ring's newest window; returns its sequence number."""
+        self._seq += 1
+        end = self.ring.count
+        self._pending[self._seq] = (end, extra, context, time.perf_counter_ns())
+        try:
+            self.conn.send((self._seq, end, extra))
+        except (BrokenPipeError, OSError):
+            self._check_worker()
+        return self._seq
+
+    def pending(self):
+        return len(self._pending)
+
+    def wait(self, stream, timeout=None):
+        """
+        Block until `stream` has data, a result arrives or `timeout` passes; True if the
+        stream is readable. While answers are due, it wakes at least every restart_delay
+        to check on the worker.
+        """
+        if self._pending:
+            timeout = self.restart_delay if timeout is None else min(timeout, self.restart_delay)
+        self._selector.register(stream.fileno(), selectors.EVENT_READ)
+        self._selector.register(self.conn, selectors.EVENT_READ)
+        try:
+            ready = [key.fileobj for key, _ in self._selector.select(timeout)]
+        finally:
+            self._selector.unregister(stream.fileno())
+            self._selector.unregister(self.conn)
+        return stream.fileno() in ready
+
+    def results(self):
+        """(seq, outputs, context) of every answer received so far, oldest first."""
+        out = []
+        try:
+            while self.conn.poll():
+                msg = self.conn.recv()
+                if msg[0] == 'ready':
+                    continue
+                seq, outputs = msg
+                entry = self._pending.pop(seq, None)
+                if entry is None or seq <= self._delivered:
+                    self._count('stale')
+                    continue
+                self._delivered = seq
+                if self.coalesce:
+                    # The worker skipped past everything older
+                    for old in [s for s in self._pending if s < seq]:
+                        del self._pending[old]
+                if outputs is None:
+                    self._count('overrun')
+                if self.instr is not None:
+                    self.instr.observe('remote_predict', entry[3])
+                out.append((seq, outputs, entry[2]))
+        except (EOFError, OSError):
+            pass
+        self._check_worker()
+        return out
+
+    def drain(self, timeout=2.0):
+        """results() until every pending request is answered or `timeout` passes, e.g. before close()."""
+        out = []
+        end = time.monotonic() + timeout
+        while self._pending and time.monotonic() < end:
+            try:
+                self.conn.poll(min(end - time.monotonic(), self.restart_delay))
+            except (EOFError, OSError):
+                pass
+            out += self.results()
+        return out
+
+    def close(self, timeout=2.0):
+        if self.proc is not None:
+            try:
+                self.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            self.proc.join(timeout)
+            if self.proc.is_alive():
+                self.proc.terminate()
+                self.proc.join()
+            self.conn.close()
+        self._selector.close()
+        self.ring.close()
+
+    def _check_worker(self):
+        if self.proc.is_alive() or time.monotonic() < self._next_restart:
+            return
+        self._next_restart = time.monotonic() + self.restart_delay
+        self._count('restarts')
+        print(f"[Inference] Worker exited (code {self.proc.exitcode}), restarting")
+        self.conn.close()
+        self.start(wait=False)
+
+    def _count(self, key):
+        self.stats[key] += 1
+        if self.instr is not None:
+            self.instr.count(f'inference_{key}')
+# -
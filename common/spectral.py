@@ -0,0 +1,148 @@
+import numpy as np
+
+# +
+BANDS = ['delta', 'theta', 'lowAlpha', 'highAlpha', 'lowBeta', 'highBeta', 'lowGamma', 'highGamma']
+# Band edges (Hz) of the TGAM chip's eegPower output
+BAND_EDGES = [(0.5, 2.75), (3.5, 6.75), (7.5, 9.25), (10.0, 11.75),
+              (13.0, 16.75), (18.0, 29.75), (31.0, 39.75), (41.0, 49.75)]
+RAW_RATE = 512
+
+
+class RawBandPower:
+    """
+    The 8 eegPower bands computed on the host from the 512 Hz rawEeg stream.
+
+    Samples go into a mirrored ring, so the newest `window` seconds are always one
+    contiguous view. Every `rate_hz`-th of a second (one hop) a Welch estimate is taken
+    over that window: segments of `segment` seconds with `overlap`, each with its mean
+    removed and Hann-tapered (scipy.signal.welch's defaults, so a DC offset in rawEeg stays
+    out of delta), FFT'd together, averaged, and summed into bands by one matrix product. When a push() covers
+    several hops, all of their windows are stacked and transformed in a single call.
+
+    Host power is not in the headset's (unitless) eegPower scale. calibrate() takes a
+    headset eegPower packet (the connector keeps sending them in raw mode) and moves the
+    per-band gain toward headset / host, so features stay in the range the models were
+    trained on. The first packet sets the gain outright; `gain` can also be fixed up front.
+    """
+
+    def __init__(self, fs=RAW_RATE, rate_hz=8.0, window=1.0, segment=0.5, overlap=0.5,
+                 gain=1.0, calibration_alpha=0.1):
+        self.fs = fs
+        self.hop = max(1, int(round(fs / rate_hz)))
+        self.n_window = int(round(window * fs))
+        self.n_segment = min(int(round(segment * fs)), self.n_window)
+        self.seg_step = max(1, int(round(self.n_segment * (1 - overlap))))
+        self.n_segments = 1 + (self.n_window - self.n_segment) // self.seg_step
+        self.gain = np.broadcast_to(np.asarray(gain, dtype=float), (len(BANDS),)).copy()
+        self.calibration_alpha = calibration_alpha
+        self.calibrated = False
+        self._last_calibration = None
+
+        taper = np.hanning(self.n_segment + 1)[:-1]  # periodic Hann, as scipy's welch
+        self._taper = taper
+        freqs = np.fft.rfftfreq(self.n_segment, 1.0 / fs)
+        # One-sided PSD scaling (as scipy.signal.welch, density) folded into the band matrix
+        scale = np.full(len(freqs), 2.0 / (fs * np.sum(taper ** 2)))
+        scale[0] /= 2
+        if self.n_segment % 2 == 0:
+            scale[-1] /= 2
+        df = fs / self.n_segment
+        self._band_matrix = np.zeros((len(freqs), len(BANDS)))
+        for j, (lo, hi) in enumerate(BAND_EDGES):
+            self._band_matrix[(freqs >= lo) & (freqs <= hi), j] = 1.0
+        self._band_matrix *= (scale * df)[:, None] / self.n_segments
+
+        self._ring = np.zeros(2 * self.n_window)
+        self.reset()
+
+    def reset(self):
+        self._ring.fill(0)
+        self._pos = 0           # next write position in [0, n_window)
+        self._filled = 0
+        self._since_hop = 0
+        self.latest = None      # last band row (after gain)
+
+    def push(self, samples):
+        """Add raw samples; returns a (k, 8) array with one band row per hop completed (k may be 0)."""
+        samples = np.asarray(samples, dtype=float)
+        n = len(samples)
+        if n == 0:
+            return np.empty((0, len(BANDS)))
+        w = self.n_window
+        # Sample index (within this push) after which each due hop's window ends
+        first = self.hop - self._since_hop - 1
+        due = np.arange(first, n, self.hop)
+        due = due[self._filled + due + 1 >= w]
+
+        # Contiguous history: the last w samples before this push, then the push itself
+        history = np.concatenate((self._ring[self._pos:self._pos + w], samples))
+        self._write(samples)
+        self._since_hop = (self._since_hop + n) % self.hop
+        if not len(due):
+            return np.empty((0, len(BANDS)))
+
+        # (k, n_window) windows ending at each due sample, then (k, n_segments, n_segment)
+        windows = np.lib.stride_tricks.sliding_window_view(history, w)[due + 1]
+        segs = np.lib.stride_tricks.sliding_window_view(windows, self.n_segment, axis=1)[:, ::self.seg_step]
+        spectrum = np.fft.rfft((segs - segs.mean(axis=-1, keepdims=True)) * self._taper, axis=-1)
+        power = spectrum.real ** 2 + spectrum.imag ** 2
+        rows = power.sum(axis=1) @ self._band_matrix * self.gain
+        self.latest = rows[-1]
+        return rows
+
+    def _write(self, samples):
+        w = self.n_window
+        if len(samples) >= w:
+            samples = samples[-w:]
+        n = len(samples)
+        idx = (self._pos + np.arange(n)) % w
+        self._ring[idx] = samples
+        self._ring[idx + w] = samples
+        self._pos = (self._pos + n) % w
+        self._filled = min(self._filled + n, w)
+
+    def calibrate(self, eeg_power):
+        """Move the per-band gain toward the headset's eegPower / host power for the latest hop."""
+        # Consumers sharing one instance may all pass on the same packet; it counts once
+        if self.latest is None or eeg_power is self._last_calibration:
+            return
+        self._last_calibration = eeg_power
+        headset = np.array([eeg_power.get(b, 0) for b in BANDS], dtype=float)
+        host = self.latest / self.gain
+        ok = (headset > 0) & (host > 0)
+        if not ok.any():
+            return
+        target = headset[ok] / host[ok]
+        if not self.calibrated:
+            # The first packet sets the scale outright, later ones only nudge it
+            self.gain[ok] = target
+            self.calibrated = True
+            return
+        # Geometric moving average: band powers span orders of magnitude
+        a = self.calibration_alpha
+        self.gain[ok] = np.exp((1 - a) * np.log(self.gain[ok]) + a * np.log(target))
+
+    def as_packet(self, row, esense=None):
+        """A ThinkGear-style packet for one band row, for code that consumes packets."""
+        packet = {'eegPower': dict(zip(BANDS, row.tolist()))}
+        if esense is not None:
+            packet['eSense'] = esense
+        return packet
+# -
+
+if __name__ == "__main__":
+    # Self-check against scipy.signal.welch (default detrend='constant'), with and without a DC offset
+    from scipy.signal import welch
+    rng = np.random.default_rng(0)
+    signal = 60 * rng.standard_normal(4 * RAW_RATE)
+    for offset in (0.0, 100.0, 300.0):
+        bp = RawBandPower()
+        rows = bp.push(signal + offset)
+        f, psd = welch(signal[-bp.n_window:] + offset, RAW_RATE, nperseg=bp.n_segment,
+                       noverlap=bp.n_segment - bp.seg_step)
+        df = f[1] - f[0]
+        expected = [psd[(f >= lo) & (f <= hi)].sum() * df for lo, hi in BAND_EDGES]
+        err = np.max(np.abs(rows[-1] / expected - 1))
+        print(f"offset {offset:+.0f}: delta {rows[-1][0]:.1f} (welch {expected[0]:.1f}), max band error {err:.2e}")
+        if err > 1e-9:
+            raise SystemExit("RawBandPower does not match scipy.signal.welch")
@@ -0,0 +1,59 @@
+import threading
+from collections import deque
+
+# +
+POLICIES = ('drop_oldest', 'coalesce')
+
+
+class OverloadQueue:
+    """
+    Bounded hand-off between two pipeline stages that never blocks the producer.
+
+    When the consumer falls behind:
+    - 'drop_oldest' keeps the newest `maxsize` items and discards the oldest,
+    - 'coalesce' keeps only the newest item (the pending one is replaced).
+    Depth, peak depth and drop counts are kept for reporting.
+    """
+
+    def __init__(self, name, maxsize=64, policy='drop_oldest'):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown overload policy '{policy}', expected one of {POLICIES}")
+        self.name = name
+        self.policy = policy
+        self.maxsize = 1 if policy == 'coalesce' else maxsize
+        self._items = deque()
+        self._cond = threading.Condition()
+        self.put_count = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self.put_count += 1
+            self.max_depth = max(self.max_depth, len(self._items))
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Oldest pending item, or None if nothing arrived within `timeout` seconds."""
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            return self._items.popleft() if self._items else None
+
+    def __len__(self):
+        return len(self._items)
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'policy': self.policy,
+            'depth': len(self._items),
+            'max_depth': self.max_depth,
+            'put': self.put_count,
+            'dropped': self.dropped,
+        }
+# -
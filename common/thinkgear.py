@@ -0,0 +1,156 @@
+import json
+import time
+import socket
+
+# +
+DECODERS = ('auto', 'json', 'orjson', 'ujson')
+# Keys the controllers use; with the selective path other packets (rawEeg at 512 Hz,
+# poorSignalLevel-only status) are skipped by a byte search without being decoded
+CONTROL_FIELDS = ('eSense', 'eegPower', 'blinkStrength')
+
+
+def get_decoder(name='auto'):
+    """
+    (loads, accepts_memoryview) for a JSON decoder. 'auto' prefers orjson, then ujson, then
+    the standard library; orjson parses straight from a memoryview into the read buffer.
+    """
+    if name not in DECODERS:
+        raise ValueError(f"Unknown JSON decoder '{name}', expected one of {DECODERS}")
+    if name in ('auto', 'orjson'):
+        try:
+            import orjson
+            return orjson.loads, True
+        except ImportError:
+            if name == 'orjson':
+                raise
+    if name in ('auto', 'ujson'):
+        try:
+            import ujson
+            return ujson.loads, False
+        except ImportError:
+            if name == 'ujson':
+                raise
+    return json.loads, False
+
+
+class ThinkGearStream:
+    """
+    Reader for the ThinkGear Connector's '\\r'-terminated JSON stream over a plain socket.
+
+    read() does one bulk recv_into a reusable buffer and decodes every complete frame in it.
+    Frames are located by offset in place; only the decoder sees a copy, and not even that
+    with orjson. With `fields` set, frames containing none of those keys are skipped
+    undecoded. Frames that fail to decode are counted in `malformed` (and as 'dropped_lines'
+    on `instr`). read() raises EOFError once the connector closes the stream.
+
+    With `raw=True` (enableRawOutput), '{"rawEeg":N}' frames take an int() fast path instead
+    of the decoder and collect in a list that pop_raw() hands over.
+    """
+
+    def __init__(self, host='localhost', port=13854, config=None, decoder='auto', fields=None,
+                 bufsize=1 << 16, instr=None, raw=False):
+        self.sock = socket.create_connection((host, port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if config is not None:
+            self.sock.sendall(json.dumps(config).encode() + b'\n')
+        self.loads, self._zero_copy = get_decoder(decoder)
+        self._patterns = [f'"{f}"'.encode() for f in fields] if fields else None
+        self.instr = instr
+        self.raw_samples = [] if raw else None
+        self._buf = bytearray(bufsize)
+        self._view = memoryview(self._buf)
+        self._start = 0   # first unconsumed byte
+        self._end = 0     # end of received data
+        self._timeout = self.sock.gettimeout()
+        self.received_ns = 0  # perf_counter_ns() when the last chunk arrived
+        self.frames = 0
+        self.skipped = 0
+        self.malformed = 0
+        self.bytes_read = 0
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        self._view.release()
+        self.sock.close()
+
+    def pop_raw(self):
+        """rawEeg samples received since the last call."""
+        samples, self.raw_samples = self.raw_samples, []
+        return samples
+
+    def read(self, timeout=None):
+        """
+        Packets from the next chunk of the stream: blocks up to `timeout` seconds (None = forever,
+        0 = only what is already buffered) and returns [] if nothing complete arrived.
+        """
+        if timeout != self._timeout:
+            self.sock.settimeout(timeout)
+            self._timeout = timeout
+        if self._end == len(self._buf):
+            self._make_room()
+        try:
+            n = self.sock.recv_into(self._view[self._end:])
+        except (socket.timeout, BlockingIOError):
+            return []
+        if n == 0:
+            raise EOFError("ThinkGear stream closed")
+        self.received_ns = time.perf_counter_ns()
+        self.bytes_read += n
+        self._end += n
+        return self._decode_frames()
+
+    def _make_room(self):
+        # Move the partial frame to the front, or grow if one frame fills the whole buffer
+        if self._start:
+            tail = self._end - self._start
+            self._buf[:tail] = self._buf[self._start:self._end]
+            self._start, self._end = 0, tail
+        else:
+            self._view.release()
+            self._buf.extend(bytes(len(self._buf)))
+            self._view = memoryview(self._buf)
+
+    def _decode_frames(self):
+        buf, view = self._buf, self._view
+        packets = []
+        start = self._start
+        while True:
+            end = buf.find(b'\r', start, self._end)
+            if end < 0:
+                break
+            frame_start, start = start, end + 1
+            brace = buf.find(b'{', frame_start, end)
+            if brace < 0:
+                continue  # blank line / stray '\n'
+            if self.raw_samples is not None and buf.startswith(b'{"rawEeg":', brace, end):
+                try:
+                    self.raw_samples.append(int(buf[brace + 10:buf.find(b'}', brace, end)]))
+                    continue
+                except ValueError:
+                    pass  # unusual formatting: let the decoder have it
+            if self._patterns is not None and not any(buf.find(p, brace, end) >= 0 for p in self._patterns):
+                self.skipped += 1
+                continue
+            t0 = time.perf_counter_ns()
+            frame = view[brace:end]
+            try:
+                packet = self.loads(frame if self._zero_copy else frame.tobytes())
+            except Exception:
+                packet = None
+            if not isinstance(packet, dict):
+                self.malformed += 1
+                if self.instr is not None:
+                    self.instr.count('dropped_lines')
+                continue
+            self.frames += 1
+            if self.instr is not None:
+                self.instr.observe('parse', t0)
+                self.instr.count('packets')
+            packets.append(packet)
+        if start >= self._end:
+            start = self._end = 0
+        self._start = start
+        return packets
+# -
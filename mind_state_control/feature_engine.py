@@ -0,0 +1,145 @@
+import numpy as np
+
+# +
+bands = ['delta', 'theta', 'lowAlpha', 'highAlpha', 'lowBeta', 'highBeta', 'lowGamma', 'highGamma']
+ratios = [
+    'theta_beta', 'alpha_beta', 'lowHigh_alpha', 'lowHigh_beta', 'gamma_beta',
+    'alpha_theta', 'beta_theta', 'alpha_theta_beta', 'theta_alpha', 'gamma_alpha'
+]
+
+EPS = 1e-6
+
+# Band sums appended after the 8 raw bands so every ratio is a plain lookup:
+# 8 = alpha_sum, 9 = beta_sum, 10 = gamma_sum, 11 = theta + beta_sum
+_RATIO_NUM = np.array([1, 8, 2, 4, 10, 8, 9, 8, 1, 10])
+_RATIO_DEN = np.array([9, 9, 3, 5, 9, 1, 1, 11, 8, 8])
+
+
+class StreamingFeatureEngine:
+    """
+    Turns ThinkGear packets into the feature_cols.json vector in constant time and memory.
+
+    Band history lives in a mirrored ring (every value is written twice, W apart), so the
+    last `rolling_size` samples are always one contiguous, chronologically ordered view.
+    Reductions over that view round exactly like np.mean/np.std over the old per-band
+    deques, which running sums or Welford updates would not.
+    """
+
+    def __init__(self, rolling_size=10):
+        self.rolling_size = rolling_size
+        self.n_features = len(bands) * 7 + len(ratios)
+
+        n = len(bands)
+        self._ring = np.zeros((n, 2 * rolling_size))
+        self._ext = np.zeros(n + 4)
+        self._num = np.zeros(len(ratios))
+        self._den = np.zeros(len(ratios))
+
+        # Output layout: bands, ratios, rollings (mean/std/min/max per band), deltas, norms
+        self._o_ratio = n
+        self._o_roll = self._o_ratio + len(ratios)
+        self._o_delta = self._o_roll + 4 * n
+        self._o_norm = self._o_delta + n
+        self.reset()
+
+    def reset(self):
+        self._ring.fill(0)
+        self._pos = -1
+        self._count = 0
+
+    def update(self, d, out=None):
+        """Push one packet and return its feature vector (written into `out` if given)."""
+        bp = d.get('eegPower', {})
+        return self.update_bands([bp.get(band, 0) for band in bands], out)
+
+    def update_bands(self, band_vals, out=None):
+        """Same as update() for a row of the 8 band powers (e.g. from RawBandPower)."""
+        if out is None:
+            out = np.empty(self.n_features)
+
+        n = len(bands)
+        ext = self._ext
+        ext[:n] = band_vals
+        w = self.rolling_size
+        self._pos = (self._pos + 1) % w
+        self._count = min(self._count + 1, w)
+        self._ring[:, self._pos] = ext[:n]
+        self._ring[:, self._pos + w] = ext[:n]
+        end = self._pos + w + 1
+        window = self._ring[:, end - self._count:end]
+
+        out[:n] = ext[:n]
+
+        # Ratios (match training), same operand order as the scalar formulas
+        np.add(ext[2], ext[3], out=ext[8:9])
+        np.add(ext[4], ext[5], out=ext[9:10])
+        np.add(ext[6], ext[7], out=ext[10:11])
+        np.add(ext[1], ext[9], out=ext[11:12])
+        np.take(ext, _RATIO_NUM, out=self._num)
+        np.take(ext, _RATIO_DEN, out=self._den)
+        self._den += EPS
+        np.divide(self._num, self._den, out=out[self._o_ratio:self._o_roll])
+
+        # Rolling stats over the last `rolling_size` packets
+        rollings = out[self._o_roll:self._o_delta].reshape(n, 4)
+        np.mean(window, axis=1, out=rollings[:, 0])
+        np.std(window, axis=1, out=rollings[:, 1])
+        np.min(window, axis=1, out=rollings[:, 2])
+        np.max(window, axis=1, out=rollings[:, 3])
+
+        # Deltas: current minus the oldest sample still in the rolling window
+        np.subtract(ext[:n], window[:, 0], out=out[self._o_delta:self._o_norm])
+
+        # Normalized band power
+        total_power = sum(band_vals) + EPS
+        np.divide(ext[:n], total_power, out=out[self._o_norm:])
+        return out
+
+
+def batch_features(band_rows, rolling_size=10, chunk=50000):
+    """
+    StreamingFeatureEngine.update() for a whole recording at once: (n, 8) band powers in,
+    (n, n_features) feature rows out, equal to feeding the rows one by one from a reset engine.
+    Rolling reductions run over contiguous copies of each window so they round like the
+    engine's; the first rolling_size - 1 rows use the shorter windows the engine sees.
+    """
+    band_rows = np.asarray(band_rows, dtype=float)
+    n, nb = band_rows.shape
+    w = rolling_size
+    out = np.empty((n, nb * 7 + len(ratios)))
+    o_ratio, o_roll = nb, nb + len(ratios)
+    o_delta = o_roll + 4 * nb
+    o_norm = o_delta + nb
+
+    out[:, :nb] = band_rows
+    ext = np.empty((n, nb + 4))
+    ext[:, :nb] = band_rows
+    ext[:, 8] = band_rows[:, 2] + band_rows[:, 3]
+    ext[:, 9] = band_rows[:, 4] + band_rows[:, 5]
+    ext[:, 10] = band_rows[:, 6] + band_rows[:, 7]
+    ext[:, 11] = band_rows[:, 1] + ext[:, 9]
+    out[:, o_ratio:o_roll] = ext[:, _RATIO_NUM] / (ext[:, _RATIO_DEN] + EPS)
+
+    rollings = out[:, o_roll:o_delta].reshape(n, nb, 4)
+    # Warm-up rows: windows shorter than rolling_size
+    for i in range(min(w - 1, n)):
+        window = np.ascontiguousarray(band_rows[:i + 1].T)
+        rollings[i, :, 0] = np.mean(window, axis=1)
+        rollings[i, :, 1] = np.std(window, axis=1)
+        rollings[i, :, 2] = np.min(window, axis=1)
+        rollings[i, :, 3] = np.max(window, axis=1)
+    # Full windows, in chunks to bound the (rows, bands, w) copy
+    for start in range(w - 1, n, chunk):
+        stop = min(start + chunk, n)
+        windows = np.ascontiguousarray(
+            np.lib.stride_tricks.sliding_window_view(band_rows[start - w + 1:stop], w, axis=0))
+        rollings[start:stop, :, 0] = np.mean(windows, axis=2)
+        rollings[start:stop, :, 1] = np.std(windows, axis=2)
+        rollings[start:stop, :, 2] = np.min(windows, axis=2)
+        rollings[start:stop, :, 3] = np.max(windows, axis=2)
+
+    oldest = np.maximum(np.arange(n) - w + 1, 0)
+    out[:, o_delta:o_norm] = band_rows - band_rows[oldest]
+    out[:, o_norm:] = band_rows / (band_rows.sum(axis=1, keepdims=True) + EPS)
+    return out
+# -
@@ -1,18 +1,49 @@
+import os
+import sys
 import numpy as np
-import skfuzzy as fuzz
-from skfuzzy import control as ctrl
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from fuzzy_tables import LookupTable, grid_axis, evaluate_grid, source_key, load_tables, save_tables
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
 
 # +
 
 class MindStateControlSystem:
-    """Fuzzy system for attention/meditation control with conflict resolution"""
-
-    def __init__(self):
-        self.attention_sim = self._build_attention_system()
-        self.meditation_sim = self._build_meditation_system()
-        self.conflict_resolver = self._build_conflict_system()
+    """
+    Fuzzy system for attention/meditation control with conflict resolution.
+
+    With compiled=True the three simulations are sampled once into lookup tables
+    (attention/meditation effect every `resolution` points, conflict surface every
+    `effect_resolution`) and cached under `cache_dir`. The tables are validated against
+    skfuzzy at build time: at least 99% of uniformly sampled inputs must land within
+    `error_bound` of the simulation (before rounding), otherwise the skfuzzy path is kept.
+    The misses sit within one grid cell of the rule base's steps, e.g. the
+    neutral/neutral corner no conflict rule covers, where skfuzzy itself returns
+    noise-driven values (or raises; the tables hold 0 there).
+    """
+
+    def __init__(self, compiled=False, resolution=0.1, effect_resolution=0.02,
+                 error_bound=0.01, cache_dir=CACHE_DIR):
+        self.resolution = resolution
+        self.effect_resolution = effect_resolution
+        self.error_bound = error_bound
+        self.cache_path = os.path.join(cache_dir, 'fuzzy_att_tables.npz')
+        self.attention_sim = None
+        self.tables = self._load_compiled() if compiled else None
+        if self.tables is None:
+            self._build_sims()
+
+    def _build_sims(self):
+        if self.attention_sim is None:
+            self.attention_sim = self._build_attention_system()
+            self.meditation_sim = self._build_meditation_system()
+            self.conflict_resolver = self._build_conflict_system()
 
     def _build_attention_system(self):
+        import skfuzzy as fuzz
+        from skfuzzy import control as ctrl
+
         attention = ctrl.Antecedent(np.arange(0, 101, 1), 'attention')
         effect = ctrl.Consequent(np.arange(-1, 1.01, 0.01), 'effect')
 
@@ -33,6 +64,9 @@ class MindStateControlSystem:
         return ctrl.ControlSystemSimulation(ctrl.ControlSystem(rules))
 
     def _build_meditation_system(self):
+        import skfuzzy as fuzz
+        from skfuzzy import control as ctrl
+
         meditation = ctrl.Antecedent(np.arange(0, 101, 1), 'meditation')
         effect = ctrl.Consequent(np.arange(-1, 1.01, 0.01), 'effect')
 
@@ -53,6 +87,9 @@ class MindStateControlSystem:
         return ctrl.ControlSystemSimulation(ctrl.ControlSystem(rules))
 
     def _build_conflict_system(self):
+        import skfuzzy as fuzz
+        from skfuzzy import control as ctrl
+
         att_effect = ctrl.Antecedent(np.arange(-1, 1.01, 0.01), 'att_effect')
         med_effect = ctrl.Antecedent(np.arange(-1, 1.01, 0.01), 'med_effect')
         net_effect = ctrl.Consequent(np.arange(-2, 2.01, 0.01), 'net_effect')
@@ -80,8 +117,7 @@ class MindStateControlSystem:
         ]
         return ctrl.ControlSystemSimulation(ctrl.ControlSystem(rules))
 
-    def calculate_effects(self, attention, meditation):
-        """Calculate net effect considering potential conflicts"""
+    def _simulate(self, attention, meditation):
         self.attention_sim.reset()
         self.attention_sim.input['attention'] = attention
         self.attention_sim.compute()
@@ -92,16 +128,92 @@ class MindStateControlSystem:
         self.meditation_sim.compute()
         med_effect = self.meditation_sim.output['effect']
 
+        return att_effect, med_effect, self._resolve(att_effect, med_effect)
+
+    def _resolve(self, att_effect, med_effect):
         self.conflict_resolver.reset()
         self.conflict_resolver.input['att_effect'] = att_effect
         self.conflict_resolver.input['med_effect'] = med_effect
         self.conflict_resolver.compute()
+        return self.conflict_resolver.output['net_effect']
+
+    def _effect(self, sim, name, value):
+        sim.reset()
+        sim.input[name] = value
+        sim.compute()
+        return sim.output['effect']
+
+    def _load_compiled(self):
+        key = source_key(__file__, resolution=self.resolution, effect_resolution=self.effect_resolution)
+        tables = load_tables(self.cache_path, key)
+        if tables is None:
+            tables = self._compile()
+            save_tables(self.cache_path, key, **tables)
+        if tables['p99_error'] > self.error_bound:
+            print(f"[Fuzzy] Compiled tables miss the error bound "
+                  f"(p99 {float(tables['p99_error']):.4f} > {self.error_bound}), using skfuzzy")
+            return None
+        return {
+            'attention': LookupTable([tables['input_axis']], tables['attention']),
+            'meditation': LookupTable([tables['input_axis']], tables['meditation']),
+            'conflict': LookupTable([tables['att_axis'], tables['med_axis']], tables['conflict']),
+        }
+
+    def _compile(self):
+        self._build_sims()
+        input_axis = grid_axis(0, 100, self.resolution)
+        att = evaluate_grid(lambda x: self._effect(self.attention_sim, 'attention', x), input_axis)
+        med = evaluate_grid(lambda x: self._effect(self.meditation_sim, 'meditation', x), input_axis)
+        # The conflict surface is only sampled over effects the first stage can produce
+        att_axis = grid_axis(att.min(), att.max(), self.effect_resolution)
+        med_axis = grid_axis(med.min(), med.max(), self.effect_resolution)
+        conflict = evaluate_grid(self._resolve, att_axis, med_axis)
+
+        # Validate the composed tables against the full simulation
+        rng = np.random.default_rng(0)
+        errors = []
+        for a, m in rng.uniform(0, 100, size=(256, 2)):
+            try:
+                ref = self._simulate(a, m)
+            except Exception:
+                continue
+            a_eff = np.interp(a, input_axis, att)
+            m_eff = np.interp(m, input_axis, med)
+            net = LookupTable([att_axis, med_axis], conflict)(a_eff, m_eff)
+            errors.append(np.abs(np.array([a_eff, m_eff, net]) - ref).max())
+        return {
+            'input_axis': input_axis, 'attention': att, 'meditation': med,
+            'att_axis': att_axis, 'med_axis': med_axis, 'conflict': conflict,
+            'max_error': np.max(errors), 'p99_error': np.percentile(errors, 99),
+        }
+
+    def calculate_effects(self, attention, meditation):
+        """Calculate net effect considering potential conflicts"""
+        if self.tables is not None:
+            effects = self.calculate_effects_batch(attention, meditation)
+            return {name: float(val) for name, val in effects.items()}
+        att_effect, med_effect, net_effect = self._simulate(attention, meditation)
 
         return {
             'attention_effect': round(float(att_effect), 3),
             'meditation_effect': round(float(med_effect), 3),
-            'net_effect': round(float(self.conflict_resolver.output['net_effect']), 3)
+            'net_effect': round(float(net_effect), 3)
         }
-# -
-
 
+    def calculate_effects_batch(self, att_array, med_array):
+        """Vectorized calculate_effects; returns a dict of arrays (needs compiled tables to be fast)"""
+        att_array = np.asarray(att_array, dtype=float)
+        med_array = np.asarray(med_array, dtype=float)
+        if self.tables is None:
+            results = [self.calculate_effects(a, m) for a, m in zip(att_array.ravel(), med_array.ravel())]
+            return {name: np.array([r[name] for r in results]).reshape(att_array.shape)
+                    for name in ('attention_effect', 'meditation_effect', 'net_effect')}
+        att_effect = self.tables['attention'](att_array)
+        med_effect = self.tables['meditation'](med_array)
+        net_effect = self.tables['conflict'](att_effect, med_effect)
+        return {
+            'attention_effect': np.round(att_effect, 3),
+            'meditation_effect': np.round(med_effect, 3),
+            'net_effect': np.round(net_effect, 3)
+        }
+# -
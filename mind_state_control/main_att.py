@@ -1,13 +1,27 @@
 # +
+import os
+import sys
 import time
 import json
+import argparse
 import serial
 import numpy as np
-from telnetlib import Telnet
-from collections import deque, defaultdict
-from fuzzy_logic_att import MindStateControlSystem
+from collections import deque
 
-import tensorflow as tf
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from fuzzy_logic_att import MindStateControlSystem
+from feature_engine import StreamingFeatureEngine, bands, ratios
+from inference import BACKENDS, KerasBackend, check_parity, random_inputs, warm_up
+from model_variants import VARIANTS, load_variant
+from stage_queue import POLICIES
+from spectral import RawBandPower
+from instrumentation import Instrumentation, StartupTimer
+from actuators import ActuatorLink, PROTOCOLS, ACTUATORS
+from thinkgear import ThinkGearStream, DECODERS, CONTROL_FIELDS
+from session_store import SessionRecorder, new_session_path
+from inference_gate import InferenceGate
+from shm_inference import ShmRing, InferenceProcess
+from event_log import EventLog, EventSink, log_path_for, STATE, PREDICTION, ACTUATION, FAN_FASTER, FAN_SLOWER, LEVELS
 
 # Load label encoder classes
 le_att_classes = np.load("le_att_classes.npy", allow_pickle=True)
@@ -17,26 +31,52 @@ le_rel_classes = np.load("le_rel_classes.npy", allow_pickle=True)
 with open("feature_cols.json") as f:
     feature_cols = json.load(f)
 
-# Identify bands, ratios, rolling, delta, norm
-bands = ['delta', 'theta', 'lowAlpha', 'highAlpha', 'lowBeta', 'highBeta', 'lowGamma', 'highGamma']
-ratios = [
-    'theta_beta', 'alpha_beta', 'lowHigh_alpha', 'lowHigh_beta', 'gamma_beta',
-    'alpha_theta', 'beta_theta', 'alpha_theta_beta', 'theta_alpha', 'gamma_alpha'
-]
+# Identify rolling, delta, norm (bands and ratios come from the feature engine)
 rolling_stats = [f"{b}_{stat}" for b in bands for stat in ['mean', 'std', 'min', 'max']]
 deltas = [f"{b}_delta" for b in bands]
 norms = [f"{b}_norm" for b in bands]
 
 class MindStateController:
-    def __init__(self):
-        # Hardware setup
-        self.esp32 = serial.Serial('COM4', 115200, timeout=1)
-        self.tn = Telnet('localhost', 13854)
-        self.tn.write(b'{"enableRawOutput":false,"format":"Json"}\n')
-        time.sleep(1)
+    def __init__(self, inference_backend='numpy', parity_check=False,
+                 host='localhost', port=13854, serial_port='COM4', metrics_interval=0.0, metrics_path=None,
+                 connect=True, name='', model=None, mind_control=None, serial_protocol='text', serial_ack=False,
+                 json_decoder='auto', raw_mode=False, raw_rate_hz=8.0, record_dir=None, model_variant='float32',
+                 gate_threshold=0.0, gate_cache=64, gate_quantum=0.0, inference_process=False,
+                 event_log=None, event_log_bytes=16 << 20, console=True):
+        # `name` tags console output when several sessions share a process; `model` and
+        # `mind_control` let them share one loaded model and one fuzzy system
+        self.name = name
+        # Stage latencies and packet counters, summarized every metrics_interval seconds (0 = off)
+        self.instr = Instrumentation(f'mind_state{"_" + name if name else ""}', metrics_interval, metrics_path)
+        self.startup = StartupTimer(self.instr.name)
+
+        # Raw mode: bands come from rawEeg at raw_rate_hz; headset eegPower packets only calibrate them
+        self.band_power = RawBandPower(rate_hz=raw_rate_hz) if raw_mode else None
+
+        # Optional recording of every packet and feature row (written by a background thread)
+        self.recorder = None
+        if record_dir:
+            self.recorder = SessionRecorder(new_session_path(record_dir, f"mind_state_{name}" if name else 'mind_state'),
+                                            feature_cols, source='mind_state', instr=self.instr)
+
+        # State, predictions and fan commands go to the console, a binary event log
+        # (rendered by tools/view_events.py) or both; with neither nothing is formatted
+        labels = {'attention': [str(c) for c in le_att_classes], 'relaxation': [str(c) for c in le_rel_classes]}
+        meta = {'source': 'mind_state', 'tag': self._tag(), 'labels': labels}
+        self.events = EventSink(EventLog(event_log, meta, max_bytes=event_log_bytes, instr=self.instr) if event_log else None,
+                                console, meta)
+
+        # Hardware setup (connect=False leaves it out, e.g. for offline benchmarks)
+        self.esp32 = None
+        self.actuators = None
+        self.stream = None
+        if connect:
+            with self.startup.stage('connect'):
+                self.connect(host, port, serial_port, serial_protocol, serial_ack, json_decoder, raw_mode)
 
         # Control systems
-        self.mind_control = MindStateControlSystem()
+        with self.startup.stage('fuzzy'):
+            self.mind_control = mind_control or MindStateControlSystem(compiled=True)
         
         # Mind state tracking for console output
         self.attention_history = deque(maxlen=15)
@@ -52,98 +92,136 @@ class MindStateController:
         self.pwm_step = 5
 
         # ===== Model and feature tracking =====
-        self.model = tf.keras.models.load_model("best_eeg_cnn_bilstm.h5")
+        # Loaded from the cached inference artifact (or a quantized / pruned variant) and
+        # warmed up, so the first real window is not slow
+        # (with inference_process it is loaded by the worker instead)
+        if model is None and not inference_process:
+            with self.startup.stage('model'):
+                model = load_variant("best_eeg_cnn_bilstm.h5", inference_backend, model_variant)
+            with self.startup.stage('warm_up'):
+                warm_up(model, "best_eeg_cnn_bilstm.h5")
+            # Parity only holds for the float32 model; variants are checked by tools/optimize_models.py
+            if parity_check and inference_backend != 'keras' and model_variant == 'float32':
+                with self.startup.stage('parity'):
+                    diff = check_parity(model, KerasBackend("best_eeg_cnn_bilstm.h5"),
+                                        random_inputs("best_eeg_cnn_bilstm.h5", batch=8))
+                print(f"[Model] {inference_backend} backend matches keras (max |Δ| {diff:.1e})")
+        self.model = model
+        # Windows that barely changed since the last prediction reuse it instead of running the model
+        self.gate = InferenceGate(gate_threshold, gate_cache, gate_quantum, instr=self.instr)
         self.window_size = 20  # Should match model training
         self.seq_buffer = deque(maxlen=self.window_size)
 
+        # Optionally the model runs in its own process, reading windows from shared memory
+        self.remote = None
+        if inference_process:
+            with self.startup.stage('worker'):
+                self.remote = InferenceProcess("best_eeg_cnn_bilstm.h5", ShmRing(len(feature_cols), self.window_size),
+                                               inference_backend, model_variant, coalesce=True, instr=self.instr).start()
+
         # Real-time tracking for engineered features
         self.rolling_size = 10  # Window for rolling/delta stats
-        self.band_buffers = {band: deque(maxlen=self.rolling_size) for band in bands}
-        self.band_history = defaultdict(list)  # For delta calc
+        self.feature_engine = StreamingFeatureEngine(self.rolling_size)
+        if connect:
+            self.startup.report()
+
+    def connect(self, host='localhost', port=13854, serial_port='COM4', serial_protocol='text', serial_ack=False,
+                json_decoder='auto', raw=False):
+        # serial_port may also be a pyserial URL such as socket://localhost:5331
+        self.esp32 = serial.serial_for_url(serial_port, 115200, timeout=1)
+        # Fan commands go through a write-behind queue: unchanged PWM values are not resent
+        self.actuators = ActuatorLink(self.esp32, serial_protocol, serial_ack, instr=self.instr)
+        self.stream = ThinkGearStream(host, port, {"enableRawOutput": raw, "format": "Json"},
+                                      json_decoder, CONTROL_FIELDS, instr=self.instr, raw=raw)
+        time.sleep(1)
 
     def run(self):
         print("=== Mind Controlled System Active ===")
         print("Format: [State] Att:Val(Δ)[Level] | Med:Val(Δ)[Level] | Net:Val")
         try:
             while True:
-                # Read data
-                line = self.tn.read_until(b'\r').decode('utf-8', errors='ignore').strip()
-                if not line:
-                    continue
-                try:
-                    data_dict = json.loads(line)
-                except Exception:
-                    continue
-
-                # --- Feature extraction for the model ---
-                feat_row = self._extract_features(data_dict)
-                if feat_row is not None:
-                    self.seq_buffer.append(feat_row)
-
-                now = time.time()
-                if now - self.last_control_update >= self.control_update_interval:
-                    self._process_mind_state(data_dict)
-                    self._predict_eeg_labels()
-                    self.last_control_update = now
+                # Read data (parse time and packet counts are recorded by the stream)
+                for data_dict in self._read():
+                    t0 = self.stream.received_ns
+
+                    # --- Feature extraction for the model ---
+                    self._update_features(data_dict)
+
+                    now = time.time()
+                    if now - self.last_control_update >= self.control_update_interval:
+                        self._process_mind_state(data_dict)
+                        self._predict_eeg_labels()
+                        self.last_control_update = now
+                        self.instr.observe('packet_to_control', t0)
+                if self.band_power is not None:
+                    self._update_raw_features(self.stream.pop_raw())
+                if self.remote is not None:
+                    self._show_remote_predictions()
+                self.instr.tick()
 
         except KeyboardInterrupt:
             print("\nShutting down...")
+        except EOFError:
+            print("\nHeadset stream closed, shutting down...")
         finally:
             self._send_fan_pwm(0)
-            self.tn.close()
-            self.esp32.close()
+            self.stream.close()
+            self.actuators.close()
+            if self.recorder is not None:
+                self.recorder.close()
+            if self.remote is not None:
+                self.remote.close()
+            self.events.close()
+            self.instr.final_report()
+
+    def _read(self):
+        # With an inference process, its answers wake the loop as well as packets
+        if self.remote is None:
+            return self.stream.read()
+        return self.stream.read() if self.remote.wait(self.stream) else []
+
+    def _update_features(self, data_dict):
+        if self.band_power is not None:
+            if 'eegPower' in data_dict:
+                self.band_power.calibrate(data_dict['eegPower'])
+            self._record(data_dict)
+            return
+        t1 = time.perf_counter_ns()
+        feat_row = self._extract_features(data_dict)
+        if feat_row is not None:
+            self._append_row(feat_row)
+        self.instr.observe('features', t1)
+        self._record(data_dict, feat_row)
+
+    def _update_raw_features(self, samples):
+        # One feature row per completed hop, straight into the sequence window
+        if not samples:
+            return
+        t1 = time.perf_counter_ns()
+        self._add_band_rows(self.band_power.push(samples))
+        self.instr.observe('raw_features', t1)
+        self.instr.count('raw_samples', len(samples))
+
+    def _add_band_rows(self, rows):
+        for row in rows:
+            feat_row = self.feature_engine.update_bands(row)
+            self._append_row(feat_row)
+            if self.recorder is not None:
+                self.recorder.append(self.band_power.as_packet(row), feat_row)
+
+    def _append_row(self, feat_row):
+        self.seq_buffer.append(feat_row)
+        if self.remote is not None:
+            self.remote.ring.push(feat_row)
+
+    def _record(self, data_dict, feat_row=None):
+        if self.recorder is not None:
+            self.recorder.append(data_dict, feat_row)
 
     def _extract_features(self, d):
         try:
-            es, bp = d.get('eSense', {}), d.get('eegPower', {})
-            band_vals = [bp.get(band, 0) for band in bands]
-            for i, band in enumerate(bands):
-                self.band_buffers[band].append(band_vals[i])
-                self.band_history[band].append(band_vals[i])
-
-            # Ratios (match training)
-            alpha_sum = band_vals[2] + band_vals[3]
-            beta_sum = band_vals[4] + band_vals[5]
-            theta_beta = band_vals[1] / (beta_sum + 1e-6)
-            alpha_beta = alpha_sum / (beta_sum + 1e-6)
-            lowHigh_alpha = band_vals[2] / (band_vals[3] + 1e-6)
-            lowHigh_beta = band_vals[4] / (band_vals[5] + 1e-6)
-            gamma_beta = (band_vals[6] + band_vals[7]) / (beta_sum + 1e-6)
-            alpha_theta = alpha_sum / (band_vals[1] + 1e-6)
-            beta_theta = beta_sum / (band_vals[1] + 1e-6)
-            alpha_theta_beta = alpha_sum / (band_vals[1] + beta_sum + 1e-6)
-            theta_alpha = band_vals[1] / (alpha_sum + 1e-6)
-            gamma_alpha = (band_vals[6] + band_vals[7]) / (alpha_sum + 1e-6)
-            ratio_vals = [
-                theta_beta, alpha_beta, lowHigh_alpha, lowHigh_beta, gamma_beta,
-                alpha_theta, beta_theta, alpha_theta_beta, theta_alpha, gamma_alpha
-            ]
-
-            # Rolling stats (mean, std, min, max) for each band
-            rollings = []
-            for band in bands:
-                buf = self.band_buffers[band]
-                arr = np.array(buf) if buf else np.zeros(1)
-                rollings += [
-                    np.mean(arr), np.std(arr), np.min(arr), np.max(arr)
-                ]
-
-            # Deltas over last 10
-            deltas_ = []
-            for band in bands:
-                hist = self.band_history[band]
-                curr = hist[-1]
-                prev = hist[-self.rolling_size] if len(hist) >= self.rolling_size else hist[0]
-                deltas_.append(curr - prev)
-
-            # Normalized band power
-            total_power = sum(band_vals) + 1e-6
-            norms_ = [val / total_power for val in band_vals]
-
             # Final feature vector (order: bands, ratios, rollings, deltas, norms)
-            feat_vec = (
-                band_vals + ratio_vals + rollings + deltas_ + norms_
-            )
+            feat_vec = self.feature_engine.update(d)
             # Ensure the length matches feature_cols
             if len(feat_vec) != len(feature_cols):
                 print(f"Feature count mismatch: got {len(feat_vec)}, expected {len(feature_cols)}")
@@ -170,11 +248,8 @@ class MindStateController:
             return "HIGH"
 
     def _send_fan_pwm(self, pwm):
-        try:
-            self.esp32.write(f'FAN:{pwm}\n'.encode())
-            print(f"[DEBUG] Sent PWM: {pwm}")
-        except Exception as e:
-            print(f"Error sending PWM to ESP32: {e}")
+        sent = self.actuators.send('FAN', pwm)
+        self.events.emit(ACTUATION, int(sent), 0, ACTUATORS['FAN'].code, pwm)
 
     def _process_mind_state(self, data_dict):
         esense = data_dict.get('eSense', {})
@@ -198,57 +273,131 @@ class MindStateController:
         med_level = self._get_meditation_level(smooth_med)
         
         # Get fuzzy effects
-        effects = self.mind_control.calculate_effects(smooth_att, smooth_med)
-        
-        # Print colored output
-        att_color = "\033[92m" if delta_att >= 0 else "\033[91m"
-        med_color = "\033[92m" if delta_med < 0 else "\033[91m"  # Inverse for meditation
-        net_color = "\033[92m" if effects['net_effect'] >= 0 else "\033[91m"
-        reset_color = "\033[0m"
-        
-        print(f"[Mind State] {att_color}Att:{smooth_att:.0f}(Δ{delta_att:+.1f})[{att_level}]{reset_color} | "
-              f"{med_color}Med:{smooth_med:.0f}(Δ{delta_med:+.1f})[{med_level}]{reset_color} | "
-              f"{net_color}Net:{effects['net_effect']:+.2f}{reset_color}")
+        with self.instr.span('fuzzy'):
+            effects = self.mind_control.calculate_effects(smooth_att, smooth_med)
 
         # ===== Fan Speed Stepwise Logic =====
-        if (att_color == "\033[92m" and med_color == "\033[91m") or (att_color == "\033[92m" and med_color == "\033[92m"):
-            # Going more focused: speed up
-            print("\033[92m[Focus ↑, Relax ↓ or Both ↑] Fan: FASTER\033[0m")
+        # Attention rising speeds the fan up and falling slows it down, whichever way meditation goes
+        if delta_att >= 0:
+            decision = FAN_FASTER
             self.last_pwm = min(self.pwm_max, self.last_pwm + self.pwm_step)
-        elif (att_color == "\033[91m" and med_color == "\033[92m") or (att_color == "\033[91m" and med_color == "\033[91m"):
-            # Going more relaxed: slow down
-            print("\033[91m[Focus ↓, Relax ↑ or Both ↓] Fan: SLOWER\033[0m")
-            self.last_pwm = max(self.pwm_min, self.last_pwm - self.pwm_step)
         else:
-            print("\033[93m[Mixed State] Fan: MODERATE\033[0m")
-            # No change
+            decision = FAN_SLOWER
+            self.last_pwm = max(self.pwm_min, self.last_pwm - self.pwm_step)
+        self.events.emit(STATE, decision, LEVELS.index(att_level), LEVELS.index(med_level), self.last_pwm,
+                         (smooth_att, delta_att, smooth_med, delta_med, effects['net_effect'], 0.0))
 
         self._send_fan_pwm(self.last_pwm)
         self.last_attention = smooth_att
         self.last_meditation = smooth_med
 
-    def _predict_eeg_labels(self):
-        if len(self.seq_buffer) < self.window_size:
-            print("Waiting for full EEG sequence window...")
-            return
-
-        seq = np.array(self.seq_buffer)[-self.window_size:]
+    def _predict_eeg_labels(self, seq=None):
+        """Predict on `seq` (a window snapshot) or on the current seq_buffer."""
+        if seq is None:
+            if len(self.seq_buffer) < self.window_size:
+                if self.events.console:
+                    print("Waiting for full EEG sequence window...")
+                return
+            if self.remote is not None:
+                self.remote.submit()  # shown by _show_remote_predictions once the worker answers
+                return
+            seq = np.array(self.seq_buffer)[-self.window_size:]
         seq = seq.reshape(1, self.window_size, len(feature_cols))
         try:
-            att_pred_prob, rel_pred_prob = self.model.predict(seq, verbose=0)
-            att_pred_class = np.argmax(att_pred_prob, axis=1)[0]
-            rel_pred_class = np.argmax(rel_pred_prob, axis=1)[0]
-            att_label = le_att_classes[att_pred_class]
-            rel_label = le_rel_classes[rel_pred_class]
-            print(f"\033[94m[EEG Model] Attention Prediction: {att_label}, Relaxation Prediction: {rel_label}\033[0m")
+            with self.instr.span('predict'):
+                att_pred_prob, rel_pred_prob = self.gate.predict(self.model, seq)
+            self._show_prediction(att_pred_prob[0], rel_pred_prob[0])
         except Exception as e:
             print(f"EEG prediction error: {e}")
 
-if __name__ == "__main__":
-    MindStateController().run()
-
-# -
+    def _show_remote_predictions(self):
+        for _, outputs, _ in self.remote.results():
+            if outputs is not None:
+                att_pred_prob, rel_pred_prob = outputs
+                self._show_prediction(att_pred_prob[0], rel_pred_prob[0])
 
+    def _show_prediction(self, att_prob, rel_prob):
+        # One row of model output per class head; labels are le_att_classes / le_rel_classes
+        self.events.emit(PREDICTION, int(np.argmax(att_prob)), int(np.argmax(rel_prob)),
+                         x=(*att_prob[:3], *rel_prob[:3]))
 
+    def _tag(self):
+        return f"[{self.name}] " if self.name else ""
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mind-state (fan) control")
+    parser.add_argument('--backend', default='numpy', choices=BACKENDS, help="Inference backend")
+    parser.add_argument('--model-variant', default='float32', choices=VARIANTS,
+                        help="Quantized / pruned model built by tools/optimize_models.py")
+    parser.add_argument('--parity-check', action='store_true', help="Compare the backend against keras at startup")
+    parser.add_argument('--host', default='localhost', help="ThinkGear Connector host")
+    parser.add_argument('--port', type=int, default=13854, help="ThinkGear Connector port")
+    parser.add_argument('--serial-port', default='COM4', help="ESP32 serial port or pyserial URL (e.g. socket://localhost:5331)")
+    parser.add_argument('--serial-protocol', default='text', choices=PROTOCOLS, help="ESP32 command encoding (framed = 5-byte checksummed frames)")
+    parser.add_argument('--serial-ack', action='store_true', help="Framed protocol: wait for the board's acknowledgement and retry")
+    parser.add_argument('--json-decoder', default='auto', choices=DECODERS, help="ThinkGear JSON decoder (auto prefers orjson, then ujson)")
+    parser.add_argument('--raw', action='store_true', help="Compute the 8 bands on the host from 512 Hz rawEeg")
+    parser.add_argument('--raw-rate-hz', type=float, default=8.0, help="Raw mode: band/feature updates per second")
+    parser.add_argument('--record', default=None, metavar='DIR', help="Record packets and feature rows to a new session under DIR")
+    parser.add_argument('--gate-threshold', type=float, default=0.0,
+                        help="Reuse the last prediction while no feature moved more than this fraction (0 = identical windows only)")
+    parser.add_argument('--gate-cache', type=int, default=64, help="Predictions kept for windows seen before (0 = no cache)")
+    parser.add_argument('--gate-quantum', type=float, default=0.0,
+                        help="Log-scale step at which cached windows count as the same (0 = exact match)")
+    parser.add_argument('--inference-process', action='store_true',
+                        help="Run the model in a worker process that reads windows from shared memory")
+    parser.add_argument('--event-log', default=None, metavar='FILE',
+                        help="Binary log of state, predictions and fan commands (view with tools/view_events.py)")
+    parser.add_argument('--event-log-mb', type=float, default=16, help="Event log size at which it is rotated")
+    parser.add_argument('--quiet', action='store_true', help="No state / prediction / fan output on the console")
+    parser.add_argument('--metrics-interval', type=float, default=0.0, help="Seconds between latency/throughput summaries (0 = no periodic summary)")
+    parser.add_argument('--metrics-file', default=None, help="Snapshot file rewritten with every summary (.json, or .prom for Prometheus text)")
+    parser.add_argument('--session', action='append', default=[], metavar='NAME=HOST:PORT,SERIAL',
+                        help="Multi-headset mode: one per headset, e.g. --session bedroom=localhost:13855,COM5")
+    parser.add_argument('--max-batch', type=int, default=32, help="Multi-headset mode: rows per batched predict")
+    parser.add_argument('--max-batch-delay', type=float, default=0.1, help="Multi-headset mode: seconds a tick waits for late sessions")
+    parser.add_argument('--pipeline', action='store_true', help="Run ingest/features/control/inference as concurrent stages")
+    parser.add_argument('--packet-overload', default='drop_oldest', choices=POLICIES, help="Pipeline: policy when features fall behind")
+    parser.add_argument('--inference-overload', default='coalesce', choices=POLICIES, help="Pipeline: policy when inference falls behind")
+    parser.add_argument('--report-interval', type=float, default=10.0, help="Pipeline: seconds between queue depth reports")
+    args = parser.parse_args()
+    if args.inference_process and (args.session or args.pipeline):
+        parser.error("--inference-process is for the single-headset loop (not --session or --pipeline)")
+    if args.session:
+        from multi_session import MultiSessionController, parse_session
+        model = load_variant("best_eeg_cnn_bilstm.h5", args.backend, args.model_variant)
+        warm_up(model, "best_eeg_cnn_bilstm.h5", batch=min(len(args.session), args.max_batch))
+        fuzzy = MindStateControlSystem(compiled=True)
+        sessions = []
+        for spec in args.session:
+            name, host, port, serial_port = parse_session(spec)
+            sessions.append(MindStateController(inference_backend=args.backend, host=host, port=port,
+                                                serial_port=serial_port, name=name, model=model, mind_control=fuzzy,
+                                                serial_protocol=args.serial_protocol, serial_ack=args.serial_ack,
+                                                json_decoder=args.json_decoder, raw_mode=args.raw,
+                                                raw_rate_hz=args.raw_rate_hz, record_dir=args.record,
+                                                gate_threshold=args.gate_threshold, gate_cache=args.gate_cache,
+                                                gate_quantum=args.gate_quantum, event_log=log_path_for(args.event_log, name),
+                                                event_log_bytes=int(args.event_log_mb * (1 << 20)), console=not args.quiet))
+        MultiSessionController(sessions, model, max_batch=args.max_batch, max_batch_delay=args.max_batch_delay,
+                               metrics_interval=args.metrics_interval, metrics_path=args.metrics_file).run()
+    else:
+        controller = MindStateController(inference_backend=args.backend, parity_check=args.parity_check,
+                                         host=args.host, port=args.port, serial_port=args.serial_port,
+                                         serial_protocol=args.serial_protocol, serial_ack=args.serial_ack,
+                                         json_decoder=args.json_decoder, raw_mode=args.raw, raw_rate_hz=args.raw_rate_hz,
+                                         record_dir=args.record, model_variant=args.model_variant,
+                                         gate_threshold=args.gate_threshold, gate_cache=args.gate_cache,
+                                         gate_quantum=args.gate_quantum, inference_process=args.inference_process,
+                                         event_log=args.event_log, event_log_bytes=int(args.event_log_mb * (1 << 20)),
+                                         console=not args.quiet,
+                                         metrics_interval=args.metrics_interval, metrics_path=args.metrics_file)
+        if args.pipeline:
+            from mind_pipeline import MindStatePipeline
+            MindStatePipeline(controller, packet_overload=args.packet_overload,
+                              inference_overload=args.inference_overload,
+                              report_interval=args.report_interval).run()
+        else:
+            controller.run()
 
+# -
@@ -0,0 +1,158 @@
+import time
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from stage_queue import OverloadQueue, POLICIES
+
+# +
+class MindStatePipeline:
+    """
+    Runs a MindStateController as four concurrent stages instead of one blocking loop:
+
+        ingest (socket read + JSON parse) -> features -> control tick (fuzzy + fan) -> inference
+
+    Stages are joined by bounded OverloadQueues, so a slow model call never stalls the
+    socket reader and control ticks keep their schedule. Each stage runs as a worker of a
+    ThreadPoolExecutor; the main thread only reports queue depths and waits for Ctrl+C.
+    """
+
+    def __init__(self, controller, packet_overload='drop_oldest', inference_overload='coalesce',
+                 packet_queue_size=256, inference_queue_size=4, report_interval=10.0):
+        for policy in (packet_overload, inference_overload):
+            if policy not in POLICIES:
+                raise ValueError(f"Unknown overload policy '{policy}', expected one of {POLICIES}")
+        self.ctrl = controller
+        self.packets = OverloadQueue('packets', packet_queue_size, packet_overload)
+        self.windows = OverloadQueue('inference', inference_queue_size, inference_overload)
+        self.report_interval = report_interval
+        self.stop_event = threading.Event()
+
+        # Shared between the feature and control stages
+        self._lock = threading.Lock()
+        self._latest_packet = None
+        self._fresh = False
+        self.late_ticks = 0
+
+    def run(self):
+        print("=== Mind Controlled System Active (pipelined) ===")
+        print("Format: [State] Att:Val(Δ)[Level] | Med:Val(Δ)[Level] | Net:Val")
+        stages = [self._ingest, self._features, self._control, self._inference]
+        executor = ThreadPoolExecutor(max_workers=len(stages), thread_name_prefix='mind-stage')
+        futures = [executor.submit(self._guard, stage) for stage in stages]
+        last_report = time.monotonic()
+        try:
+            while not self.stop_event.wait(0.5):
+                if time.monotonic() - last_report >= self.report_interval:
+                    self._report()
+                    last_report = time.monotonic()
+                self.ctrl.instr.tick()
+        except KeyboardInterrupt:
+            print("\nShutting down...")
+        finally:
+            self.stop_event.set()
+            executor.shutdown(wait=True)
+            for fut in futures:
+                fut.result()
+            self._report()
+            self.ctrl._send_fan_pwm(0)
+            self.ctrl.stream.close()
+            self.ctrl.actuators.close()
+            if self.ctrl.recorder is not None:
+                self.ctrl.recorder.close()
+            self.ctrl.events.close()
+            self.ctrl.instr.final_report()
+
+    def _guard(self, stage):
+        try:
+            stage()
+        except Exception as e:
+            print(f"[Pipeline] {stage.__name__.strip('_')} stage failed: {e}")
+            self.stop_event.set()
+
+    def _report(self):
+        parts = []
+        for q in (self.packets, self.windows):
+            s = q.stats()
+            self.ctrl.instr.set_gauge(f"queue_{s['name']}_depth", s['depth'])
+            self.ctrl.instr.set_gauge(f"queue_{s['name']}_dropped", s['dropped'])
+            parts.append(f"{s['name']} depth {s['depth']} (max {s['max_depth']}, dropped {s['dropped']}/{s['put']}, {s['policy']})")
+        print(f"[Pipeline] {' | '.join(parts)} | late ticks {self.late_ticks} | parse errors {self.ctrl.stream.malformed}")
+
+    # ---- Stages ----
+    def _ingest(self):
+        while not self.stop_event.is_set():
+            # Short timeout so the reader notices shutdown; partial frames stay in the stream's buffer
+            try:
+                packets = self.ctrl.stream.read(timeout=0.5)
+            except EOFError:
+                print("\n[Pipeline] Headset stream closed, shutting down...")
+                self.stop_event.set()
+                break
+            for data_dict in packets:
+                self.packets.put(data_dict)
+            if self.ctrl.band_power is not None:
+                samples = self.ctrl.stream.pop_raw()
+                if samples:
+                    self.packets.put(samples)
+
+    def _features(self):
+        while not self.stop_event.is_set():
+            data_dict = self.packets.get(timeout=0.5)
+            if data_dict is None:
+                continue
+            if isinstance(data_dict, list):
+                # Raw mode: a chunk of rawEeg samples becomes zero or more feature rows
+                with self._lock:
+                    self.ctrl._update_raw_features(data_dict)
+                continue
+            feat_row = None
+            if self.ctrl.band_power is not None:
+                self.ctrl._update_features(data_dict)  # calibration only
+            else:
+                t0 = time.perf_counter_ns()
+                feat_row = self.ctrl._extract_features(data_dict)
+                self.ctrl.instr.observe('features', t0)
+                self.ctrl._record(data_dict, feat_row)
+            with self._lock:
+                if feat_row is not None:
+                    self.ctrl.seq_buffer.append(feat_row)
+                self._latest_packet = data_dict
+                self._fresh = True
+
+    def _control(self):
+        interval = self.ctrl.control_update_interval
+        deadline = time.monotonic()
+        while not self.stop_event.is_set():
+            wait = deadline - time.monotonic()
+            if wait > 0 and self.stop_event.wait(wait):
+                break
+            deadline += interval
+            # Ticks missed while a tick overran are skipped rather than replayed back to back
+            now = time.monotonic()
+            if now > deadline:
+                self.late_ticks += int((now - deadline) // interval) + 1
+                deadline = now + interval
+
+            with self._lock:
+                # Only act on new data, as the sequential loop did: a stale packet would read as "no change"
+                if not self._fresh:
+                    continue
+                data_dict, self._fresh = self._latest_packet, False
+                window = None
+                if len(self.ctrl.seq_buffer) >= self.ctrl.window_size:
+                    window = np.array(self.ctrl.seq_buffer)[-self.ctrl.window_size:]
+
+            self.ctrl._process_mind_state(data_dict)
+            if window is None:
+                if self.ctrl.events.console:
+                    print("Waiting for full EEG sequence window...")
+            else:
+                self.windows.put(window)
+
+    def _inference(self):
+        while not self.stop_event.is_set():
+            window = self.windows.get(timeout=0.5)
+            if window is not None:
+                self.ctrl._predict_eeg_labels(window)
+# -
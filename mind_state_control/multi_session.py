@@ -0,0 +1,154 @@
+import time
+import selectors
+import numpy as np
+
+from instrumentation import Instrumentation
+
+# +
+def parse_session(spec):
+    """'name=host:port,serial_port' -> (name, host, port, serial_port)."""
+    name, _, rest = spec.partition('=')
+    endpoint, _, serial_port = rest.partition(',')
+    host, _, port = endpoint.rpartition(':')
+    if not (name and host and port and serial_port):
+        raise ValueError(f"Bad session '{spec}', expected name=host:port,serial_port")
+    return name, host, int(port), serial_port
+
+
+class MultiSessionController:
+    """
+    Serves several headsets from one process.
+
+    Each session is a MindStateController with its own ThinkGear stream, ESP32, feature engine
+    and smoothing history, but all of them share one loaded model and one fuzzy system.
+    One selector loop reads every stream. On each control tick (every control_update_interval),
+    sessions with new data run their fuzzy/fan update, and their sequence windows are
+    gathered into a single batched predict. Sessions with no packet since the last tick
+    may still join the batch if one arrives within `max_batch_delay` seconds. Batches are
+    capped at `max_batch` rows to bound the latency of one predict call. Windows a session's
+    InferenceGate can answer for (unchanged or cached) never join the batch.
+    """
+
+    def __init__(self, sessions, model, max_batch=32, max_batch_delay=0.1,
+                 metrics_interval=0.0, metrics_path=None):
+        self.all_sessions = list(sessions)
+        self.sessions = list(sessions)  # sessions whose stream is still open
+        self.model = model
+        self.max_batch = max_batch
+        self.max_batch_delay = max_batch_delay
+        self.interval = sessions[0].control_update_interval
+        self.instr = Instrumentation('multi_session', metrics_interval, metrics_path)
+
+        self.selector = selectors.DefaultSelector()
+        self._latest = {}    # session -> newest packet not yet used by a control update
+        for s in sessions:
+            self.selector.register(s.stream.fileno(), selectors.EVENT_READ, s)
+
+        # Current micro-batch
+        self._batch = []         # (session, window)
+        self._waiting = set()    # sessions that may still join the open tick
+        self._tick_open = False
+        self._batch_deadline = 0.0
+
+    def run(self):
+        print(f"=== Mind Controlled System Active ({len(self.sessions)} sessions) ===")
+        next_tick = time.monotonic()
+        try:
+            while self.sessions:
+                now = time.monotonic()
+                timeout = next_tick - now
+                if self._tick_open:
+                    timeout = min(timeout, self._batch_deadline - now)
+                for key, _ in self.selector.select(max(timeout, 0)):
+                    self._read(key.data)
+
+                now = time.monotonic()
+                if now >= next_tick:
+                    self._open_tick(now)
+                    next_tick += self.interval
+                    if next_tick <= now:
+                        next_tick = now + self.interval
+                if self._tick_open and (not self._waiting or now >= self._batch_deadline):
+                    self._flush()
+                    self._tick_open = False
+                    self._waiting.clear()
+                self.instr.tick()
+        except KeyboardInterrupt:
+            print("\nShutting down...")
+        finally:
+            for s in self.all_sessions:
+                s._send_fan_pwm(0)
+                s.stream.close()
+                s.actuators.close()
+                if s.recorder is not None:
+                    s.recorder.close()
+                s.events.close()
+                s.instr.final_report()
+            self.instr.final_report()
+
+    def _read(self, s):
+        try:
+            # The selector reported data, so this recv does not block
+            packets = s.stream.read(timeout=0)
+        except EOFError:
+            print(f"[{s.name}] Headset stream closed")
+            self.selector.unregister(s.stream.fileno())
+            self.sessions.remove(s)
+            self._waiting.discard(s)
+            return
+        for data_dict in packets:
+            s._update_features(data_dict)
+            self._latest[s] = data_dict
+        if s.band_power is not None:
+            s._update_raw_features(s.stream.pop_raw())
+
+        if s in self._waiting and s in self._latest:
+            self._waiting.discard(s)
+            self._contribute(s)
+
+    def _open_tick(self, now):
+        if self._tick_open:
+            self._flush()
+        self._tick_open = True
+        self._batch_deadline = now + self.max_batch_delay
+        self._waiting = set()
+        for s in self.sessions:
+            if s in self._latest:
+                self._contribute(s)
+            else:
+                self._waiting.add(s)
+
+    def _contribute(self, s):
+        # Control update on the session's newest packet, then queue its window for the batch
+        s._process_mind_state(self._latest.pop(s))
+        if len(s.seq_buffer) < s.window_size:
+            if s.events.console:
+                print(f"{s._tag()}Waiting for full EEG sequence window...")
+            return
+        window = np.array(s.seq_buffer)[-s.window_size:]
+        reused = s.gate.lookup(window[None])
+        if reused is not None:
+            s._show_prediction(reused[0][0], reused[1][0])
+            return
+        self._batch.append((s, window))
+        if len(self._batch) >= self.max_batch:
+            self._flush()
+
+    def _flush(self):
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+        windows = np.stack([w for _, w in batch])
+        try:
+            with self.instr.span('predict_batch'):
+                att_prob, rel_prob = self.model.predict(windows)
+        except Exception as e:
+            print(f"EEG prediction error: {e}")
+            return
+        self.instr.count('windows', len(batch))
+        self.instr.count('batches')
+        self.instr.set_gauge('last_batch_size', len(batch))
+        for i, (s, window) in enumerate(batch):
+            s.gate.store(window[None], (att_prob[i:i + 1], rel_prob[i:i + 1]))
+            s._show_prediction(att_prob[i], rel_prob[i])
+# -
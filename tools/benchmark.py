@@ -0,0 +1,183 @@
+"""
+Offline microbenchmarks for the controllers' hot paths, with a stored baseline.
+
+    python tools/benchmark.py --save-baseline      # record this machine's numbers
+    python tools/benchmark.py --threshold 0.25     # exit 1 if a case got >25% slower
+
+Controllers are built with connect=False, so no headset, serial port or ThinkGear
+Connector is needed. Packets come from a recorded CSV (default) or are synthetic.
+"""
+import os
+import sys
+import json
+import timeit
+import argparse
+import platform
+import itertools
+from contextlib import contextmanager
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+MIND_DIR = os.path.join(ROOT, 'mind_state_control')
+BLINK_DIR = os.path.join(ROOT, 'blink_control')
+for _path in (os.path.join(ROOT, 'common'), MIND_DIR, BLINK_DIR):
+    if _path not in sys.path:
+        sys.path.append(_path)
+
+from replay_server import load_session, BANDS
+from inference import BACKENDS, random_inputs
+
+DEFAULT_DATA = os.path.join(ROOT, 'data', 'all_data_labeled_final6.csv')
+DEFAULT_BASELINE = os.path.join(ROOT, '.cache', 'benchmark_baseline.json')
+BATCH_SIZES = (1, 8, 64)
+
+# +
+@contextmanager
+def in_dir(path):
+    # The controllers load their model/scaler files relative to their own directory
+    prev = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(prev)
+
+
+def synthetic_packets(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    packets = []
+    for _ in range(n):
+        packet = {
+            'eSense': {'attention': int(rng.integers(0, 101)), 'meditation': int(rng.integers(0, 101))},
+            'eegPower': {band: int(rng.lognormal(10, 1.5)) for band in BANDS},
+        }
+        if rng.random() < 0.3:
+            packet['blinkStrength'] = int(rng.integers(30, 256))
+        packets.append(packet)
+    return packets
+
+
+def build_controllers(backend):
+    with in_dir(MIND_DIR):
+        from main_att import MindStateController
+        mind = MindStateController(inference_backend=backend, connect=False)
+    with in_dir(BLINK_DIR):
+        from main import BlinkDetector
+        blink = BlinkDetector(inference_backend=backend, connect=False)
+    return mind, blink
+
+
+def build_cases(mind, blink, packets, seed=0):
+    """{name: zero-argument callable}; each call is one unit of work."""
+    rng = np.random.default_rng(seed)
+    cases = {}
+
+    packet_iter = itertools.cycle(packets)
+    cases['mind.extract_features'] = lambda: mind._extract_features(next(packet_iter))
+
+    att_med = itertools.cycle(rng.uniform(0, 100, size=(1024, 2)).tolist())
+    cases['mind.fuzzy.calculate_effects'] = lambda: mind.mind_control.calculate_effects(*next(att_med))
+
+    strengths = itertools.cycle(rng.uniform(0, 255, size=1024).tolist())
+    cases['blink.fuzzy.calculate_confidence'] = lambda: blink.fuzzy.calculate_confidence(next(strengths))
+
+    rows = [blink._extract_features(p) for p in packets]
+    for row in rows[:blink.window_size]:
+        blink._roll_buffer(row)
+    row_iter = itertools.cycle(rows)
+    cases['blink.roll_buffer'] = lambda: blink._roll_buffer(next(row_iter))
+    cases['blink.compute_engineered_features'] = lambda: blink._compute_engineered_features(blink.buf)
+    cases['blink.window.engineered_scaled'] = blink.window.engineered_scaled
+
+    for label, ctrl, directory, path in (
+            ('mind', mind, MIND_DIR, 'best_eeg_cnn_bilstm.h5'),
+            ('blink', blink, BLINK_DIR, 'best_eeg_cnn_bilstm_focal.h5')):
+        for batch in BATCH_SIZES:
+            x = random_inputs(os.path.join(directory, path), batch=batch, seed=seed)
+            cases[f'{label}.predict.batch{batch}'] = (lambda m=ctrl.model, x=x: m.predict(x))
+    return cases
+
+
+def measure(fn, min_time=0.2, repeat=5):
+    """Per-call time in microseconds: median and min over `repeat` rounds of at least `min_time` s."""
+    timer = timeit.Timer(fn)
+    number = 1
+    while timer.timeit(number) < min_time and number < 1 << 20:
+        number *= 2
+    rounds = [t / number * 1e6 for t in timer.repeat(repeat, number)]
+    return {'median_us': float(np.median(rounds)), 'min_us': float(np.min(rounds)), 'number': number}
+
+
+def compare(results, baseline, threshold):
+    """Cases whose median got slower than baseline by more than `threshold` (a fraction)."""
+    regressions = []
+    for name, res in results.items():
+        base = baseline.get('results', {}).get(name)
+        if not base:
+            continue
+        ratio = res['median_us'] / base['median_us']
+        if ratio > 1 + threshold:
+            regressions.append((name, base['median_us'], res['median_us'], ratio))
+    return regressions
+
+
+def environment():
+    import importlib.metadata as md
+    versions = {}
+    for pkg in ('numpy', 'scikit-fuzzy', 'tensorflow', 'tensorflow-cpu'):
+        try:
+            versions[pkg] = md.version(pkg)
+        except md.PackageNotFoundError:
+            pass
+    return {'python': platform.python_version(), 'machine': platform.machine(),
+            'processor': platform.processor(), 'packages': versions}
+# -
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the BCI hot paths against a stored baseline")
+    parser.add_argument('--backend', default='numpy', choices=BACKENDS, help="Inference backend for the predict cases")
+    parser.add_argument('--data', default=DEFAULT_DATA, help="Recorded CSV used as packet source")
+    parser.add_argument('--synthetic', action='store_true', help="Use synthetic packets instead of --data")
+    parser.add_argument('--filter', default=None, help="Only run cases whose name contains this string")
+    parser.add_argument('--min-time', type=float, default=0.2, help="Seconds per measurement round")
+    parser.add_argument('--repeat', type=int, default=5, help="Measurement rounds per case")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline JSON file")
+    parser.add_argument('--save-baseline', action='store_true', help="Store these results as the new baseline")
+    parser.add_argument('--threshold', type=float, default=0.25, help="Allowed slowdown vs baseline (0.25 = 25%%)")
+    parser.add_argument('--output', default=None, help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    packets = synthetic_packets() if args.synthetic else [p for _, p in load_session([args.data])][:5000]
+    mind, blink = build_controllers(args.backend)
+    cases = build_cases(mind, blink, packets)
+
+    results = {}
+    for name, fn in cases.items():
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = measure(fn, args.min_time, args.repeat)
+        print(f"{name:40s} {results[name]['median_us']:10.2f} µs  (min {results[name]['min_us']:.2f})")
+
+    report = {'backend': args.backend, 'source': 'synthetic' if args.synthetic else os.path.basename(args.data),
+              'environment': environment(), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for name, base, now, ratio in regressions:
+            print(f"REGRESSION {name}: {base:.2f} -> {now:.2f} µs ({ratio - 1:+.0%}, threshold {args.threshold:.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+    else:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
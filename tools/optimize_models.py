@@ -0,0 +1,228 @@
+"""
+Smaller variants of both models, scored against the labelled recordings.
+
+    python tools/optimize_models.py --backends numpy tflite --max-accuracy-drop 0.01
+
+For each model this builds, into variants/ next to the .h5:
+- float16 and int8 (NumPy: per-channel weight archives; TFLite: half weights, and
+  full-integer kernels calibrated on recorded windows),
+- pruned (magnitude pruning of every kernel to --sparsity, no fine-tuning) and pruned + int8.
+
+Every variant is scored on labelled windows built the way the training notebooks built
+them (mind-state: most common attention/relaxation label of each 20-row window, step 2;
+blink: blinkType of the window's last row, step 3, windows inside one session), with the
+features the live controllers compute. The report lists file size, model bytes held in
+memory, batch-1 latency, accuracy per output head and agreement with float32, and marks the
+smallest variant whose accuracy is within --max-accuracy-drop of float32 on every head.
+Controllers load a variant with --model-variant.
+"""
+import os
+import sys
+import csv
+import json
+import argparse
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+for _path in (os.path.join(ROOT, 'common'), os.path.join(ROOT, 'tools'),
+              os.path.join(ROOT, 'mind_state_control'), os.path.join(ROOT, 'blink_control')):
+    if _path not in sys.path:
+        sys.path.append(_path)
+
+from inference import NumpyBackend, TFLiteBackend, load_cached_backend, time_predict
+from model_variants import (VARIANTS, variant_path, prune_weights, save_numpy_variant, load_numpy_variant,
+                            write_pruned_h5, convert_tflite_variant)
+from replay_server import to_packet
+from score_sessions import MIND_DIR, BLINK_DIR, WINDOW, BlinkPreprocessing, mind_windows, load_packets, _predict
+
+MODELS = {
+    'mind': os.path.join(MIND_DIR, 'best_eeg_cnn_bilstm.h5'),
+    'blink': os.path.join(BLINK_DIR, 'best_eeg_cnn_bilstm_focal.h5'),
+}
+
+# +
+def _read_csv(path):
+    with open(path, newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def _encode(values, classes):
+    index = {c: i for i, c in enumerate(classes)}
+    return np.array([index[v] for v in values])
+
+
+def window_modes(labels, n_classes, size=WINDOW):
+    """Most common label of every `size`-row window (ties go to the lowest class, as np.unique)."""
+    counts = np.cumsum(np.eye(n_classes, dtype=int)[labels], axis=0)
+    counts = np.vstack([np.zeros((1, n_classes), int), counts])
+    return np.argmax(counts[size:] - counts[:-size], axis=1)
+
+
+def mind_dataset(path, step=2):
+    """(windows, {head: labels}) for the mind-state model."""
+    rows = _read_csv(path)
+    windows = mind_windows([to_packet(r) for r in rows])
+    heads = {}
+    for head, col, classes_file in (('attention', 'attention_label', 'le_att_classes.npy'),
+                                    ('relaxation', 'relaxation_label', 'le_rel_classes.npy')):
+        classes = [str(c) for c in np.load(os.path.join(MIND_DIR, classes_file), allow_pickle=True)]
+        heads[head] = window_modes(_encode([r[col] for r in rows], classes), len(classes))
+    # Training windows started at 0, 2, 4, ... and never included the last row
+    starts = np.arange(0, len(rows) - WINDOW, step)
+    return windows[starts], {head: y[starts] for head, y in heads.items()}
+
+
+def blink_dataset(path, step=3, blink_threshold=60):
+    """([scaled windows, scaled engineered features], {'blink': labels}) for the blink model."""
+    rows = _read_csv(path)
+    prep = BlinkPreprocessing()
+    raw = prep.rows(np.array([float(r['time']) for r in rows]), [to_packet(r) for r in rows])
+    windows = np.lib.stride_tricks.sliding_window_view(raw, WINDOW, axis=0).transpose(0, 2, 1)
+    sessions = np.array([r['session_id'] for r in rows])
+    starts = np.arange(0, len(rows) - WINDOW + 1, step)
+    starts = starts[sessions[starts] == sessions[starts + WINDOW - 1]]
+    labels = np.array([int(float(r['blinkType'])) for r in rows])[starts + WINDOW - 1]
+    return prep.inputs(windows[starts], blink_threshold), {'blink': labels}
+
+
+def calibration_set(inputs, n, seed=0):
+    """`n` random single-window model inputs for int8 calibration."""
+    xs = inputs if isinstance(inputs, list) else [inputs]
+    picks = np.random.default_rng(seed).choice(len(xs[0]), min(n, len(xs[0])), replace=False)
+    if isinstance(inputs, list):
+        return [[x[i:i + 1] for x in xs] for i in picks]
+    return [inputs[i:i + 1] for i in picks]
+
+
+def model_bytes(backend):
+    if isinstance(backend, TFLiteBackend):
+        return len(backend.model_content)
+    return sum(w.nbytes for ws in backend.weights.values() for w in ws)
+
+
+def evaluate(backend, inputs, labels, reference=None, batch_size=512):
+    """Accuracy per head, and agreement with the float32 predictions in `reference`."""
+    outputs = _predict(backend, inputs, batch_size)
+    preds = {head: out.argmax(axis=1) for head, out in zip(labels, outputs)}
+    result = {f'acc_{head}': float(np.mean(preds[head] == y)) for head, y in labels.items()}
+    if reference is not None:
+        result.update({f'agree_{head}': float(np.mean(preds[head] == reference[head])) for head in labels})
+    return result, preds
+
+
+def build_variant(model_path, backend_kind, variant, config, weights, pruned, calibration):
+    """(backend, artifact file, artifact bytes) for one variant."""
+    precision = 'int8' if variant.endswith('int8') else ('float16' if variant == 'float16' else 'float32')
+    source = pruned if variant.startswith('pruned') else weights
+    if backend_kind == 'numpy':
+        if variant == 'float32':
+            return load_cached_backend(model_path, 'numpy'), model_path, os.path.getsize(model_path)
+        out = variant_path(model_path, variant, '.npz')
+        save_numpy_variant(out, config, source, variant)
+        return load_numpy_variant(model_path, out), out, os.path.getsize(out)
+    if variant == 'float32':
+        # The startup cache already holds the float32 flatbuffer
+        backend = load_cached_backend(model_path, 'tflite')
+        return backend, model_path, len(backend.model_content)
+    h5 = variant_path(model_path, 'pruned', '.h5') if variant.startswith('pruned') else model_path
+    out = variant_path(model_path, variant, '.tflite')
+    content = convert_tflite_variant(h5, precision, calibration)
+    with open(out, 'wb') as f:
+        f.write(content)
+    return TFLiteBackend(out), out, len(content)
+
+
+def optimize(name, model_path, inputs, labels, backends, variants, sparsity, n_calibration, max_drop,
+             calibration_inputs=None):
+    config, weights = NumpyBackend.read_h5(model_path)
+    pruned = prune_weights(weights, sparsity)
+    os.makedirs(os.path.dirname(variant_path(model_path, 'float32', '')), exist_ok=True)
+    if any(v.startswith('pruned') for v in variants):
+        write_pruned_h5(model_path, variant_path(model_path, 'pruned', '.h5'), pruned)
+    calibration = calibration_set(inputs if calibration_inputs is None else calibration_inputs, n_calibration)
+    single = calibration_set(inputs, 1)[0]
+    report = []
+    for kind in backends:
+        reference = None
+        for variant in variants:
+            try:
+                backend, artifact, size = build_variant(model_path, kind, variant, config, weights, pruned, calibration)
+            except Exception as e:
+                print(f"[Optimize] {name} {kind} {variant}: build failed ({e})")
+                continue
+            scores, preds = evaluate(backend, inputs, labels, reference)
+            if variant == 'float32':
+                reference = preds
+            entry = {'model': name, 'backend': kind, 'variant': variant, 'file': os.path.relpath(artifact, ROOT),
+                     'file_kb': size / 1024, 'memory_kb': model_bytes(backend) / 1024,
+                     'latency_ms': time_predict(backend, single, repeats=100), **scores}
+            report.append(entry)
+            print(_format(entry, labels))
+
+        # Smallest file that stays within max_drop of float32 on every head
+        base = next((e for e in report if e['backend'] == kind and e['variant'] == 'float32'), None)
+        if base is None:
+            continue
+        ok = [e for e in report if e['backend'] == kind and e['model'] == name
+              and all(base[f'acc_{h}'] - e[f'acc_{h}'] <= max_drop for h in labels)]
+        best = min(ok, key=lambda e: e['file_kb'])
+        best['selected'] = True
+        print(f"[Optimize] {name} {kind}: smallest within {max_drop:.1%} of float32 accuracy -> "
+              f"{best['variant']} ({best['file_kb']:.0f} KB, --backend {kind} --model-variant {best['variant']})")
+    return report
+
+
+def _format(e, labels):
+    accs = '  '.join(f"{h} {e[f'acc_{h}']:.3f}" + (f" (agree {e[f'agree_{h}']:.3f})" if f'agree_{h}' in e else '')
+                     for h in labels)
+    return (f"{e['model']:5s} {e['backend']:6s} {e['variant']:11s} {e['file_kb']:8.0f} KB file "
+            f"{e['memory_kb']:8.0f} KB mem {e['latency_ms']:7.3f} ms  {accs}")
+# -
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build quantized / pruned model variants and report accuracy and latency")
+    parser.add_argument('--models', nargs='+', default=list(MODELS), choices=list(MODELS))
+    parser.add_argument('--backends', nargs='+', default=['numpy', 'tflite'], choices=['numpy', 'tflite'])
+    parser.add_argument('--variants', nargs='+', default=list(VARIANTS), choices=VARIANTS)
+    parser.add_argument('--mind-data', default=os.path.join(ROOT, 'data', 'all_data_labeled_att_Rel.csv'),
+                        help="CSV with attention_label / relaxation_label columns")
+    parser.add_argument('--blink-data', default=os.path.join(ROOT, 'data', 'all_data_labeled_final6.csv'),
+                        help="CSV with blinkType / session_id columns")
+    parser.add_argument('--calibration', nargs='*', default=None,
+                        help="Recordings (captures, CSVs or --record sessions) for int8 calibration instead of the labelled data")
+    parser.add_argument('--calibration-windows', type=int, default=200, help="Windows used for int8 calibration")
+    parser.add_argument('--sparsity', type=float, default=0.2, help="Fraction of every kernel pruned to zero")
+    parser.add_argument('--max-accuracy-drop', type=float, default=0.01, help="Accepted accuracy loss per head vs float32")
+    parser.add_argument('--report', default=None, help="Write the report as JSON")
+    args = parser.parse_args()
+
+    if 'tflite' in args.backends:
+        try:
+            import tensorflow  # noqa: F401  (needed to convert, not to run)
+        except ImportError:
+            print("[Optimize] TensorFlow is not installed, skipping the TFLite variants")
+            args.backends.remove('tflite')
+    variants = ['float32'] + [v for v in args.variants if v != 'float32']
+    report = []
+    for name in args.models:
+        if name == 'mind':
+            inputs, labels = mind_dataset(args.mind_data)
+        else:
+            inputs, labels = blink_dataset(args.blink_data)
+        calib_inputs = None
+        if args.calibration:
+            packets = [p for path in args.calibration for p in load_packets(path)[1]]
+            if name == 'mind':
+                calib_inputs = mind_windows(packets)
+            else:
+                prep = BlinkPreprocessing()
+                times = np.concatenate([load_packets(path)[0] for path in args.calibration])
+                raw = np.lib.stride_tricks.sliding_window_view(prep.rows(times, packets), WINDOW, axis=0)
+                calib_inputs = prep.inputs(raw.transpose(0, 2, 1))
+        print(f"[Optimize] {name}: {len(labels[next(iter(labels))])} labelled windows")
+        report += optimize(name, MODELS[name], inputs, labels, args.backends, variants, args.sparsity,
+                           args.calibration_windows, args.max_accuracy_drop, calib_inputs)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=1)
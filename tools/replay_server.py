@@ -0,0 +1,324 @@
+"""
+Local stand-ins for the ThinkGear Connector and the ESP32, so the controllers run without hardware.
+
+    python tools/replay_server.py data/all_data_labeled_final6.csv --speed 10 --record commands.csv
+
+streams the recorded session as ThinkGear JSON on localhost:13854 and accepts the controllers'
+serial commands on localhost:5331; point them there with
+
+    python main.py --serial-port socket://localhost:5331
+
+Sessions recorded by the controllers (--record) replay the same way from their directories.
+Every FAN: / ServoAngle: line is recorded with wall-clock and monotonic timestamps. Commands sent
+with --serial-protocol framed are decoded (and acknowledged when asked) and recorded the same way.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import socket
+import argparse
+import threading
+import socketserver
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from actuators import FRAME_START, decode_frame, encode_ack, format_command
+from session_store import META_FILE, SessionStore
+
+# +
+BANDS = ['delta', 'theta', 'lowAlpha', 'highAlpha', 'lowBeta', 'highBeta', 'lowGamma', 'highGamma']
+
+
+def to_packet(row):
+    """One recorded CSV row as the ThinkGear JSON packet it was captured from."""
+    packet = {
+        'eSense': {'attention': int(float(row['attention'])), 'meditation': int(float(row['meditation']))},
+        'eegPower': {band: int(float(row[band])) for band in BANDS},
+        'poorSignalLevel': 0,
+    }
+    blink = int(float(row.get('blinkStrength') or 0))
+    if blink > 0:
+        packet['blinkStrength'] = blink
+    return packet
+
+
+def load_session(paths, session=None):
+    """
+    Packets from recorded CSVs as a list of (offset_seconds, packet).
+
+    Offsets follow the 'time' column; it restarts at every recording session, in which case
+    the next packet is sent right after the previous one. `session` keeps a single session_id.
+    """
+    packets = []
+    offset = 0.0
+    for path in paths:
+        with open(path, newline='') as f:
+            prev_t = None
+            for row in csv.DictReader(f):
+                if session is not None and row.get('session_id') not in (None, str(session)):
+                    continue
+                t = float(row['time'])
+                if prev_t is not None:
+                    offset += max(t - prev_t, 0.0)
+                prev_t = t
+                packets.append((offset, to_packet(row)))
+    return packets
+
+
+class RecordedSession:
+    """
+    (offset_seconds, packet) pairs of controller recordings (--record session directories),
+    read block by block from the memory-mapped store on every pass instead of held in RAM.
+    Recordings follow each other like the sessions of load_session().
+    """
+
+    def __init__(self, paths):
+        self.stores = [SessionStore(path) for path in paths]
+        self.duration = sum(float(s['time'][-1] - s['time'][0]) for s in self.stores if len(s))
+
+    def __len__(self):
+        return sum(len(s) for s in self.stores)
+
+    def __iter__(self):
+        offset = 0.0
+        for store in self.stores:
+            prev_t = None
+            for t, packet in store.packets():
+                if prev_t is not None:
+                    offset += max(t - prev_t, 0.0)
+                prev_t = t
+                yield offset, packet
+
+
+def is_recording(path):
+    return os.path.exists(os.path.join(path, META_FILE))
+
+
+class ThinkGearReplayServer(socketserver.ThreadingTCPServer):
+    """
+    Speaks the ThinkGear Connector JSON protocol: every client that connects gets the recorded
+    packets as '\\r'-terminated JSON lines, paced at `speed` times real time (0 = as fast as possible).
+    With `raw_rate` > 0, synthetic rawEeg samples (noise with a 10 Hz alpha component) are
+    interleaved at that many samples per recorded second, for the controllers' --raw mode.
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, packets, host='localhost', port=13854, speed=1.0, loop=False, raw_rate=0):
+        self.packets = packets
+        self.raw_rate = raw_rate
+        self.speed = speed
+        self.loop = loop
+        self.replays = []  # (client, packets sent, seconds until it disconnected) per connection
+        self.replay_done = threading.Event()
+        super().__init__((host, port), _ReplayHandler)
+
+
+class _ReplayHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        sock = self.request
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # Clients open with a format request ({"enableRawOutput": false, "format": "Json"}); it is not needed here
+        sock.settimeout(0.2)
+        try:
+            sock.recv(4096)
+        except (socket.timeout, OSError):
+            pass
+        sock.settimeout(None)
+
+        sent = 0
+        raw = _RawSignal(server.raw_rate) if server.raw_rate > 0 else None
+        start = time.monotonic()
+        try:
+            while True:
+                base = time.monotonic()
+                prev = 0.0
+                for offset, packet in server.packets:
+                    if server.speed > 0:
+                        wait = base + offset / server.speed - time.monotonic()
+                        if wait > 0:
+                            time.sleep(wait)
+                    if raw is not None:
+                        sock.sendall(raw.frames(offset - prev))
+                        prev = offset
+                    sock.sendall(json.dumps(packet).encode() + b'\r')
+                    sent += 1
+                if not server.loop:
+                    break
+            # Half-close so the client drains what is buffered, sees EOF and hangs up
+            sock.shutdown(socket.SHUT_WR)
+            while sock.recv(4096):
+                pass
+        except OSError:
+            pass  # client went away
+        elapsed = time.monotonic() - start
+        server.replays.append((self.client_address, sent, elapsed))
+        print(f"[Replay] {self.client_address[0]}:{self.client_address[1]} consumed {sent} packets "
+              f"in {elapsed:.2f}s ({sent / max(elapsed, 1e-9):.0f} packets/s)")
+        server.replay_done.set()
+
+
+class _RawSignal:
+    """Synthetic 12-bit rawEeg stream: Gaussian noise plus a 10 Hz alpha rhythm."""
+
+    def __init__(self, rate, seed=0):
+        self.rate = rate
+        self.rng = np.random.default_rng(seed)
+        self.t = 0
+        self.carry = 0.0
+
+    def frames(self, seconds):
+        self.carry += seconds * self.rate
+        n = int(self.carry)
+        self.carry -= n
+        t = (self.t + np.arange(n)) / self.rate
+        self.t += n
+        values = np.clip(self.rng.normal(0, 60, n) + 40 * np.sin(2 * np.pi * 10 * t), -2048, 2047).astype(int)
+        return b''.join(b'{"rawEeg":%d}\r' % v for v in values)
+
+
+MAX_LINE = 64  # longer than any text command; the sketch drops such lines too
+
+
+class SerialSink(socketserver.ThreadingTCPServer):
+    """
+    Fake ESP32 reachable as pyserial URL socket://host:port. Records every command line
+    as (wall time, monotonic time, command), optionally appending them to a CSV file.
+    Framed commands are recorded in their text form. Corrupt frames, and stray bytes dropped
+    when a frame starts or a line grows past MAX_LINE, are counted in `bad_frames`.
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, host='localhost', port=5331, record_path=None):
+        self.commands = []
+        self.bad_frames = 0
+        self._lock = threading.Lock()
+        self._record = None
+        if record_path:
+            self._record = open(record_path, 'w', newline='')
+            self._writer = csv.writer(self._record)
+            self._writer.writerow(['wall_time', 'monotonic', 'command'])
+        super().__init__((host, port), _SinkHandler)
+
+    def record(self, command):
+        entry = (time.time(), time.monotonic(), command)
+        with self._lock:
+            self.commands.append(entry)
+            if self._record:
+                self._writer.writerow(entry)
+                self._record.flush()
+
+    def server_close(self):
+        super().server_close()
+        if self._record:
+            self._record.close()
+
+
+class _SinkHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        # Same dispatch as the sketch: 0xA5 starts a 5-byte frame, anything else is a text line.
+        # 0xA5 never occurs in a text command, so it always resyncs after stray bytes
+        sock = self.request
+        frame = None
+        line = bytearray()
+        while True:
+            try:
+                data = sock.recv(4096)
+            except OSError:
+                return
+            if not data:
+                return
+            for byte in data:
+                if frame is not None:
+                    frame.append(byte)
+                    if len(frame) == 5:
+                        if self._frame(bytes(frame)):
+                            frame = None
+                        else:
+                            # Misaligned after a short frame: resync on an 0xA5 inside it
+                            i = frame.find(FRAME_START, 1)
+                            frame = frame[i:] if i > 0 else None
+                elif byte == FRAME_START:
+                    if line:
+                        self.server.bad_frames += 1
+                        line.clear()
+                    frame = bytearray((byte,))
+                elif byte in b'\r\n':
+                    command = line.decode('utf-8', errors='ignore').strip()
+                    if command:
+                        self.server.record(command)
+                    line.clear()
+                elif len(line) >= MAX_LINE:
+                    self.server.bad_frames += 1
+                    line.clear()
+                else:
+                    line.append(byte)
+
+    def _frame(self, frame):
+        decoded = decode_frame(frame)
+        if decoded is None:
+            self.server.bad_frames += 1
+            return False
+        actuator, value, seq, ack = decoded
+        if ack:
+            self.request.sendall(encode_ack(seq))
+        self.server.record(format_command(actuator, value))
+        return True
+
+
+def serve(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return thread
+# -
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded EEG sessions as a ThinkGear Connector")
+    parser.add_argument('csv', nargs='+', help="Recorded session CSV(s) from data/, or --record session directories")
+    parser.add_argument('--session', type=int, default=None, help="Only replay this session_id")
+    parser.add_argument('--speed', type=float, default=1.0, help="Playback speed factor (0 = as fast as possible)")
+    parser.add_argument('--loop', action='store_true', help="Restart the recording when it ends")
+    parser.add_argument('--raw-rate', type=int, default=0, help="Interleave synthetic rawEeg samples at this rate (e.g. 512)")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=13854, help="ThinkGear port")
+    parser.add_argument('--serial-port', type=int, default=5331, help="Fake ESP32 port (0 = disabled)")
+    parser.add_argument('--record', default=None, help="CSV file for the received serial commands")
+    parser.add_argument('--once', action='store_true', help="Exit once the first client has consumed the replay and disconnected")
+    parser.add_argument('--linger', type=float, default=2.0, help="With --once: seconds to keep recording commands afterwards")
+    args = parser.parse_args()
+
+    if all(is_recording(path) for path in args.csv):
+        packets = RecordedSession(args.csv)
+        duration = packets.duration
+    elif any(is_recording(path) for path in args.csv):
+        sys.exit("Replay either CSVs or recorder sessions, not both")
+    else:
+        packets = load_session(args.csv, args.session)
+        duration = packets[-1][0] if packets else 0
+    print(f"[Replay] {len(packets)} packets, {duration:.1f}s recorded, speed "
+          f"{'max' if args.speed <= 0 else f'{args.speed:g}x'}, ThinkGear on {args.host}:{args.port}")
+    servers = [ThinkGearReplayServer(packets, args.host, args.port, args.speed, args.loop, args.raw_rate)]
+    if args.serial_port:
+        servers.append(SerialSink(args.host, args.serial_port, args.record))
+        print(f"[Replay] Fake ESP32 on socket://{args.host}:{args.serial_port}"
+              + (f", recording to {os.path.abspath(args.record)}" if args.record else ""))
+    for server in servers:
+        serve(server)
+    try:
+        if args.once:
+            servers[0].replay_done.wait()
+            time.sleep(args.linger)
+        else:
+            threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+        if args.serial_port:
+            print(f"[Replay] {len(servers[1].commands)} serial commands received")
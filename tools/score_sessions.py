@@ -0,0 +1,223 @@
+"""
+Offline scoring of recorded sessions with both models, many files in parallel.
+
+    python tools/score_sessions.py archive/ --out scores/ --workers 8
+
+Each input is a ThinkGear JSON capture (one packet per '\\r' or '\\n' terminated line), a
+recorded CSV from data/ or a controller recording (--record session directory). Packets
+are filtered like the live stream (eSense / eegPower / blinkStrength), features are
+computed for the whole file at once with the same results the live loops get packet by
+packet, and every 20-packet window is scored by the mind-state and blink models in
+large batches. Output is one <name>.scores.csv per input with per-window labels and
+class probabilities.
+"""
+import os
+import sys
+import csv
+import glob
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+MIND_DIR = os.path.join(ROOT, 'mind_state_control')
+BLINK_DIR = os.path.join(ROOT, 'blink_control')
+for _path in (os.path.join(ROOT, 'common'), MIND_DIR, BLINK_DIR):
+    if _path not in sys.path:
+        sys.path.append(_path)
+
+from replay_server import to_packet, is_recording
+from session_store import SessionStore
+from inference import BACKENDS, load_cached_backend
+from thinkgear import CONTROL_FIELDS, get_decoder
+from feature_engine import batch_features, bands
+from window_store import batch_engineered, scaler_affine
+
+WINDOW = 20
+BLINK_CLASSES = ('none', 'single', 'double')
+
+# +
+_models = None
+
+
+class BlinkPreprocessing:
+    """The blink model's window columns and the affine forms of its two StandardScalers."""
+
+    def __init__(self):
+        import joblib
+        with open(os.path.join(BLINK_DIR, 'windowed_feature_cols.json')) as f:
+            self.cols = json.load(f)
+        window_scaler = joblib.load(os.path.join(BLINK_DIR, 'scaler_seq.pkl'))
+        feats_scaler = joblib.load(os.path.join(BLINK_DIR, 'scaler_feats.pkl'))
+        self.seq_mean, self.seq_scale = scaler_affine(window_scaler, len(self.cols))
+        self.feats_mean, self.feats_scale = scaler_affine(feats_scaler, feats_scaler.n_features_in_)
+
+    def rows(self, times, packets):
+        """BlinkDetector._extract_features rows, with the recording's own times."""
+        rows = np.empty((len(packets), len(self.cols)))
+        for i, p in enumerate(packets):
+            es, bp = p.get('eSense', {}), p.get('eegPower', {})
+            rows[i, :2] = es.get('attention', 50), es.get('meditation', 50)
+            rows[i, 2:10] = [bp.get(b, 0) for b in bands]
+            rows[i, 10] = p.get('blinkStrength', 0)
+        rows[:, 11] = times
+        return rows
+
+    def inputs(self, windows, blink_threshold=60):
+        """[scaled windows, scaled engineered features] for (k, 20, 12) raw windows."""
+        seq_scaled = (windows - self.seq_mean) / self.seq_scale
+        feats = batch_engineered(windows, self.cols, blink_threshold)
+        return [seq_scaled, (feats - self.feats_mean) / self.feats_scale]
+
+
+def mind_windows(packets):
+    """Every 20-row window of the mind-state model's feature rows, as a (k, 20, 66) view."""
+    band_rows = np.array([[p.get('eegPower', {}).get(b, 0) for b in bands] for p in packets], dtype=float)
+    return np.lib.stride_tricks.sliding_window_view(batch_features(band_rows), WINDOW, axis=0).transpose(0, 2, 1)
+
+
+class _Models:
+    """Everything a worker loads once: both models, the blink preprocessing and the label encoders."""
+
+    def __init__(self, backend):
+        self.mind = load_cached_backend(os.path.join(MIND_DIR, 'best_eeg_cnn_bilstm.h5'), backend)
+        self.blink = load_cached_backend(os.path.join(BLINK_DIR, 'best_eeg_cnn_bilstm_focal.h5'), backend)
+        self.att_classes = [str(c) for c in np.load(os.path.join(MIND_DIR, 'le_att_classes.npy'), allow_pickle=True)]
+        self.rel_classes = [str(c) for c in np.load(os.path.join(MIND_DIR, 'le_rel_classes.npy'), allow_pickle=True)]
+        self.blink_prep = BlinkPreprocessing()
+
+
+def _init_worker(backend):
+    global _models
+    _models = _Models(backend)
+
+
+def load_packets(path, decoder='auto'):
+    """
+    (times, packets) of a capture. Times are the recording's own (the CSV 'time' column, or a
+    packet's 'time' key), which is what the blink scaler was fitted on; JSON captures without
+    one are taken as 1 packet/s.
+    """
+    if is_recording(path):
+        store = SessionStore(path)
+        times, packets = zip(*store.packets()) if len(store) else ((), ())
+        return np.array(times, dtype=float), list(packets)
+    if path.endswith('.csv'):
+        with open(path, newline='') as f:
+            rows = list(csv.DictReader(f))
+        return np.array([float(r['time']) for r in rows]), [to_packet(r) for r in rows]
+    loads, _ = get_decoder(decoder)
+    with open(path, 'rb') as f:
+        data = f.read()
+    packets = []
+    for line in data.replace(b'\r', b'\n').split(b'\n'):
+        if not line.strip():
+            continue
+        try:
+            packet = loads(line)
+        except Exception:
+            continue
+        if isinstance(packet, dict) and any(k in packet for k in CONTROL_FIELDS):
+            packets.append(packet)
+    times = np.array([p.get('time', i) for i, p in enumerate(packets)], dtype=float)
+    return times, packets
+
+
+def _predict(model, inputs, batch_size):
+    """Predict over the first axis in batches; `inputs` is one array or a list of arrays."""
+    single = not isinstance(inputs, list)
+    xs = [inputs] if single else inputs
+    outputs = None
+    for start in range(0, len(xs[0]), batch_size):
+        chunk = [np.ascontiguousarray(x[start:start + batch_size], dtype=np.float32) for x in xs]
+        out = model.predict(chunk[0] if single else chunk)
+        out = [out] if not isinstance(out, (list, tuple)) else list(out)
+        outputs = [[o] for o in out] if outputs is None else [acc + [o] for acc, o in zip(outputs, out)]
+    return [np.concatenate(o) for o in outputs]
+
+
+def score_file(path, out_dir, batch_size=1024, blink_threshold=60, decoder='auto'):
+    start = time.perf_counter()
+    m = _models
+    times, packets = load_packets(path, decoder)
+    n = len(packets)
+    out_path = os.path.join(out_dir, os.path.splitext(os.path.basename(os.path.normpath(path)))[0] + '.scores.csv')
+    if n < WINDOW:
+        return {'file': path, 'packets': n, 'windows': 0, 'seconds': time.perf_counter() - start}
+
+    # Mind-state: the feature_cols.json vector for every packet, then every 20-row window
+    att_prob, rel_prob = _predict(m.mind, mind_windows(packets), batch_size)
+
+    # Blink: scaled windows plus the engineered window features
+    blink_windows = np.lib.stride_tricks.sliding_window_view(
+        m.blink_prep.rows(times, packets), WINDOW, axis=0).transpose(0, 2, 1)
+    (blink_prob,) = _predict(m.blink, m.blink_prep.inputs(blink_windows, blink_threshold), batch_size)
+
+    header = (['packet', 'time', 'attention']
+              + [f'attention_p_{c}' for c in m.att_classes] + ['relaxation']
+              + [f'relaxation_p_{c}' for c in m.rel_classes] + ['blink']
+              + [f'blink_p_{c}' for c in BLINK_CLASSES])
+    att_idx, rel_idx, blink_idx = att_prob.argmax(1), rel_prob.argmax(1), blink_prob.argmax(1)
+    ends = np.arange(WINDOW - 1, n)
+    with open(out_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(
+            [int(e), f'{times[e]:.3f}', m.att_classes[a], *(f'{x:.5f}' for x in ap),
+             m.rel_classes[r], *(f'{x:.5f}' for x in rp), BLINK_CLASSES[b], *(f'{x:.5f}' for x in bp)]
+            for e, a, ap, r, rp, b, bp in zip(ends, att_idx, att_prob, rel_idx, rel_prob, blink_idx, blink_prob))
+    return {'file': path, 'packets': n, 'windows': len(ends), 'seconds': time.perf_counter() - start}
+
+
+def _score_one(job):
+    return score_file(*job)
+
+
+def collect_inputs(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path) and not is_recording(path):
+            for ext in ('*.json', '*.jsonl', '*.txt', '*.csv'):
+                files += glob.glob(os.path.join(path, ext))
+            files += [d for d in glob.glob(os.path.join(path, '*', '')) if is_recording(d)]
+        else:
+            files.append(path)
+    return sorted(set(files))
+# -
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score recorded EEG sessions with the mind-state and blink models")
+    parser.add_argument('inputs', nargs='+', help="Capture files or directories of them")
+    parser.add_argument('--out', default='scores', help="Output directory for <name>.scores.csv")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Worker processes (0 = score in this process)")
+    parser.add_argument('--backend', default='numpy', choices=BACKENDS, help="Inference backend")
+    parser.add_argument('--batch-size', type=int, default=1024, help="Windows per predict call")
+    parser.add_argument('--blink-threshold', type=float, default=60, help="Blink threshold for the engineered features")
+    parser.add_argument('--json-decoder', default='auto', help="JSON decoder for captures (auto, json, orjson, ujson)")
+    args = parser.parse_args()
+
+    files = collect_inputs(args.inputs)
+    if not files:
+        sys.exit("No input files")
+    os.makedirs(args.out, exist_ok=True)
+    jobs = [(path, args.out, args.batch_size, args.blink_threshold, args.json_decoder) for path in files]
+    start = time.perf_counter()
+    if args.workers == 0:
+        _init_worker(args.backend)
+        results = map(_score_one, jobs)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(args.workers, initializer=_init_worker, initargs=(args.backend,))
+        results = executor.map(_score_one, jobs)
+    packets = windows = 0
+    for res in results:
+        packets += res['packets']
+        windows += res['windows']
+        print(f"{res['file']}: {res['packets']} packets, {res['windows']} windows in {res['seconds']:.1f}s")
+    if executor is not None:
+        executor.shutdown()
+    elapsed = time.perf_counter() - start
+    print(f"Scored {len(files)} files, {windows} windows in {elapsed:.1f}s ({windows / max(elapsed, 1e-9):.0f} windows/s)")
@@ -0,0 +1,285 @@
+"""
+Accelerated soak test: a simulated day of headset traffic through the controllers, with
+memory and CPU growth checks.
+
+    python tools/soak_test.py --controller combined --hours 24 --max-rss-growth 20
+
+Controllers are built with connect=False and fed packets through the same PacketBus
+plugins as combined_control/main_combined.py, as fast as they are processed. The
+controllers' wall clock is simulated: every packet advances it by the recorded
+inter-packet time (replay), or by 1/--packet-rate (synthetic). So control ticks,
+predictions and blink timing happen as often per simulated hour as they would live. Serial
+commands go to a null port through the real write-behind queue.
+
+Every --sample-minutes of simulated time the report records RSS, tracemalloc's traced
+size and CPU time per packet. At the end it lists the allocation sites that grew most
+since warm-up. The run fails (exit 1) if RSS or traced memory grew by more than the
+allowed MB over the second half of the run after --warmup-hours, or if CPU per packet
+grew by more than --max-cpu-growth between the first and last full pass over the
+packets after warm-up.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+MIND_DIR = os.path.join(ROOT, 'mind_state_control')
+BLINK_DIR = os.path.join(ROOT, 'blink_control')
+for _path in (os.path.join(ROOT, 'common'), MIND_DIR, BLINK_DIR, os.path.join(ROOT, 'combined_control')):
+    if _path not in sys.path:
+        sys.path.append(_path)
+
+from replay_server import load_session
+from benchmark import synthetic_packets
+from inference import BACKENDS
+from actuators import ActuatorLink
+from instrumentation import Instrumentation
+from packet_bus import PacketBus, InferenceExecutor, ExecutorModel
+from main_combined import MindStatePlugin, BlinkPlugin, in_dir
+
+DEFAULT_DATA = os.path.join(ROOT, 'data', 'all_data_labeled_final6.csv')
+
+# +
+class SimulatedClock:
+    """
+    Stands in for the `time` module of the controllers: time() and monotonic() are simulated,
+    the rest (perf_counter_ns for latencies, sleep) is real.
+    """
+
+    def __init__(self, start=None):
+        self.now = time.time() if start is None else start
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+class NullPort:
+    """Serial port that accepts and counts every byte."""
+
+    def __init__(self):
+        self.timeout = None
+        self.bytes_written = 0
+
+    def write(self, data):
+        self.bytes_written += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def read(self, n=1):
+        return b''
+
+    def close(self):
+        pass
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # peak, where /proc is missing
+
+
+def traffic(data, synthetic, packet_rate):
+    """Endless (seconds since the previous packet, packet, pass number) over the packet source."""
+    if synthetic:
+        packets = [(1.0 / packet_rate, p) for p in synthetic_packets(n=10000)]
+    else:
+        session = load_session([data])
+        offsets = [t for t, _ in session]
+        gaps = np.diff(offsets, prepend=offsets[0] - 1.0 / packet_rate)
+        packets = [(float(g), p) for g, (_, p) in zip(gaps, session)]
+    n = 0
+    while True:
+        for gap, packet in packets:
+            yield gap, packet, n
+        n += 1
+
+
+def build(controller, backend, clock):
+    """(bus, executor, controllers) with every controller's wall clock simulated."""
+    import main_combined
+    instr = Instrumentation('soak')
+    executor = InferenceExecutor(instr=instr)
+    bus = PacketBus(instr=instr)
+    link = ActuatorLink(NullPort(), instr=instr)
+    controllers = []
+    main_combined.time = clock
+    if controller in ('mind', 'combined'):
+        with in_dir(MIND_DIR):
+            import main_att
+            main_att.time = clock
+            mind = main_att.MindStateController(inference_backend=backend, connect=False)
+        mind.actuators = link
+        bus.subscribe(MindStatePlugin(mind, executor))
+        controllers.append(mind)
+    if controller in ('blink', 'combined'):
+        with in_dir(BLINK_DIR):
+            import main
+            main.time = clock
+            blink = main.BlinkDetector(inference_backend=backend, connect=False)
+        blink.actuators = link
+        blink.model = ExecutorModel(blink.model, executor)
+        bus.subscribe(BlinkPlugin(blink))
+        controllers.append(blink)
+    return bus, executor, link, controllers
+
+
+def soak(bus, executor, clock, packets, hours, sample_minutes, warmup_hours, top=10, trace=True):
+    """
+    Feed `hours` of simulated traffic, then close the executor. Returns (samples, passes,
+    top growing allocation sites).
+    """
+    end = clock.now + hours * 3600
+    warmup_end = clock.now + warmup_hours * 3600
+    next_sample = clock.now + sample_minutes * 60
+    start = clock.now
+    samples, passes, warm_snapshot = [], [], None
+    n = n_interval = n_pass = 0
+    cpu_interval = cpu_pass = 0
+    current_pass, pass_start = 0, start
+    wall = time.monotonic()
+    with open(os.devnull, 'w') as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            for gap, packet, pass_no in packets:
+                if pass_no != current_pass:
+                    passes.append({'pass': current_pass, 'start_hours': (pass_start - start) / 3600,
+                                   'cpu_us_per_packet': cpu_pass / n_pass / 1e3})
+                    current_pass, pass_start, cpu_pass, n_pass = pass_no, clock.now, 0, 0
+                clock.now += gap
+                t0 = time.process_time_ns()
+                bus.poll()
+                bus.publish([packet], time.perf_counter_ns())
+                cpu = time.process_time_ns() - t0
+                cpu_interval += cpu
+                cpu_pass += cpu
+                n += 1
+                n_interval += 1
+                n_pass += 1
+                if clock.now >= next_sample or clock.now >= end:
+                    # Let queued predictions finish so they are charged to this interval
+                    while executor.pending():
+                        time.sleep(0.001)
+                    sample = {'sim_hours': (clock.now - start) / 3600, 'packets': n,
+                              'wall_s': time.monotonic() - wall, 'rss_mb': rss_mb(),
+                              'cpu_us_per_packet': cpu_interval / n_interval / 1e3}
+                    if trace:
+                        sample['traced_mb'] = tracemalloc.get_traced_memory()[0] / 2 ** 20
+                    samples.append(sample)
+                    if warm_snapshot is None and clock.now >= warmup_end and trace:
+                        warm_snapshot = tracemalloc.take_snapshot()
+                    print(_format_sample(sample), file=stdout)
+                    next_sample += sample_minutes * 60
+                    cpu_interval = n_interval = 0
+                    if clock.now >= end:
+                        break
+        finally:
+            # Predictions still queued print too
+            executor.close()
+            sys.stdout = stdout
+    growth = []
+    if warm_snapshot is not None:
+        for stat in tracemalloc.take_snapshot().compare_to(warm_snapshot, 'lineno')[:top]:
+            frame = stat.traceback[0]
+            growth.append({'where': f"{os.path.relpath(frame.filename, ROOT)}:{frame.lineno}",
+                           'size_diff_kb': stat.size_diff / 1024, 'count_diff': stat.count_diff})
+    return samples, passes, growth
+
+
+def check(samples, passes, warmup_hours, max_rss_growth, max_traced_growth, max_cpu_growth):
+    """
+    Growth after warm-up, and the failed limits. Memory is compared between the middle and the
+    end of the samples after warm-up: one-off steps early on (allocator arenas, caches filling
+    up) do not count, a steady leak always shows. Recorded traffic is not stationary
+    (blink-heavy stretches cost more), so CPU is compared between the first and last complete
+    passes over the packet source that started after warm-up.
+    """
+    after = [s for s in samples if s['sim_hours'] >= warmup_hours]
+    if len(after) < 3:
+        return {}, ["not enough samples after warm-up; run longer or sample more often"]
+    first, last = after[len(after) // 2], after[-1]
+    growth = {'rss_mb': last['rss_mb'] - first['rss_mb']}
+    failures = []
+    if growth['rss_mb'] > max_rss_growth:
+        failures.append(f"RSS grew {growth['rss_mb']:.1f} MB (limit {max_rss_growth} MB)")
+    if 'traced_mb' in last:
+        growth['traced_mb'] = last['traced_mb'] - first['traced_mb']
+        if growth['traced_mb'] > max_traced_growth:
+            failures.append(f"traced memory grew {growth['traced_mb']:.2f} MB (limit {max_traced_growth} MB)")
+    full = [p for p in passes if p['start_hours'] >= warmup_hours]
+    if len(full) >= 2:
+        growth['cpu_ratio'] = full[-1]['cpu_us_per_packet'] / full[0]['cpu_us_per_packet'] - 1
+    if growth.get('cpu_ratio', 0) > max_cpu_growth:
+        failures.append(f"CPU per packet grew {growth['cpu_ratio']:+.0%} (limit {max_cpu_growth:.0%})")
+    return growth, failures
+
+
+def _format_sample(s):
+    traced = f"  traced {s['traced_mb']:7.2f} MB" if 'traced_mb' in s else ''
+    return (f"[Soak] {s['sim_hours']:6.2f} h  {s['packets']:8d} packets  {s['wall_s']:7.1f} s wall  "
+            f"RSS {s['rss_mb']:7.1f} MB{traced}  {s['cpu_us_per_packet']:8.1f} µs CPU/packet")
+# -
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Soak-test the controllers over a simulated day of traffic")
+    parser.add_argument('--controller', default='combined', choices=['mind', 'blink', 'combined'])
+    parser.add_argument('--backend', default='numpy', choices=BACKENDS, help="Inference backend")
+    parser.add_argument('--data', default=DEFAULT_DATA, help="Recorded CSV replayed in a loop")
+    parser.add_argument('--synthetic', action='store_true', help="Use synthetic packets instead of --data")
+    parser.add_argument('--packet-rate', type=float, default=1.0, help="Synthetic packets per simulated second")
+    parser.add_argument('--hours', type=float, default=24.0, help="Simulated hours")
+    parser.add_argument('--sample-minutes', type=float, default=30.0, help="Simulated minutes between samples")
+    parser.add_argument('--warmup-hours', type=float, default=1.0, help="Simulated hours excluded from the growth checks")
+    parser.add_argument('--max-rss-growth', type=float, default=20.0, help="Allowed RSS growth (MB)")
+    parser.add_argument('--max-traced-growth', type=float, default=5.0, help="Allowed Python heap growth (MB)")
+    parser.add_argument('--max-cpu-growth', type=float, default=0.25, help="Allowed CPU per packet growth (0.25 = 25%%)")
+    parser.add_argument('--top', type=int, default=10, help="Allocation sites listed in the report")
+    parser.add_argument('--no-tracemalloc', action='store_true', help="Skip heap tracing (faster, RSS and CPU only)")
+    parser.add_argument('--report', default=None, help="Write the report as JSON")
+    args = parser.parse_args()
+
+    clock = SimulatedClock()
+    bus, executor, link, controllers = build(args.controller, args.backend, clock)
+    if not args.no_tracemalloc:
+        tracemalloc.start()
+    source = 'synthetic' if args.synthetic else os.path.basename(args.data)
+    print(f"[Soak] {args.controller}: {args.hours:g} simulated hours of {source} traffic")
+    samples, passes, top_growth = soak(bus, executor, clock, traffic(args.data, args.synthetic, args.packet_rate),
+                               args.hours, args.sample_minutes, args.warmup_hours, args.top,
+                               trace=not args.no_tracemalloc)
+    link.close()
+    growth, failures = check(samples, passes, args.warmup_hours, args.max_rss_growth, args.max_traced_growth,
+                             args.max_cpu_growth)
+
+    for entry in top_growth:
+        print(f"[Soak] {entry['size_diff_kb']:+10.1f} KB {entry['count_diff']:+8d} blocks  {entry['where']}")
+    if growth:
+        print(f"[Soak] growth: RSS {growth['rss_mb']:+.1f} MB"
+              + (f", traced {growth['traced_mb']:+.2f} MB" if 'traced_mb' in growth else '')
+              + (f", CPU per packet {growth['cpu_ratio']:+.0%} over {len(passes)} passes" if 'cpu_ratio' in growth
+                 else ", CPU not compared (fewer than two full passes after warm-up)"))
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({'controller': args.controller, 'backend': args.backend, 'source': source,
+                       'hours': args.hours, 'samples': samples, 'passes': passes, 'growth': growth, 'top_growth': top_growth,
+                       'failures': failures}, f, indent=1)
+    for failure in failures:
+        print(f"SOAK FAILURE {failure}")
+    if failures:
+        sys.exit(1)
+    print("[Soak] no growth beyond the limits")
@@ -0,0 +1,454 @@
+"""
+Parameter sweep of the blink and fan control logic over recorded sessions.
+
+    python tools/sweep_params.py --param blink_threshold=50,60,70 --param double_blink_interval=0.6:1.4 \\
+        --samples 500 --workers 8 --report sweep.csv
+
+Every configuration replays the recording through the controllers' own decision code
+(BlinkDetector._handle_blink_strength with a GestureEngine, MindStateController's
+_process_mind_state) on a simulated clock, with no headset or serial port: commands go to
+a log that drops repeated fan values like ActuatorLink does. --param takes a list
+(name=a,b,c) or, with --samples N, a range (name=lo:hi) to draw N random configurations
+from; without --samples the lists are searched as a full grid. Unswept parameters keep the
+controllers' defaults.
+
+The blink model only sees the window and blink_threshold, so its predictions are computed
+once per threshold, in large batches, and cached with the session arrays under
+.cache/sweep/. Workers map them read-only (np.load mmap_mode='r'). Blink and fan settings
+do not interact, so each distinct blink setting and each distinct fan setting is replayed
+only once, however many configurations share it.
+
+Gestures are scored against the recording's blinkType labels: a blinkType 2 row is a
+double together with the single-blink row before it, other blinkType 1 rows are singles.
+A detected gesture matches a labelled one of its kind whose last blink is within
+--tolerance seconds. Fan settings are scored by the commands they send and by how well the
+PWM follows the attention labels of --labels (Low/Medium/High, matched row by row).
+"""
+import os
+import sys
+import csv
+import time
+import hashlib
+import argparse
+import itertools
+import contextlib
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+MIND_DIR = os.path.join(ROOT, 'mind_state_control')
+BLINK_DIR = os.path.join(ROOT, 'blink_control')
+for _path in (os.path.join(ROOT, 'common'), MIND_DIR, BLINK_DIR, os.path.join(ROOT, 'combined_control')):
+    if _path not in sys.path:
+        sys.path.append(_path)
+
+from replay_server import to_packet
+from score_sessions import BlinkPreprocessing, WINDOW, _predict
+from soak_test import SimulatedClock
+from main_combined import in_dir
+from inference import BACKENDS, file_hash, load_cached_backend
+from actuators import ACTUATORS
+from gestures import GestureEngine, GESTURES, gesture_actions
+
+DEFAULT_DATA = os.path.join(ROOT, 'data', 'all_data_labeled_final6.csv')
+DEFAULT_LABELS = os.path.join(ROOT, 'data', 'all_data_labeled_att_Rel.csv')
+CACHE_DIR = os.path.join(ROOT, '.cache', 'sweep')
+LEVELS = {'Low': 0, 'Medium': 1, 'High': 2}
+SESSION_GAP = 3600.0  # simulated seconds between sessions, so nothing carries over
+
+# +
+# name: (controller, type)
+PARAMS = {
+    'blink_threshold': ('blink', int),
+    'min_blink_strength': ('blink', int),
+    'double_blink_interval': ('blink', float),
+    'strength_smoothing': ('blink', int),     # newest strengths averaged before the threshold test
+    'prediction_smoothing': ('blink', int),   # model predictions voted over
+    'pwm_step': ('mind', int),
+    'pwm_min': ('mind', int),
+    'pwm_max': ('mind', int),
+    'control_update_interval': ('mind', float),
+    'mind_smoothing': ('mind', int),          # eSense values averaged per control update
+}
+
+_replay = None
+
+
+def parse_param(spec):
+    """'name=a,b,c' -> (name, [a, b, c]); 'name=lo:hi' -> (name, (lo, hi))."""
+    name, _, values = spec.partition('=')
+    if name not in PARAMS:
+        raise ValueError(f"Unknown parameter '{name}', expected one of {', '.join(PARAMS)}")
+    kind = PARAMS[name][1]
+    try:
+        if ':' in values:
+            lo, hi = (kind(v) for v in values.split(':'))
+            return name, (lo, hi)
+        return name, [kind(v) for v in values.split(',')]
+    except ValueError:
+        raise ValueError(f"--param {spec}: values must be {kind.__name__}s, e.g. {name}=1,2,3 or {name}=1:3")
+
+
+def make_configs(params, samples=0, seed=0):
+    """Grid over the value lists, or `samples` random draws when samples > 0."""
+    names = [name for name, _ in params]
+    if not samples:
+        if any(isinstance(v, tuple) for _, v in params):
+            sys.exit("Ranges (name=lo:hi) need --samples")
+        return [dict(zip(names, combo)) for combo in itertools.product(*(v for _, v in params))]
+    rng = np.random.default_rng(seed)
+    configs = {}
+    for _ in range(samples):
+        config = {}
+        for name, values in params:
+            if isinstance(values, list):
+                config[name] = values[rng.integers(len(values))]
+            elif PARAMS[name][1] is int:
+                config[name] = int(rng.integers(values[0], values[1] + 1))
+            else:
+                config[name] = round(float(rng.uniform(*values)), 3)
+        configs[tuple(config.items())] = config
+    return list(configs.values())
+
+
+def split(config):
+    """The blink and the fan part of a configuration, as hashable keys."""
+    return tuple(tuple((k, v) for k, v in config.items() if PARAMS[k][0] == part) for part in ('blink', 'mind'))
+
+
+# ===== Session arrays and cached blink predictions =====
+
+def load_recording(data_path, labels_path=None):
+    """Per-row arrays of a recorded CSV, with sessions split where session_id changes or time restarts."""
+    with open(data_path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    times = np.array([float(r['time']) for r in rows])
+    sessions = [r.get('session_id') for r in rows]
+    starts = [0] + [i for i in range(1, len(rows)) if sessions[i] != sessions[i - 1] or times[i] < times[i - 1]]
+    bounds = np.array(list(zip(starts, starts[1:] + [len(rows)])), dtype=np.int64)
+
+    # Sessions laid end to end on one clock, an hour apart
+    clock = np.empty(len(rows))
+    offset = 0.0
+    for lo, hi in bounds:
+        clock[lo:hi] = times[lo:hi] - times[lo] + offset
+        offset = clock[hi - 1] + SESSION_GAP
+
+    level = np.full(len(rows), -1, dtype=np.int8)
+    if labels_path:
+        with open(labels_path, newline='') as f:
+            for i, label in enumerate(csv.DictReader(f)):
+                if i >= len(rows) or label['time'] != rows[i]['time'] or label['attention'] != rows[i]['attention']:
+                    break
+                level[i] = LEVELS.get(label['attention_label'], -1)
+
+    return {
+        'times': times, 'clock': clock, 'bounds': bounds, 'attention_level': level,
+        'attention': np.array([float(r['attention']) for r in rows]),
+        'meditation': np.array([float(r['meditation']) for r in rows]),
+        'strength': np.array([float(r.get('blinkStrength') or 0) for r in rows]),
+        'blink_type': np.array([int(float(r.get('blinkType') or 0)) for r in rows], dtype=np.int8),
+    }, [to_packet(r) for r in rows]
+
+
+def truth_events(blink_type, clock, bounds):
+    """(clock time of the last blink, 1 = single / 2 = double) of every labelled gesture."""
+    events = []
+    for lo, hi in bounds:
+        last_single = None  # index into events of a single that a following double absorbs
+        for i in range(lo, hi):
+            if blink_type[i] == 1:
+                last_single = len(events)
+                events.append((clock[i], 1))
+            elif blink_type[i] == 2:
+                if last_single is not None and last_single == len(events) - 1:
+                    events.pop()
+                events.append((clock[i], 2))
+                last_single = None
+    return np.array(events, dtype=float).reshape(-1, 2)
+
+
+def prepare(data_path, labels_path, thresholds, backend='numpy', batch_size=1024):
+    """Cache directory holding the session arrays and blink predictions for every threshold."""
+    model_path = os.path.join(BLINK_DIR, 'best_eeg_cnn_bilstm_focal.h5')
+    h = hashlib.sha256(backend.encode())
+    for path in (data_path, labels_path, model_path, os.path.join(BLINK_DIR, 'scaler_seq.pkl'),
+                 os.path.join(BLINK_DIR, 'scaler_feats.pkl')):
+        if path:
+            h.update(file_hash(path).encode())
+    cache = os.path.join(CACHE_DIR, h.hexdigest()[:16])
+    os.makedirs(cache, exist_ok=True)
+
+    missing = [t for t in thresholds if not os.path.exists(os.path.join(cache, f'blink_probs_{t}.npy'))]
+    if not os.path.exists(os.path.join(cache, 'truth.npy')) or missing:
+        arrays, packets = load_recording(data_path, labels_path)
+        arrays['truth'] = truth_events(arrays['blink_type'], arrays['clock'], arrays['bounds'])
+        for name, array in arrays.items():
+            _save(cache, name, array)
+        if missing:
+            start = time.perf_counter()
+            prep = BlinkPreprocessing()
+            rows = prep.rows(arrays['times'], packets)
+            # Every row's window, zero-padded at a session start like a freshly started detector
+            windows = np.concatenate([
+                np.lib.stride_tricks.sliding_window_view(
+                    np.concatenate([np.zeros((WINDOW - 1, rows.shape[1])), rows[lo:hi]]), WINDOW, axis=0
+                ).transpose(0, 2, 1)
+                for lo, hi in arrays['bounds']])
+            model = load_cached_backend(model_path, backend)
+            for t in missing:
+                (probs,) = _predict(model, prep.inputs(windows, t), batch_size)
+                _save(cache, f'blink_probs_{t}', probs.astype(np.float32))
+            print(f"Blink predictions for {len(missing)} threshold(s), {len(windows)} windows each, "
+                  f"in {time.perf_counter() - start:.1f}s")
+    return cache
+
+
+def _save(cache, name, array):
+    path = os.path.join(cache, f'{name}.npy')
+    tmp = f'{path}.{os.getpid()}.tmp.npy'
+    np.save(tmp, array)
+    os.replace(tmp, path)
+
+
+# ===== Replay in the workers =====
+
+class CommandLog:
+    """Stands in for ActuatorLink: counts the commands that would reach the board."""
+
+    def __init__(self):
+        self.last = {}
+        self.counts = Counter()
+
+    def send(self, actuator, value):
+        value = int(value)
+        if ACTUATORS[actuator].dedup and self.last.get(actuator) == value:
+            return False
+        self.last[actuator] = value
+        self.counts[actuator] += 1
+        return True
+
+
+class _Replay:
+    """One worker's controllers, built once and reset for every setting they replay."""
+
+    def __init__(self, cache, backend, actions, long_strength, tolerance):
+        self.cache = cache
+        self.data = {name: np.load(os.path.join(cache, f'{name}.npy'), mmap_mode='r')
+                     for name in ('clock', 'bounds', 'strength', 'attention', 'meditation', 'attention_level', 'truth')}
+        # Plain lists for the per-row loops; element access on a memmap is slow
+        self.rows = {name: self.data[name].tolist() for name in ('clock', 'strength', 'attention', 'meditation')}
+        self.probs = {}
+        self.actions = actions
+        self.long_strength = long_strength
+        self.tolerance = tolerance
+        self.hours = float(sum(self.data['clock'][hi - 1] - self.data['clock'][lo] for lo, hi in self.data['bounds'])) / 3600
+        self.devnull = open(os.devnull, 'w')
+        self.clock = SimulatedClock(0.0)
+        with contextlib.redirect_stdout(self.devnull):
+            with in_dir(MIND_DIR):
+                import main_att
+                main_att.time = self.clock
+                self.mind = main_att.MindStateController(inference_backend=backend, connect=False)
+            with in_dir(BLINK_DIR):
+                import main
+                main.time = self.clock
+                self.blink = main.BlinkDetector(inference_backend=backend, connect=False)
+        # The blink model is replaced by the cached predictions of the row being replayed
+        self.row = 0
+        self.blink._predict_blink = lambda: self.blink_probs[self.row]
+        self.blink_defaults = {
+            'blink_threshold': self.blink.blink_threshold, 'min_blink_strength': self.blink.min_blink_strength,
+            'double_blink_interval': self.blink.double_blink_interval,
+            'strength_smoothing': self.blink.strength_smoothing,
+            'prediction_smoothing': self.blink.prediction_history.maxlen,
+        }
+        m = self.mind
+        self.mind_defaults = {
+            'pwm_step': m.pwm_step, 'pwm_min': m.pwm_min, 'pwm_max': m.pwm_max,
+            'control_update_interval': m.control_update_interval, 'mind_smoothing': m.attention_history.maxlen,
+        }
+        self.mind_start = {'last_pwm': m.last_pwm, 'last_attention': m.last_attention,
+                           'last_meditation': m.last_meditation}
+
+    def evaluate(self, part, setting):
+        with contextlib.redirect_stdout(self.devnull):
+            return self._blink(dict(setting)) if part == 'blink' else self._mind(dict(setting))
+
+    def _blink(self, setting):
+        p = {**self.blink_defaults, **setting}
+        det = self.blink
+        det.blink_threshold = p['blink_threshold']
+        det.min_blink_strength = p['min_blink_strength']
+        det.double_blink_interval = p['double_blink_interval']
+        det.strength_smoothing = p['strength_smoothing']
+        det.actuators = CommandLog()
+        self.blink_probs = self._probs(p['blink_threshold'])
+        detected = []
+
+        def fire(gesture, blinks, action):
+            detected.append((gesture, blinks[-1]['time']))
+            det._trigger_gesture(gesture, blinks, action)
+
+        clock, strength = self.rows['clock'], self.rows['strength']
+        above = np.flatnonzero(self.data['strength'] >= det.min_blink_strength)
+        for lo, hi in self.data['bounds']:
+            det.blink_strength_history = deque(maxlen=max(5, p['strength_smoothing']))
+            det.prediction_history = deque(maxlen=p['prediction_smoothing'])
+            det.gestures = GestureEngine(fire, self.actions, det.double_blink_interval, self.long_strength,
+                                         clock=self.clock.monotonic)
+            for i in above[(above >= lo) & (above < hi)].tolist():
+                self.row = i
+                self.clock.now = clock[i]
+                det._handle_blink_strength(strength[i], 0)
+            det.gestures.poll(self.clock.now + det.double_blink_interval)
+
+        result = {}
+        for kind, gesture in ((1, 'single'), (2, 'double')):
+            truth = self.data['truth'][self.data['truth'][:, 1] == kind, 0]
+            found = np.array([t for g, t in detected if g == gesture])
+            tp = _matches(found, truth, self.tolerance)
+            precision = tp / len(found) if len(found) else 0.0
+            recall = tp / len(truth) if len(truth) else 0.0
+            result[f'{gesture}_precision'] = round(precision, 4)
+            result[f'{gesture}_recall'] = round(recall, 4)
+            result[f'{gesture}_f1'] = round(2 * precision * recall / (precision + recall) if tp else 0.0, 4)
+        result['blink_f1'] = round((result['single_f1'] + result['double_f1']) / 2, 4)
+        counts = Counter(g for g, _ in detected)
+        result.update({f'{g}_gestures': counts[g] for g in GESTURES})
+        servo = sum(n for a, n in det.actuators.counts.items() if a != 'FAN')
+        result['servo_commands'] = servo
+        result['servo_per_hour'] = round(servo / self.hours, 1)
+        return result
+
+    def _mind(self, setting):
+        p = {**self.mind_defaults, **setting}
+        m = self.mind
+        m.pwm_step, m.pwm_min, m.pwm_max = p['pwm_step'], p['pwm_min'], p['pwm_max']
+        m.control_update_interval = p['control_update_interval']
+        m.actuators = CommandLog()
+        clock, att, med = (self.rows[k] for k in ('clock', 'attention', 'meditation'))
+        level = self.data['attention_level']
+        pwms, levels = [], []
+        for lo, hi in self.data['bounds'].tolist():
+            m.attention_history = deque(maxlen=p['mind_smoothing'])
+            m.meditation_history = deque(maxlen=p['mind_smoothing'])
+            for k, v in self.mind_start.items():
+                setattr(m, k, v)
+            m.last_control_update = float('-inf')
+            for i in range(lo, hi):
+                now = clock[i]
+                if now - m.last_control_update >= m.control_update_interval:
+                    self.clock.now = now
+                    m._process_mind_state({'eSense': {'attention': att[i], 'meditation': med[i]}})
+                    m.last_control_update = now
+                    pwms.append(m.last_pwm)
+                    levels.append(level[i])
+        pwms, levels = np.array(pwms, dtype=float), np.array(levels)
+        labelled = levels >= 0
+        corr = 0.0
+        if labelled.sum() > 1 and pwms[labelled].std() > 0 and levels[labelled].std() > 0:
+            corr = float(np.corrcoef(pwms[labelled], levels[labelled])[0, 1])
+        fan = m.actuators.counts['FAN']
+        return {'fan_commands': fan, 'fan_per_hour': round(fan / self.hours, 1),
+                'pwm_mean': round(float(pwms.mean()), 1), 'pwm_std': round(float(pwms.std()), 1),
+                'pwm_attention_corr': round(corr, 4)}
+
+    def _probs(self, threshold):
+        if threshold not in self.probs:
+            self.probs[threshold] = np.load(os.path.join(self.cache, f'blink_probs_{threshold}.npy'), mmap_mode='r')
+        return self.probs[threshold]
+
+
+def _matches(found, truth, tolerance):
+    """Detections paired one-to-one, in time order, with labelled events at most `tolerance` away."""
+    found, truth = np.sort(found), np.sort(truth)
+    i = j = tp = 0
+    while i < len(found) and j < len(truth):
+        if abs(found[i] - truth[j]) <= tolerance:
+            tp += 1
+            i += 1
+            j += 1
+        elif found[i] < truth[j]:
+            i += 1
+        else:
+            j += 1
+    return tp
+
+
+def _init_worker(*args):
+    global _replay
+    _replay = _Replay(*args)
+
+
+def _evaluate(job):
+    return _replay.evaluate(*job)
+
+
+def sweep(configs, cache, backend, actions, long_strength, tolerance, workers, chunk_size):
+    """One report row per configuration, each distinct blink and fan setting replayed once."""
+    keys = [split(c) for c in configs]
+    jobs = [('blink', b) for b in dict.fromkeys(k[0] for k in keys)] + [('mind', m) for m in dict.fromkeys(k[1] for k in keys)]
+    init = (cache, backend, actions, long_strength, tolerance)
+    if workers == 0:
+        _init_worker(*init)
+        results = list(map(_evaluate, jobs))
+    else:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=init) as executor:
+            results = list(executor.map(_evaluate, jobs, chunksize=chunk_size))
+    metrics = dict(zip(jobs, results))
+    return [{**c, **metrics[('blink', b)], **metrics[('mind', m)]} for c, (b, m) in zip(configs, keys)], len(jobs)
+# -
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep blink and fan control parameters over recorded sessions")
+    parser.add_argument('--param', action='append', default=[], metavar='NAME=A,B,C|NAME=LO:HI',
+                        help=f"Values to sweep ({', '.join(PARAMS)}); repeat per parameter")
+    parser.add_argument('--samples', type=int, default=0, help="Random search: configurations to draw (0 = full grid)")
+    parser.add_argument('--seed', type=int, default=0, help="Random search seed")
+    parser.add_argument('--data', default=DEFAULT_DATA, help="Recorded CSV with blinkType labels")
+    parser.add_argument('--labels', default=DEFAULT_LABELS, help="CSV with attention_label per row ('' = none)")
+    parser.add_argument('--tolerance', type=float, default=0.5, help="Seconds a detected gesture may be off its label")
+    parser.add_argument('--gesture', action='append', default=[], metavar='GESTURE=ACTUATOR:VALUE',
+                        help="Gesture mapping to replay, as for blink_control/main.py")
+    parser.add_argument('--long-blink-strength', type=int, default=None, help="Long blink strength, as for blink_control/main.py")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Worker processes (0 = run in this process)")
+    parser.add_argument('--chunk-size', type=int, default=8, help="Settings per worker task")
+    parser.add_argument('--backend', default='numpy', choices=BACKENDS, help="Inference backend for the cached predictions")
+    parser.add_argument('--sort', default='blink_f1', help="Report column to rank configurations by")
+    parser.add_argument('--ascending', action='store_true', help="Rank lowest first")
+    parser.add_argument('--top', type=int, default=10, help="Configurations printed")
+    parser.add_argument('--report', default=None, help="CSV file with every configuration and its metrics")
+    args = parser.parse_args()
+
+    try:
+        params = [parse_param(spec) for spec in args.param]
+        actions = gesture_actions(args.gesture)
+    except ValueError as e:
+        parser.error(str(e))
+    configs = make_configs(params, args.samples, args.seed)
+    start = time.perf_counter()
+    thresholds = sorted({c.get('blink_threshold', 60) for c in configs})
+    cache = prepare(args.data, args.labels, thresholds, args.backend)
+    rows, n_jobs = sweep(configs, cache, args.backend, actions, args.long_blink_strength, args.tolerance,
+                         args.workers, args.chunk_size)
+    elapsed = time.perf_counter() - start
+    if args.sort not in rows[0]:
+        sys.exit(f"Unknown --sort column '{args.sort}', expected one of {', '.join(rows[0])}")
+    rows.sort(key=lambda r: r[args.sort], reverse=not args.ascending)
+
+    if args.report:
+        with open(args.report, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+    print(f"{len(configs)} configurations ({n_jobs} distinct blink/fan settings) in {elapsed:.1f}s")
+    swept = [name for name, _ in params]
+    shown = swept + ['blink_f1', 'single_f1', 'double_f1', 'servo_per_hour', 'fan_per_hour', 'pwm_attention_corr']
+    if args.sort not in shown:
+        shown.append(args.sort)
+    print(' | '.join(shown))
+    for row in rows[:args.top]:
+        print(' | '.join(str(row[k]) for k in shown))
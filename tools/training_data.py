@@ -0,0 +1,356 @@
+"""
+Streaming training data for the blink and mind-state models, built with the runtime's feature code.
+
+    python tools/training_data.py data/all_data_labeled_final6.csv --model blink --fit --out blink_control/
+    python tools/training_data.py archive/ --model mind --fit
+
+or from a notebook:
+
+    sys.path.append('../tools')
+    from training_data import WindowDataset
+    data = WindowDataset('blink', ['../data/all_data_labeled_final6.csv'])
+    data.fit()
+    data.save('.')
+    model.fit(data.dataset('train'), validation_data=data.dataset('val'), epochs=100)
+
+Sessions are read from disk one at a time and cut into strided windows lazily, a chunk of
+windows at a time, so memory does not grow with the archive. Recorded CSVs are streamed row by
+row and split where session_id changes or time restarts. Controller recordings and JSON
+captures are one session each, and carry no labels, so they only count towards fit(). Feature
+rows come from the functions the controllers and score_sessions.py use (batch_features for
+mind-state, BlinkPreprocessing.rows and batch_engineered for blink), so a model is trained on
+exactly what it is served.
+
+Every session belongs to the train, val or test split by a hash of its name, so the
+overlapping windows of one session never end up on both sides. fit() makes one pass over a
+split: StandardScaler.partial_fit for the blink model's scaler_seq / scaler_feats, the label
+classes for the mind-state model's encoders. dataset() is a tf.data pipeline over the scaled
+windows: files interleaved, then cached (in memory or to a file), shuffled, batched and
+prefetched.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import zlib
+import argparse
+from collections import Counter
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+MIND_DIR = os.path.join(ROOT, 'mind_state_control')
+BLINK_DIR = os.path.join(ROOT, 'blink_control')
+for _path in (os.path.join(ROOT, 'common'), MIND_DIR, BLINK_DIR):
+    if _path not in sys.path:
+        sys.path.append(_path)
+
+from replay_server import to_packet
+from score_sessions import BlinkPreprocessing, BLINK_CLASSES, collect_inputs, load_packets
+from feature_engine import batch_features, bands
+from window_store import batch_engineered, scaler_affine
+
+CACHE_DIR = os.path.join(ROOT, '.cache', 'training')
+MIND_STEP = 2  # att_rel_model.ipynb
+# Fractions of the sessions in each split, like the notebooks' 70 / 15 / 15
+SPLITS = (('train', 0.70), ('val', 0.15), ('test', 0.15))
+LABELS = {'blink': ('blinkType',), 'mind': ('attention_label', 'relaxation_label')}
+INPUTS = {'blink': ('windowed_input', 'features_input'), 'mind': ('eeg_input',)}
+OUTPUTS = {'blink': None, 'mind': ('att_output', 'rel_output')}
+
+# +
+def split_of(name):
+    """Which of SPLITS a session belongs to, from a hash of its name."""
+    u = zlib.crc32(name.encode()) / 2 ** 32
+    for split, fraction in SPLITS:
+        u -= fraction
+        if u < 0:
+            return split
+    return SPLITS[-1][0]
+
+
+def iter_sessions(path, label_cols=()):
+    """
+    (name, times, packets, labels) of every session in one input, where labels maps each of
+    `label_cols` present in a CSV to its per-row values. A CSV is read one session at a time.
+    """
+    if not path.endswith('.csv'):
+        times, packets = load_packets(path)
+        yield os.path.basename(os.path.normpath(path)), times, packets, {}
+        return
+    stem = os.path.splitext(os.path.basename(path))[0]
+    with open(path, newline='') as f:
+        reader = csv.DictReader(f)
+        cols = [c for c in label_cols if c in (reader.fieldnames or ())]
+        rows, index = [], 0
+        for row in reader:
+            if rows and (row.get('session_id') != rows[-1].get('session_id')
+                         or float(row['time']) < float(rows[-1]['time'])):
+                yield _csv_session(stem, index, rows, cols)
+                rows, index = [], index + 1
+            rows.append(row)
+        if rows:
+            yield _csv_session(stem, index, rows, cols)
+
+
+def _csv_session(stem, index, rows, cols):
+    session = rows[0].get('session_id')
+    name = f"{stem}:{session if session is not None else index}"
+    times = np.array([float(r['time']) for r in rows])
+    return name, times, [to_packet(r) for r in rows], {c: [r[c] for r in rows] for c in cols}
+
+
+def window_modes(codes, n_classes, window, starts):
+    """Most common code of each window (the smallest on a tie, like np.unique)."""
+    counts = np.zeros((len(codes) + 1, n_classes), dtype=np.int32)
+    np.cumsum(np.eye(n_classes, dtype=np.int32)[codes], axis=0, out=counts[1:])
+    return np.argmax(counts[starts + window] - counts[starts], axis=1)
+
+
+class WindowDataset:
+    """
+    Strided windows of one model's inputs over a set of recordings, streamed session by session.
+
+    `model` is 'blink' (window_size / step_size from preprocessing_meta.json, the label is the
+    blinkType of a window's last row) or 'mind' (20-row windows every 2 rows, labelled with
+    the most common attention / relaxation label in the window). The blink scalers and the
+    mind label classes start as the ones shipped next to the models; fit() replaces them.
+    Windows never cross a session boundary and a session shorter than a window gives none.
+    """
+
+    def __init__(self, model, paths, window=None, step=None, blink_threshold=60, chunk=4096):
+        if model not in LABELS:
+            raise ValueError(f"Unknown model '{model}', expected one of {', '.join(LABELS)}")
+        self.model = model
+        self.paths = collect_inputs(paths)
+        self.blink_threshold = blink_threshold
+        self.chunk = chunk
+        self.label_cols = LABELS[model]
+        if model == 'blink':
+            with open(os.path.join(BLINK_DIR, 'preprocessing_meta.json')) as f:
+                meta = json.load(f)
+            self.window = window or meta['window_size']
+            self.step = step or meta['step_size']
+            self.prep = BlinkPreprocessing()
+            self.cols = self.prep.cols
+            self.scalers = None
+            self.classes = [list(range(len(BLINK_CLASSES)))]
+        else:
+            with open(os.path.join(MIND_DIR, 'feature_cols.json')) as f:
+                self.cols = json.load(f)
+            self.window = window or 20
+            self.step = step or MIND_STEP
+            self.classes = [[str(c) for c in np.load(os.path.join(MIND_DIR, f'le_{head}_classes.npy'), allow_pickle=True)]
+                            for head in ('att', 'rel')]
+
+    def sessions(self, split=None):
+        """Sessions of `split` (None = all) across every input, in order."""
+        for path in self.paths:
+            yield from self._sessions_of(path, split)
+
+    def _sessions_of(self, path, split):
+        if split is not None and not path.endswith('.csv') \
+                and split_of(os.path.basename(os.path.normpath(path))) != split:
+            return  # skipped before it is read
+        for session in iter_sessions(path, self.label_cols):
+            if split is None or split_of(session[0]) == split:
+                yield session
+
+    def windows(self, session, labelled=True):
+        """
+        Chunks of unscaled windows of one session: blink gives (seq, feats, blink_type),
+        mind gives (seq, attention, relaxation) with the labels as class indices. With
+        `labelled`, a session without its label columns gives nothing; without, labels are None.
+        """
+        name, times, packets, labels = session
+        if labelled and any(c not in labels for c in self.label_cols):
+            return
+        n = len(packets)
+        if n < self.window:
+            return
+        if self.model == 'blink':
+            rows = self.prep.rows(times, packets)
+        else:
+            band_rows = np.array([[p.get('eegPower', {}).get(b, 0) for b in bands] for p in packets], dtype=float)
+            rows = batch_features(band_rows)
+        view = np.lib.stride_tricks.sliding_window_view(rows, self.window, axis=0).transpose(0, 2, 1)
+        starts = np.arange(0, n - self.window + 1, self.step)
+        targets = [None] * len(self.label_cols)
+        if labelled:
+            targets = [self._targets(labels[c], classes, starts, name)
+                       for c, classes in zip(self.label_cols, self.classes)]
+        for i in range(0, len(starts), self.chunk):
+            idx = starts[i:i + self.chunk]
+            seq = view[idx]
+            ys = [None if t is None else t[i:i + self.chunk] for t in targets]
+            if self.model == 'blink':
+                yield (seq, batch_engineered(seq, self.cols, self.blink_threshold), *ys)
+            else:
+                yield (seq, *ys)
+
+    def _targets(self, values, classes, starts, name):
+        if self.model == 'blink':
+            return np.array([int(float(v or 0)) for v in values])[starts + self.window - 1]
+        index = {c: i for i, c in enumerate(classes)}
+        try:
+            codes = np.array([index[v] for v in values])
+        except KeyError as e:
+            raise ValueError(f"{name}: label {e} is not one of {classes}; fit() the classes first")
+        return window_modes(codes, len(classes), self.window, starts)
+
+    def fit(self, split='train'):
+        """
+        One pass over `split` (None = every session): partial_fit the blink scalers on every
+        window row and window feature vector, or collect the mind-state label classes (sorted,
+        like a LabelEncoder). Returns the number of sessions and windows seen.
+        """
+        sessions = windows = 0
+        if self.model == 'blink':
+            from sklearn.preprocessing import StandardScaler
+            seq_scaler, feats_scaler = StandardScaler(), StandardScaler()
+            for session in self.sessions(split):
+                sessions += 1
+                for seq, feats, _ in self.windows(session, labelled=False):
+                    seq_scaler.partial_fit(seq.reshape(-1, seq.shape[-1]))
+                    feats_scaler.partial_fit(feats)
+                    windows += len(seq)
+            if not windows:
+                raise ValueError(f"No windows to fit the scalers on in split '{split}'")
+            self.scalers = (seq_scaler, feats_scaler)
+        else:
+            found = [set() for _ in self.label_cols]
+            for name, times, _, labels in self.sessions(split):
+                if len(times) >= self.window and all(c in labels for c in self.label_cols):
+                    sessions += 1
+                    windows += (len(times) - self.window) // self.step + 1
+                    for values, col in zip(found, self.label_cols):
+                        values.update(labels[col])
+            if not windows:
+                raise ValueError(f"No labelled windows in split '{split}'")
+            self.classes = [sorted(values) for values in found]
+        return {'sessions': sessions, 'windows': windows}
+
+    def save(self, out_dir):
+        """Write what fit() produced under the names the controllers load."""
+        os.makedirs(out_dir, exist_ok=True)
+        if self.model == 'blink':
+            import joblib
+            if self.scalers is None:
+                raise ValueError("fit() the scalers before saving them")
+            joblib.dump(self.scalers[0], os.path.join(out_dir, 'scaler_seq.pkl'))
+            joblib.dump(self.scalers[1], os.path.join(out_dir, 'scaler_feats.pkl'))
+            with open(os.path.join(out_dir, 'windowed_feature_cols.json'), 'w') as f:
+                json.dump(self.cols, f)
+            with open(os.path.join(out_dir, 'preprocessing_meta.json'), 'w') as f:
+                json.dump({'window_size': self.window, 'step_size': self.step}, f)
+        else:
+            for head, classes in zip(('att', 'rel'), self.classes):
+                np.save(os.path.join(out_dir, f'le_{head}_classes.npy'), np.array(classes, dtype=object))
+
+    def examples(self, path, split=None):
+        """Scaled, float32 model inputs and one-hot labels of one input, chunk by chunk."""
+        if self.model == 'blink':
+            scalers = self.scalers or (None, None)
+            seq_mean, seq_scale = (self.prep.seq_mean, self.prep.seq_scale) if scalers[0] is None \
+                else scaler_affine(scalers[0], len(self.cols))
+            feats_mean, feats_scale = (self.prep.feats_mean, self.prep.feats_scale) if scalers[1] is None \
+                else scaler_affine(scalers[1], scalers[1].n_features_in_)
+        for session in self._sessions_of(path, split):
+            for chunk in self.windows(session):
+                if self.model == 'blink':
+                    seq, feats, y = chunk
+                    inputs = (((seq - seq_mean) / seq_scale).astype(np.float32),
+                              ((feats - feats_mean) / feats_scale).astype(np.float32))
+                    yield inputs, np.eye(len(BLINK_CLASSES), dtype=np.float32)[y]
+                else:
+                    seq, att, rel = chunk
+                    yield (seq.astype(np.float32),), tuple(np.eye(len(classes), dtype=np.float32)[y]
+                                                           for y, classes in zip((att, rel), self.classes))
+
+    def dataset(self, split='train', batch_size=64, shuffle=10000, cache=None, cycle_length=4, seed=None):
+        """
+        tf.data pipeline of (inputs, labels) batches for Model.fit, keyed by the notebooks'
+        layer names. `cache` is None (recompute every epoch), '' (keep the scaled windows in
+        memory) or a file prefix (write them to disk on the first full epoch, for archives
+        larger than RAM); 'auto' is a file under .cache/training/ keyed by the inputs and
+        preprocessing. shuffle=0 keeps session order.
+        """
+        import tensorflow as tf
+        inputs, outputs = INPUTS[self.model], OUTPUTS[self.model]
+        signature = (
+            tuple(tf.TensorSpec((None, self.window, len(self.cols)) if i == 0 else (None, 13 + 2 * len(bands) + 1),
+                                tf.float32) for i in range(len(inputs))),
+            tf.TensorSpec((None, len(BLINK_CLASSES)), tf.float32) if outputs is None
+            else tuple(tf.TensorSpec((None, len(classes)), tf.float32) for classes in self.classes))
+
+        def name(x, y):
+            x = dict(zip(inputs, x))
+            return x, y if outputs is None else dict(zip(outputs, y))
+
+        files = tf.data.Dataset.from_tensor_slices(self.paths)
+        ds = files.interleave(
+            lambda path: tf.data.Dataset.from_generator(
+                lambda p: self.examples(p.decode(), split), output_signature=signature, args=(path,)),
+            cycle_length=max(1, min(cycle_length, len(self.paths))), num_parallel_calls=tf.data.AUTOTUNE,
+            deterministic=not shuffle)
+        ds = ds.unbatch().map(name, num_parallel_calls=tf.data.AUTOTUNE)
+        if cache == 'auto':
+            cache = self.cache_path(split)
+        if cache is not None:
+            ds = ds.cache(cache)
+        if shuffle:
+            ds = ds.shuffle(shuffle, seed=seed, reshuffle_each_iteration=True)
+        return ds.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+    def cache_path(self, split):
+        """A file prefix that changes with the inputs (by size and mtime) and the preprocessing."""
+        h = zlib.crc32(json.dumps([self.model, split, self.window, self.step, self.blink_threshold,
+                                   self.classes]).encode())
+        for path in self.paths:
+            st = os.stat(path)
+            h = zlib.crc32(f'{path}:{st.st_size}:{st.st_mtime_ns}'.encode(), h)
+        if self.model == 'blink' and self.scalers is not None:
+            for scaler in self.scalers:
+                h = zlib.crc32(np.concatenate([scaler.mean_, scaler.scale_]).tobytes(), h)
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        return os.path.join(CACHE_DIR, f'{self.model}-{split}-{h:08x}')
+# -
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Count, or fit the preprocessing on, streamed training windows")
+    parser.add_argument('inputs', nargs='+', help="Recorded CSVs, recordings, captures or directories of them")
+    parser.add_argument('--model', required=True, choices=list(LABELS), help="Which model's windows")
+    parser.add_argument('--fit', action='store_true', help="Fit the scalers (blink) or label classes (mind)")
+    parser.add_argument('--split', default='train', help="Split to fit on: train, val, test or all")
+    parser.add_argument('--out', help="Write the fitted scalers / classes to this directory")
+    parser.add_argument('--window', type=int, help="Rows per window (default: the model's)")
+    parser.add_argument('--step', type=int, help="Rows between window starts (default: the model's)")
+    parser.add_argument('--blink-threshold', type=float, default=60, help="Blink threshold for the engineered features")
+    args = parser.parse_args()
+
+    data = WindowDataset(args.model, args.inputs, args.window, args.step, args.blink_threshold)
+    if not data.paths:
+        sys.exit("No input files")
+    if args.fit:
+        start = time.perf_counter()
+        seen = data.fit(None if args.split == 'all' else args.split)
+        print(f"Fitted on {seen['sessions']} sessions, {seen['windows']} windows in {time.perf_counter() - start:.1f}s")
+        if args.model == 'mind':
+            print(f"Classes: attention {data.classes[0]}, relaxation {data.classes[1]}")
+        if args.out:
+            data.save(args.out)
+            print(f"Saved to {args.out}")
+    else:
+        start = time.perf_counter()
+        for split, _ in SPLITS:
+            sessions, counts = 0, Counter()
+            for session in data.sessions(split):
+                before = sum(counts.values())
+                for chunk in data.windows(session):
+                    counts.update(chunk[-2 if args.model == 'mind' else -1].tolist())
+                sessions += sum(counts.values()) > before
+            names = BLINK_CLASSES if args.model == 'blink' else data.classes[0]
+            labels = ', '.join(f"{names[c]} {counts[c]}" for c in sorted(counts))
+            print(f"{split}: {sessions} sessions, {sum(counts.values())} windows ({labels})")
+        print(f"Windowed in {time.perf_counter() - start:.1f}s")
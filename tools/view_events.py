@@ -0,0 +1,104 @@
+"""
+Renders a controller's binary event log as its console output.
+
+    python tools/view_events.py logs/mind.events --follow
+    python tools/view_events.py logs/blink.events --ndjson > blink.ndjson
+
+The controllers write state, predictions, gestures and actuator commands to --event-log
+instead of (or as well as) the console. This prints the log and its rotated backups, oldest
+first, in the controllers' colored console format, or as one JSON object per event with
+--ndjson. --follow keeps reading as the controller writes, across rotations.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+if os.path.join(ROOT, 'common') not in sys.path:
+    sys.path.append(os.path.join(ROOT, 'common'))
+
+import numpy as np
+
+from event_log import EVENT_DTYPE, KINDS, read_header, read_events, log_files, render, event_dict
+
+# +
+def show(records, meta, args):
+    for record in records:
+        if args.kinds and record['kind'] not in args.kinds:
+            continue
+        fields = record.item()
+        if args.ndjson:
+            print(json.dumps(event_dict(fields, meta)))
+            continue
+        stamp = time.strftime('%H:%M:%S', time.localtime(fields[0])) + f'.{int(fields[0] % 1 * 1000):03d} ' \
+            if args.timestamps else ''
+        for line in render(fields, meta, color=not args.no_color):
+            print(stamp + line)
+
+
+def follow(path, args, interval=0.2):
+    """Print records as they are appended to `path`, reopening it when the log rotates."""
+    f, meta, inode, rest = None, None, None, b''
+    while True:
+        try:
+            current = os.stat(path).st_ino
+        except FileNotFoundError:
+            current = None
+        if f is None or (current is not None and current != inode):
+            if f is not None:
+                # Whatever the old file got before it was rotated
+                data = rest + f.read()
+                show(np.frombuffer(data[:len(data) // EVENT_DTYPE.itemsize * EVENT_DTYPE.itemsize], EVENT_DTYPE),
+                     meta, args)
+                f.close()
+                f = None
+            if current is None:
+                time.sleep(interval)
+                continue
+            f = open(path, 'rb')
+            try:
+                meta = read_header(f)
+            except ValueError:
+                f.close()
+                f = None
+                time.sleep(interval)  # header not written yet
+                continue
+            inode, rest = current, b''
+        data = rest + f.read()
+        n = len(data) // EVENT_DTYPE.itemsize * EVENT_DTYPE.itemsize
+        if n:
+            show(np.frombuffer(data[:n], EVENT_DTYPE), meta, args)
+            sys.stdout.flush()
+        rest = data[n:]
+        time.sleep(interval)
+# -
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show a controller event log as console output")
+    parser.add_argument('path', help="Event log written with --event-log (rotated backups are read too)")
+    parser.add_argument('--follow', '-f', action='store_true', help="Keep printing events as they are written")
+    parser.add_argument('--kind', action='append', default=[], choices=list(KINDS), help="Only these kinds of event")
+    parser.add_argument('--timestamps', action='store_true', help="Prefix every line with the event's time")
+    parser.add_argument('--no-color', action='store_true', help="Plain text without ANSI colors")
+    parser.add_argument('--ndjson', action='store_true', help="One JSON object per event instead of console lines")
+    args = parser.parse_args()
+    args.kinds = [KINDS[k] for k in args.kind]
+
+    files = log_files(args.path)
+    if not files and not args.follow:
+        sys.exit(f"No event log at {args.path}")
+    try:
+        # Complete files first; with --follow the live one is read by follow()
+        for path in files[:-1] if args.follow else files:
+            try:
+                meta, records = read_events(path)
+            except ValueError as e:
+                print(f"Skipping {e}", file=sys.stderr)
+                continue
+            show(records, meta, args)
+        if args.follow:
+            follow(args.path, args)
+    except (KeyboardInterrupt, BrokenPipeError):
+        pass